@@ -0,0 +1,43 @@
+import argparse
+import sys
+from libs.benchmarks import generator, hashing, regression, suite, validation
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs the pipeline benchmarks.')
+    parser.add_argument('benchmark', choices=['hashing', 'validation', 'suite', 'generate', 'regression'],
+                        help='suite measures every etl stage and query function, generate only writes a dataset, '
+                             'regression compares the query functions with their pandasql reference implementations')
+    parser.add_argument('--rows', type=int, default=100000, help='Number of generated records')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs per measurement')
+    parser.add_argument('--output', help='Results JSON file (suite) or generated data file (generate), .json, .jsonl, optionally .gz/.bz2/.xz')
+    parser.add_argument('--files', type=int, default=1, help='Number of generated files (generate)')
+    parser.add_argument('--users', type=int, default=1000, help='Number of distinct users')
+    parser.add_argument('--artists', type=int, default=2000, help='Number of distinct artists')
+    parser.add_argument('--tracks', type=int, default=20000, help='Number of distinct tracks')
+    parser.add_argument('--releases', type=int, default=5000, help='Number of distinct releases')
+    parser.add_argument('--null-rate', type=float, default=0.2, help='Probability of optional fields to be missing')
+    parser.add_argument('--invalid-rate', type=float, default=0.01, help='Share of invalid records')
+    parser.add_argument('--days', type=int, default=365, help='Number of days the listens are spread over')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    args = parser.parse_args()
+    options = { 'users': args.users, 'artists': args.artists, 'tracks': args.tracks, 'releases': args.releases,
+                'null_rate': args.null_rate, 'invalid_rate': args.invalid_rate, 'days': args.days, 'seed': args.seed }
+
+    if args.benchmark == 'hashing':
+        hashing.main(rows=args.rows, repeat=args.repeat)
+    elif args.benchmark == 'validation':
+        validation.main(rows=args.rows, repeat=args.repeat)
+    elif args.benchmark == 'suite':
+        suite.main(rows=args.rows, repeat=args.repeat, output=args.output, **options)
+    elif args.benchmark == 'generate':
+        if not args.output:
+            parser.error('generate requires --output')
+        generator.main(args.output, rows=args.rows, files=args.files, **options)
+    elif args.benchmark == 'regression':
+        if not regression.main(rows=args.rows, **options):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
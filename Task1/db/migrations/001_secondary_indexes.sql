@@ -0,0 +1,14 @@
+-- Covering indexes for the joins of stream and time and the groupings of the analyses
+CREATE INDEX IF NOT EXISTS stream_timestamp_user ON stream(timestamp_unix_id, user_name);
+CREATE INDEX IF NOT EXISTS stream_user_timestamp ON stream(user_name, timestamp_unix_id, track_msid);
+CREATE INDEX IF NOT EXISTS stream_track_timestamp ON stream(track_msid, timestamp_unix_id, artist_msid);
+CREATE INDEX IF NOT EXISTS stream_artist_timestamp ON stream(artist_msid, timestamp_unix_id);
+CREATE INDEX IF NOT EXISTS stream_release_timestamp ON stream(release_msid, timestamp_unix_id, artist_msid);
+CREATE INDEX IF NOT EXISTS time_year_week ON time(year, week, day_of_week, weekday, timestamp_unix_id);
+CREATE INDEX IF NOT EXISTS time_date ON time(date, timestamp_unix_id);
+
+-- Secondary indexes, that are dropped during a bulk backfill and rebuilt afterwards
+CREATE TABLE IF NOT EXISTS deferred_index(
+    name VARCHAR PRIMARY KEY,
+    sql VARCHAR NOT NULL
+);
@@ -0,0 +1,71 @@
+-- Rollups of the stream table, updated by the load together with each batch of new streams
+CREATE TABLE IF NOT EXISTS rollup_day(
+    date DATE PRIMARY KEY,
+    year INT(4) NOT NULL,
+    week INT(2) NOT NULL,
+    day_of_week INT(1) NOT NULL,
+    weekday VARCHAR(9) NOT NULL,
+    streams INT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS rollup_user_day(
+    date DATE NOT NULL,
+    user_name VARCHAR NOT NULL,
+    year INT(4) NOT NULL,
+    week INT(2) NOT NULL,
+    day_of_week INT(1) NOT NULL,
+    weekday VARCHAR(9) NOT NULL,
+    streams INT NOT NULL,
+    PRIMARY KEY(date, user_name)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS rollup_user_week(
+    year INT(4) NOT NULL,
+    week INT(2) NOT NULL,
+    user_name VARCHAR NOT NULL,
+    streams INT NOT NULL,
+    PRIMARY KEY(year, week, user_name)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS rollup_track_week(
+    year INT(4) NOT NULL,
+    week INT(2) NOT NULL,
+    track_msid VARCHAR(32) NOT NULL,
+    artist_msid VARCHAR(36) NOT NULL,
+    streams INT NOT NULL,
+    PRIMARY KEY(year, week, track_msid)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS rollup_artist_week(
+    year INT(4) NOT NULL,
+    week INT(2) NOT NULL,
+    artist_msid VARCHAR(36) NOT NULL,
+    streams INT NOT NULL,
+    PRIMARY KEY(year, week, artist_msid)
+) WITHOUT ROWID;
+
+-- Streams loaded before the rollups existed
+INSERT INTO rollup_day (date, year, week, day_of_week, weekday, streams)
+SELECT   t.date, t.year, t.week, t.day_of_week, t.weekday, COUNT(1)
+FROM     stream s INNER JOIN time t ON s.timestamp_unix_id == t.timestamp_unix_id
+GROUP BY t.date;
+
+INSERT INTO rollup_user_day (date, user_name, year, week, day_of_week, weekday, streams)
+SELECT   t.date, s.user_name, t.year, t.week, t.day_of_week, t.weekday, COUNT(1)
+FROM     stream s INNER JOIN time t ON s.timestamp_unix_id == t.timestamp_unix_id
+GROUP BY t.date, s.user_name;
+
+INSERT INTO rollup_user_week (year, week, user_name, streams)
+SELECT   t.year, t.week, s.user_name, COUNT(1)
+FROM     stream s INNER JOIN time t ON s.timestamp_unix_id == t.timestamp_unix_id
+GROUP BY t.year, t.week, s.user_name;
+
+INSERT INTO rollup_track_week (year, week, track_msid, artist_msid, streams)
+SELECT   t.year, t.week, s.track_msid, s.artist_msid, COUNT(1)
+FROM     stream s INNER JOIN time t ON s.timestamp_unix_id == t.timestamp_unix_id
+GROUP BY t.year, t.week, s.track_msid;
+
+INSERT INTO rollup_artist_week (year, week, artist_msid, streams)
+SELECT   t.year, t.week, s.artist_msid, COUNT(1)
+FROM     stream s INNER JOIN time t ON s.timestamp_unix_id == t.timestamp_unix_id
+GROUP BY t.year, t.week, s.artist_msid;
@@ -0,0 +1,6 @@
+-- HyperLogLog sketch of the users of each day, serialized by libs.etl.hyperloglog.
+-- Days loaded before the sketches existed are sketched from rollup_user_day when the pipeline starts.
+CREATE TABLE IF NOT EXISTS user_sketch(
+    date DATE PRIMARY KEY,
+    sketch BLOB NOT NULL
+);
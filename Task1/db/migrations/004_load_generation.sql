@@ -0,0 +1,7 @@
+-- Counter of the loads, that changed the database. Query results cached at an older generation are stale.
+CREATE TABLE IF NOT EXISTS load_generation(
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    generation INT NOT NULL
+);
+
+INSERT OR IGNORE INTO load_generation (id, generation) VALUES (1, 0);
@@ -0,0 +1,13 @@
+-- First known release of every track, updated by the load together with each batch of new streams.
+-- The release cache is warmed from it, instead of grouping all streams by track.
+CREATE TABLE IF NOT EXISTS rollup_track_release(
+    track_msid VARCHAR(32) PRIMARY KEY,
+    release_msid VARCHAR(36) NOT NULL
+) WITHOUT ROWID;
+
+-- Streams loaded before the table existed, the first loaded release of a track wins
+INSERT OR IGNORE INTO rollup_track_release (track_msid, release_msid)
+SELECT   track_msid, release_msid
+FROM     stream
+WHERE    release_msid != 'xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx'
+ORDER BY rowid;
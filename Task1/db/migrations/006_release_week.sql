@@ -0,0 +1,16 @@
+-- Weekly streams per release and artist, updated by the load together with each batch of new streams.
+-- The artist is part of the key, as the artist of a release chart entry comes from its streams.
+CREATE TABLE IF NOT EXISTS rollup_release_week(
+    year INT(4) NOT NULL,
+    week INT(2) NOT NULL,
+    release_msid VARCHAR(36) NOT NULL,
+    artist_msid VARCHAR(36) NOT NULL,
+    streams INT NOT NULL,
+    PRIMARY KEY(year, week, release_msid, artist_msid)
+) WITHOUT ROWID;
+
+-- Streams loaded before the rollup existed
+INSERT INTO rollup_release_week (year, week, release_msid, artist_msid, streams)
+SELECT   t.year, t.week, s.release_msid, s.artist_msid, COUNT(1)
+FROM     stream s INNER JOIN time t ON s.timestamp_unix_id == t.timestamp_unix_id
+GROUP BY t.year, t.week, s.release_msid, s.artist_msid;
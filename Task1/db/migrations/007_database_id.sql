@@ -0,0 +1,5 @@
+-- Random id of the database, set when it is created. A recreated database can reach the same load generation,
+-- so data derived from the database and kept outside of it, e.g. the user features, is checked against the id.
+ALTER TABLE load_generation ADD COLUMN database_id VARCHAR(32);
+
+UPDATE load_generation SET database_id = lower(hex(randomblob(16))) WHERE database_id IS NULL;
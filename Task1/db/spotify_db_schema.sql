@@ -45,3 +45,14 @@ CREATE TABLE IF NOT EXISTS stream(
     FOREIGN KEY(artist_msid) REFERENCES artist(artist_msid),
     FOREIGN KEY(track_msid) REFERENCES song(track_msid)
 );
+
+CREATE TABLE IF NOT EXISTS ingest_ledger(
+    content_hash VARCHAR(64) PRIMARY KEY,
+    file_name VARCHAR NOT NULL,
+    size INT NOT NULL,
+    rows_in INT NOT NULL,
+    rows_loaded INT NOT NULL,
+    invalid_rows INT NOT NULL,
+    status VARCHAR(16) NOT NULL,
+    ingested_at VARCHAR(26) NOT NULL
+);
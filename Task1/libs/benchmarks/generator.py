@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import random
+import uuid
+from typing import Iterator
+from libs.etl import helper
+
+# 2019-01-01 00:00:00 UTC
+DEFAULT_START = 1546300800
+
+
+def make_msid(seed:int, kind:str, number:int) -> str:
+    """
+    Derives a stable msid, so the dimensions do not have to be kept in memory.
+    Parameters:
+        seed (int): Random seed
+        kind (str): Dimension, e.g. 'artist'
+        number (int): Number of the dimension entry
+    Returns:
+        result (str): UUID string
+    """
+    return str(uuid.UUID(bytes=hashlib.md5(f'{seed}-{kind}-{number}'.encode('utf-8')).digest()))
+
+
+def generate_records(listens:int, users:int = 1000, artists:int = 2000, tracks:int = 20000, releases:int = 5000, 
+                     null_rate:float = 0.2, invalid_rate:float = 0.01, start:int = DEFAULT_START, days:int = 365, 
+                     seed:int = 0) -> Iterator[dict]:
+    """
+    Generates ListenBrainz like listen records. The same parameters always generate the same records.
+    Parameters:
+        listens (int): Number of records
+        users (int): Number of distinct users
+        artists (int): Number of distinct artists
+        tracks (int): Number of distinct tracks, each track belongs to one artist and one release
+        releases (int): Number of distinct releases
+        null_rate (float): Probability of each optional field to be missing and of the release to be unknown
+        invalid_rate (float): Share of records with one value, that fails the schema validation
+        start (int): Unix timestamp of the first possible listen
+        days (int): Number of days the listens are spread over
+        seed (int): Random seed
+    Returns:
+        result (Iterator[dict]): Listen records
+    """
+    rnd = random.Random(seed)
+    for _ in range(listens):
+        track = int(rnd.paretovariate(1.2) * tracks / 10) % tracks
+        artist = track % artists
+        release = (track // 3 * artists + artist) % releases
+        additional_info = { 'artist_msid': make_msid(seed, 'artist', artist),
+                            'recording_msid': make_msid(seed, 'track', track) }
+        if rnd.random() >= null_rate:
+            additional_info['release_msid'] = make_msid(seed, 'release', release)
+        if rnd.random() >= null_rate:
+            additional_info['tracknumber'] = str(track % 20 + 1)
+        if rnd.random() >= null_rate:
+            additional_info['dedup_tag'] = rnd.randrange(3)
+        if rnd.random() >= null_rate:
+            additional_info['duration_ms'] = 120000 + track * 7919 % 240000
+        elif rnd.random() >= null_rate:
+            additional_info['duration'] = str(120 + track * 7919 % 240)
+        if rnd.random() >= null_rate:
+            additional_info['date'] = str(1970 + release % 50)
+        if rnd.random() >= null_rate:
+            additional_info['discnumber'] = '1'
+            additional_info['totaldiscs'] = '1'
+            additional_info['totaltracks'] = str(track % 20 + 10)
+        if rnd.random() < null_rate:
+            additional_info['spotify_id'] = f'https://open.spotify.com/track/{track}'
+            additional_info['tags'] = ['generated']
+        record = { 'listened_at': start + rnd.randrange(days * 86400),
+                   'recording_msid': make_msid(seed, 'listen', rnd.getrandbits(32)),
+                   'user_name': f'user_{rnd.randrange(users)}',
+                   'track_metadata': { 'artist_name': f'Artist {artist}',
+                                       'track_name': f'Track {track}' + (' (Live)' if track % 10 == 0 else ''),
+                                       'release_name': f'Release {release}' if 'release_msid' in additional_info or rnd.random() >= null_rate else None,
+                                       'additional_info': additional_info } }
+        if rnd.random() < invalid_rate:
+            field = rnd.randrange(3)
+            if field == 0:
+                record['listened_at'] = rnd.randrange(10**8)
+            elif field == 1:
+                additional_info['artist_msid'] = 'unknown'
+            else:
+                additional_info['tracknumber'] = 'A1'
+        yield record
+
+
+def write_file(path:str, records:Iterator[dict]) -> int:
+    """
+    Writes records as JSON array (.json) or as JSON lines (any other suffix). 
+    The file is compressed, if the path ends with .gz, .bz2 or .xz.
+    Parameters:
+        path (str): Target file
+        records (Iterator[dict]): Records
+    Returns:
+        result (int): Number of written records
+    """
+    name, compression = os.path.splitext(path)
+    opener = helper.DECOMPRESSORS.get(compression.lower())
+    if opener is None:
+        name, opener = path, open
+    as_array = name.lower().endswith('.json')
+    count = 0
+    with opener(path, 'wt') as file:
+        if as_array:
+            file.write('[')
+        for record in records:
+            if as_array and count:
+                file.write(',\n')
+            file.write(json.dumps(record))
+            if not as_array:
+                file.write('\n')
+            count += 1
+        if as_array:
+            file.write(']')
+    return count
+
+
+def main(output:str, rows:int = 100000, files:int = 1, **options):
+    """
+    Writes generated listens into one or more files, e.g. into data/ingest.
+    Parameters:
+        output (str): Target file, with several files a number is added to the file name
+        rows (int): Number of records in total
+        files (int): Number of files
+        options: See generate_records
+    """
+    records = generate_records(rows, **options)
+    # The number goes before the suffixes of the file name, e.g. listens_0000.jsonl.gz, dots in the folders are kept
+    directory, file_name = os.path.split(output)
+    name, dot, suffix = file_name.partition('.')
+    suffix = suffix if dot else 'jsonl'
+    for number in range(files):
+        path = output if files == 1 else os.path.join(directory, f'{name}_{number:04d}.{suffix}')
+        count = write_file(path, (next(records) for _ in range(rows // files + (number < rows % files))))
+        print(f'Wrote {count} records to {path}.')
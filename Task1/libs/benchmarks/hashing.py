@@ -0,0 +1,49 @@
+import hashlib
+import time
+import pandas as pd
+from libs.benchmarks.validation import make_frame
+from libs.etl import hashing
+
+KEY_COLUMNS = { 'track_msid': ['track_metadata.track_name', 'track_metadata.additional_info.artist_msid'],
+                'stream_id': ['track_metadata.additional_info.artist_msid', 'listened_at', 'user_name', 'track_metadata.additional_info.dedup_tag'] }
+
+
+def make_hash_column_per_row(df:pd.DataFrame, columns:list) -> pd.Series:
+    """
+    Row by row hashing, as it was used before the batched hashing.
+    """
+    return pd.DataFrame(df[columns].applymap(str).values.sum(axis=1))[0].str.encode('utf-8').apply(lambda x: (hashlib.md5(x).hexdigest()))
+
+
+def benchmark(df:pd.DataFrame, repeat:int = 3) -> pd.DataFrame:
+    """
+    Compares the batched hashing with the row by row hashing. 
+    Parameters:
+        df (pd.DataFrame): Dataframe with all stream schema columns
+        repeat (int): Number of runs, the fastest one is reported
+    Returns:
+        result (pd.DataFrame): Runtime and throughput per hash column and implementation
+    """
+    engines = [ ('per_row', make_hash_column_per_row),
+                ('batched', hashing.hash_columns) ]
+    results = []
+    for key, columns in KEY_COLUMNS.items():
+        hashes = {}
+        for engine, run in engines:
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                hashes[engine] = run(df, columns)
+                timings.append(time.perf_counter() - start)
+            seconds = min(timings)
+            results.append({ 'key': key, 'engine': engine, 'rows': len(df), 'seconds': round(seconds, 4), 
+                             'rows_per_s': round(len(df) / seconds) })
+        for engine, _ in engines[1:]:
+            if hashes[engine].tolist() != hashes['per_row'].tolist():
+                raise AssertionError(f"{engine} hashes of {key} differ from the row by row hashes")
+    return pd.DataFrame(results).set_index(['key', 'engine'])
+
+
+def main(rows:int = 100000, repeat:int = 3):
+    df = make_frame(rows)
+    print(benchmark(df, repeat=repeat))
@@ -0,0 +1,502 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from pandasql import sqldf
+from libs.benchmarks import generator
+from libs.benchmarks.suite import DB_SCHEMA_PATH, load_module
+from libs.etl import user_features
+from libs.etl.quarantine import QuarantineStore
+from libs.models.spotify_pipelinerunner import SpotifyPipelineRunner
+
+#################################################################################################
+#                                                                                               #
+#                      REFERENCE QUERIES (former versions of the analyses)                      #
+#                                                                                               #
+#################################################################################################
+
+
+def reference_query_total_entries_per_table(conn:sqlite3.Connection) -> pd.DataFrame:
+    return pd.read_sql_query("""
+            SELECT  (SELECT COUNT( DISTINCT user_name) FROM stream) AS user_count,
+                    (SELECT COUNT(1) FROM stream) AS stream_count,
+                    (SELECT COUNT(1) FROM artist) AS artist_count,
+                    (SELECT COUNT(1) FROM release) AS release_count,
+                    (SELECT COUNT(1) FROM track) AS track_count""",conn)
+
+
+def reference_query_active_users_over_weeks_and_weekdays_by_year(conn:sqlite3.Connection, year: str) -> pd.DataFrame:
+    return pd.read_sql_query(f"""
+            SELECT   COUNT( DISTINCT lf.user_name) AS active_user, week, weekday, day_of_week, year
+            FROM     stream lf
+                        INNER JOIN time t on lf.timestamp_unix_id == t.timestamp_unix_id
+            WHERE year = '{year}'
+            GROUP BY year, week, day_of_week""", conn)
+
+
+def reference_query_streams_over_weekdays(conn:sqlite3.Connection) -> pd.DataFrame:
+    stream_count_weekday_by_week = pd.read_sql_query("""
+            SELECT year, week, weekday, COUNT(1) AS streams
+            FROM stream lf
+                    INNER JOIN time t ON lf.timestamp_unix_id == t.timestamp_unix_id
+            GROUP BY year, week, weekday""", conn)
+
+    return sqldf("""
+            SELECT weekday, AVG(streams ) OVER(PARTITION BY weekday ) AS avg_streams, year
+            FROM stream_count_weekday_by_week
+            GROUP BY weekday""", locals())
+
+
+def reference_weekly_trend_track(conn:sqlite3.Connection, top_n:str = "5") -> pd.DataFrame:
+    top_track_weekly_rank_table = pd.read_sql_query("""
+	        SELECT   year, week, track_name, artist_name, lf.track_msid,
+                     DENSE_RANK() OVER(PARTITION by year, week ORDER BY COUNT(lf.track_msid) DESC) as weekly_track_rank,
+                     COUNT(lf.track_msid) AS weekly_track
+            FROM    stream lf    INNER JOIN track tr ON lf.track_msid == tr.track_msid
+                                        INNER JOIN time t   ON lf.timestamp_unix_id == t.timestamp_unix_id
+                                        INNER JOIN artist a   ON lf.artist_msid == a.artist_msid
+            GROUP BY  lf.track_msid, year, week
+            ORDER BY  year, week, weekly_track DESC""", conn)
+
+    top_track_prev_week_rank_table = sqldf("""
+            SELECT    year, week, weekly_track_rank, weekly_track, track_name, artist_name,
+                            LAG(weekly_track_rank) OVER (partition by track_msid ) AS rank_previous_week
+            FROM      top_track_weekly_rank_table
+            ORDER BY  year, week, weekly_track_rank""", locals())
+
+    return sqldf(f"""
+            SELECT    year, week, weekly_track_rank, weekly_track, (track_name || ' ('|| artist_name|| ')') AS track_name ,
+                      (rank_previous_week - weekly_track_rank) as weekly_change_of_ranking
+            FROM      top_track_prev_week_rank_table
+            WHERE     weekly_track_rank <= {top_n}
+            ORDER BY  year DESC, week DESC, weekly_track_rank""", locals())
+
+
+def reference_weekly_trend_artist(conn:sqlite3.Connection, top_n:str = "5") -> pd.DataFrame:
+    top_artist_weekly_rank_table = pd.read_sql_query("""
+	        SELECT   year, week, artist_name, lf.artist_msid,
+                     DENSE_RANK() OVER(PARTITION by year, week ORDER BY COUNT(lf.artist_msid) DESC) as weekly_artist_rank,
+                     COUNT(lf.artist_msid) AS weekly_artist
+            FROM     stream lf INNER JOIN artist a ON lf.artist_msid == a.artist_msid
+                                INNER JOIN time t   ON lf.timestamp_unix_id == t.timestamp_unix_id
+
+            GROUP BY lf.artist_msid, year, week
+            ORDER BY year, week, weekly_artist DESC""", conn)
+
+    top_artist_prev_week_rank_table = sqldf("""
+            SELECT   year, week, weekly_artist_rank, weekly_artist, artist_name,
+                     LAG(weekly_artist_rank) OVER (partition by artist_msid ) AS rank_previous_week
+            FROM     top_artist_weekly_rank_table
+            ORDER BY year, week, weekly_artist_rank""", locals())
+
+    return sqldf(f"""
+            SELECT   year, week, weekly_artist_rank, weekly_artist, artist_name,
+                     (rank_previous_week- weekly_artist_rank) as weekly_change_of_ranking
+            FROM     top_artist_prev_week_rank_table
+            where    weekly_artist_rank <= {top_n}
+            ORDER BY year DESC, week DESC, weekly_artist_rank""", locals())
+
+
+def reference_weekly_trend_release(conn:sqlite3.Connection, top_n:str = "5") -> pd.DataFrame:
+    top_release_rank_table = pd.read_sql_query("""
+	        SELECT   year, week, release_name, artist_name, lf.release_msid,
+                     DENSE_RANK() OVER(PARTITION by year, week ORDER BY COUNT(lf.release_msid) DESC) as weekly_release_rank,
+                     COUNT(lf.release_msid) AS weekly_release
+            FROM     stream lf    INNER JOIN release r ON lf.release_msid == r.release_msid
+                                            INNER JOIN time t   ON lf.timestamp_unix_id == t.timestamp_unix_id
+                                            INNER JOIN artist a   ON lf.artist_msid == a.artist_msid
+            WHERE    lf.release_msid != "xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx"
+            GROUP BY lf.release_msid, year, week
+            ORDER BY year, week, weekly_release DESC""", conn)
+
+    top_release_prev_rank_table = sqldf("""
+            SELECT    year, week, weekly_release_rank, weekly_release, release_name, artist_name,
+                      LAG(weekly_release_rank) OVER (partition by release_msid ) AS rank_previous_week
+            FROM      top_release_rank_table
+            ORDER BY  year, week, weekly_release_rank""", locals())
+
+    return sqldf(f"""
+            SELECT    year, week, weekly_release_rank, weekly_release, release_name, artist_name,
+                      (rank_previous_week - weekly_release_rank) as weekly_change_of_ranking
+            FROM      top_release_prev_rank_table
+            where     weekly_release_rank <= {top_n}
+            ORDER BY  year DESC, week DESC, weekly_release_rank""", locals())
+
+
+def reference_in_week(reference):
+    """
+    Restricts the weekly results of a reference implementation to the year and week, that the query function gets as filter.
+    Parameters:
+        reference (Callable): Reference implementation with year and week columns
+    Returns:
+        result (Callable): Reference implementation with year and week arguments
+    """
+    def reference_of_week(conn:sqlite3.Connection, year:str, week:str = None, **arguments) -> pd.DataFrame:
+        result = reference(conn, **arguments)
+        selected = result['year'] == int(year)
+        if week is not None:
+            selected &= result['week'] == int(week)
+        return result[selected].reset_index(drop=True)
+    return reference_of_week
+
+
+def reference_query_distribution_of_streams_per_weekday_by_user(conn:sqlite3.Connection) -> pd.DataFrame:
+    grouped_weekday_count = pd.read_sql_query("""
+            SELECT   COUNT(1) AS streams, weekday, user_name
+            FROM     stream lf INNER JOIN time t
+                           ON lf.timestamp_unix_id == t.timestamp_unix_id
+            GROUP BY weekday, user_name""",conn)
+
+    result = sqldf("""
+            SELECT  user_name as user_id, SUM(streams) AS summe, (weekday || '_listener') as weekday,
+                    1.0*SUM(streams) / SUM(sum(streams)) OVER(PARTITION BY user_name) as percentage
+            FROM    grouped_weekday_count
+            GROUP BY weekday, user_name;""", locals())
+
+    return result.pivot(index="user_id", columns='weekday',values="percentage").fillna(0)
+
+
+def reference_query_distribution_of_stream_time_category_by_user(conn:sqlite3.Connection) -> pd.DataFrame:
+    time_categorization = pd.read_sql_query("""
+            SELECT user_name, time,
+                CASE
+                  WHEN time BETWEEN '01:00:00' AND '04:59:59' THEN 'night_listener'
+                  WHEN time BETWEEN '05:00:00' AND '08:59:59' THEN 'early_morning_listener'
+                  WHEN time BETWEEN '09:00:00' AND '12:59:59' THEN 'late_morning_listener'
+                  WHEN time between '13:00:00' and  '16:59:59' THEN 'afternoon_listener'
+                  WHEN time between '17:00:00' and  '20:59:59' THEN 'evening_listener'
+                  WHEN time >= '21:00:00' OR time < '01:00:00'THEN 'early_night_listener'
+                END AS time_category
+            FROM stream lf
+                    INNER JOIN time t ON lf.timestamp_unix_id == t.timestamp_unix_id;""",conn)
+
+    grouped_time_categorization = sqldf("""
+            SELECT   user_name, time_category, COUNT(time_category) AS time_category_total
+            FROM     time_categorization
+            GROUP BY time_category,user_name;""", locals())
+
+    result = sqldf("""
+            SELECT   user_name as user_id, time_category,time_category_total,
+                     1.0*SUM(time_category_total) / SUM(sum(time_category_total))
+                            OVER (PARTITION BY user_name) AS percentage
+            FROM     grouped_time_categorization
+            GROUP BY time_category, user_name
+            ORDER BY user_name""", locals())
+
+    return result.pivot(index="user_id", columns='time_category',values="percentage").fillna(0)
+
+
+def reference_query_variation_coefficient_of_dimension_by_user_on_weekly_basis(conn:sqlite3.Connection, dimension:str) -> pd.DataFrame:
+    total_unique_entries_per_user_by_week = pd.read_sql_query(f"""
+            SELECT   year, user_name, week,  COUNT( DISTINCT {dimension}_msid) AS unique_entries
+            FROM     stream lf
+                            INNER JOIN time t ON lf.timestamp_unix_id == t.timestamp_unix_id
+            GROUP BY user_name, year, week;""",conn)
+
+    avg_unique_entries_per_user_table = sqldf("""
+            SELECT  year, user_name, unique_entries ,
+                    COUNT(1) OVER(PARTITION BY user_name, year ) -1 as n_minus_1,
+                    AVG(unique_entries) OVER(PARTITION BY user_name, year ) AS avg_unique_entries_per_user
+            FROM    total_unique_entries_per_user_by_week;""", locals())
+
+    avg_unique_entries_per_user_table['square_root_weekly_minus_avg'] \
+                    = np.power(( (avg_unique_entries_per_user_table['unique_entries'] \
+                              - avg_unique_entries_per_user_table['avg_unique_entries_per_user']) ),2)
+    square_root_weekly_minus_avg_table = avg_unique_entries_per_user_table
+
+    sum_square_root_weekly_minus_avg_table = sqldf("""
+            SELECT   year, user_name, avg_unique_entries_per_user, square_root_weekly_minus_avg, n_minus_1,
+                     SUM(square_root_weekly_minus_avg) as sum_square_root_weekly_minus_avg
+            FROM     square_root_weekly_minus_avg_table
+            GROUP BY user_name, year
+            ORDER BY user_name""", locals())
+
+    variance_to_variation_coefficient = sqldf("""
+            SELECT   user_name as user_id, avg_unique_entries_per_user, sum_square_root_weekly_minus_avg,
+                     sum_square_root_weekly_minus_avg / n_minus_1 as variance
+            FROM     sum_square_root_weekly_minus_avg_table
+            ORDER BY user_name""", locals())
+
+    variance_to_variation_coefficient[f"variation_coefficient_over_listened_{dimension}s_on_weekly_basis"] \
+                    = np.sqrt(( variance_to_variation_coefficient['variance'])) \
+                              / variance_to_variation_coefficient['avg_unique_entries_per_user']
+    variation_coefficient = variance_to_variation_coefficient[["user_id",f"variation_coefficient_over_listened_{dimension}s_on_weekly_basis"]]
+    variation_coefficient = variation_coefficient.set_index("user_id")
+    return variation_coefficient.fillna(0)
+
+
+def reference_query_clustering_features(conn:sqlite3.Connection) -> pd.DataFrame:
+    clustering_df = reference_query_distribution_of_stream_time_category_by_user(conn)
+    clustering_df = clustering_df.join(reference_query_distribution_of_streams_per_weekday_by_user(conn))
+    for dimension in user_features.DIMENSIONS:
+        clustering_df = clustering_df.join(reference_query_variation_coefficient_of_dimension_by_user_on_weekly_basis(conn, dimension))
+    # The feature matrix has a column for every time category and weekday, even if no user streamed in it
+    return clustering_df.reindex(columns=user_features.FEATURE_COLUMNS, fill_value=0.0)
+
+
+def reference_query_most_active_user(conn:sqlite3.Connection, top_n: str = 10) -> pd.DataFrame:
+    active_user_ranking = pd.read_sql_query("""
+            SELECT      user_name, DENSE_RANK() OVER(ORDER BY COUNT(1) DESC) as rank
+            FROM        stream
+            GROUP BY    user_name;""", conn)
+
+    return sqldf(f"""
+            SELECT rank, user_name
+            FROM active_user_ranking
+            WHERE rank <= {top_n};""", locals())
+
+
+def reference_query_number_of_active_users_by_date(conn:sqlite3.Connection, date: str) -> pd.DataFrame:
+    return pd.read_sql_query(f"""
+            SELECT  COUNT( DISTINCT user_name) as active_users
+            FROM    stream lf
+                        INNER JOIN time t ON lf.timestamp_unix_id == t.timestamp_unix_id
+            WHERE   date == '{date}';""", conn)
+
+
+def reference_query_number_of_active_users_between_dates(conn:sqlite3.Connection, start_date: str, end_date: str) -> pd.DataFrame:
+    return pd.read_sql_query(f"""
+            SELECT  COUNT( DISTINCT user_name) as active_users
+            FROM    stream lf
+                        INNER JOIN time t ON lf.timestamp_unix_id == t.timestamp_unix_id
+            WHERE   date BETWEEN '{start_date}' AND '{end_date}';""", conn)
+
+
+def reference_query_weekly_trend_of_streams_and_user(conn:sqlite3.Connection) -> pd.DataFrame:
+    weekly_streams_and_user_table = pd.read_sql_query("""
+	        SELECT    year, week,
+                      COUNT(DISTINCT user_name) AS weekly_active_user,
+                      LAG(COUNT(DISTINCT user_name)) OVER ( ORDER BY year, week) AS active_user_previous_week,
+                      COUNT(1) AS weekly_streams,
+                      LAG(COUNT(1)) OVER ( ORDER BY year, week) AS streams_previous_week
+            FROM      stream lf INNER JOIN time t ON lf.timestamp_unix_id == t.timestamp_unix_id
+            GROUP BY  year, week""", conn)
+
+    return sqldf("""
+            SELECT    year, week, weekly_active_user, weekly_streams, (weekly_streams /  weekly_active_user)  AS weekly_avg_streams_user,
+                      printf("%.2f" , 100.0*(weekly_active_user - active_user_previous_week) / active_user_previous_week ) AS active_user_previous_week_trend,
+                      printf("%.2f" , 100.0*(weekly_streams - streams_previous_week)  / streams_previous_week ) AS streams_previous_week_trend,
+                      printf("%.2f" , 100.0*((weekly_streams /  weekly_active_user) - LAG((weekly_streams /  weekly_active_user) ) OVER ( ORDER BY year, week))
+                                 / LAG((weekly_streams /  weekly_active_user) ) OVER ( ORDER BY year, week) ) AS avg_streams_user_previous_week_trend
+            FROM      weekly_streams_and_user_table
+            GROUP BY  year, week
+            ORDER BY  year DESC, week DESC""", locals())
+
+
+#################################################################################################
+#                                                                                               #
+#                                           COMPARISON                                          #
+#                                                                                               #
+#################################################################################################
+
+# Tables, that have to be the same, whether a file is loaded in one piece or in chunks
+LOAD_TABLES = ['artist', 'track', 'release', 'time', 'stream']
+# Chunks per file of the chunked load
+LOAD_CHUNKS = 4
+# Tolerance of exact results, floats may differ in the last digits, and of results counted with user sketches
+EXACT_RTOL = 1e-9
+SKETCH_RTOL = 0.05
+# Query functions of the analyses, their arguments, the reference implementation they have to match and the tolerance,
+# {year}, {week}, {date} and {end_date} refer to the generated data
+REGRESSIONS = [
+    ('Task2/Task2-a.py', 'query_total_entries_per_table', { 'exact': True }, reference_query_total_entries_per_table, EXACT_RTOL),
+    ('Task2/Task2-a.py', 'query_total_entries_per_table', {}, reference_query_total_entries_per_table, SKETCH_RTOL),
+    ('Task2/Task2-a.py', 'query_active_users_over_weeks_and_weekdays_by_year', { 'year': '{year}', 'exact': True },
+        reference_query_active_users_over_weeks_and_weekdays_by_year, EXACT_RTOL),
+    ('Task2/Task2-a.py', 'query_active_users_over_weeks_and_weekdays_by_year', { 'year': '{year}' },
+        reference_query_active_users_over_weeks_and_weekdays_by_year, SKETCH_RTOL),
+    ('Task2/Task2-a.py', 'query_streams_over_weekdays', {}, reference_query_streams_over_weekdays, EXACT_RTOL),
+    ('Task2/Task2-a.py', 'weekly_trend_track', {}, reference_weekly_trend_track, EXACT_RTOL),
+    ('Task2/Task2-a.py', 'weekly_trend_track', { 'top_n': '10' }, reference_weekly_trend_track, EXACT_RTOL),
+    ('Task2/Task2-a.py', 'weekly_trend_artist', {}, reference_weekly_trend_artist, EXACT_RTOL),
+    ('Task2/Task2-a.py', 'weekly_trend_release', {}, reference_weekly_trend_release, EXACT_RTOL),
+    ('Task2/Task2-a.py', 'weekly_trend_track', { 'year': '{year}', 'week': '{week}' }, reference_in_week(reference_weekly_trend_track), EXACT_RTOL),
+    ('Task2/Task2-a.py', 'weekly_trend_track', { 'top_n': '10', 'year': '{year}' }, reference_in_week(reference_weekly_trend_track), EXACT_RTOL),
+    ('Task2/Task2-a.py', 'weekly_trend_artist', { 'year': '{year}', 'week': '{week}' }, reference_in_week(reference_weekly_trend_artist), EXACT_RTOL),
+    ('Task2/Task2-a.py', 'weekly_trend_release', { 'year': '{year}', 'week': '{week}' }, reference_in_week(reference_weekly_trend_release), EXACT_RTOL),
+    ('Task2/Task2-b.py', 'query_distribution_of_streams_per_weekday_by_user', {}, reference_query_distribution_of_streams_per_weekday_by_user, EXACT_RTOL),
+    ('Task2/Task2-b.py', 'query_distribution_of_stream_time_category_by_user', {}, reference_query_distribution_of_stream_time_category_by_user, EXACT_RTOL),
+    ('Task2/Task2-b.py', 'query_variation_coefficient_of_dimension_by_user_on_weekly_basis', { 'dimension': 'artist' },
+        reference_query_variation_coefficient_of_dimension_by_user_on_weekly_basis, EXACT_RTOL),
+    ('Task2/Task2-b.py', 'query_variation_coefficient_of_dimension_by_user_on_weekly_basis', { 'dimension': 'track' },
+        reference_query_variation_coefficient_of_dimension_by_user_on_weekly_basis, EXACT_RTOL),
+    ('Task2/Task2-b.py', 'query_clustering_features', {}, reference_query_clustering_features, EXACT_RTOL),
+    ('Task2/Task2-c.py', 'query_most_active_user', {}, reference_query_most_active_user, EXACT_RTOL),
+    ('Task2/Task2-c.py', 'query_number_of_active_users_by_date', { 'date': '{date}', 'exact': True }, 
+        reference_query_number_of_active_users_by_date, EXACT_RTOL),
+    ('Task2/Task2-c.py', 'query_number_of_active_users_by_date', { 'date': '{date}' }, reference_query_number_of_active_users_by_date, SKETCH_RTOL),
+    ('Task2/Task2-c.py', 'query_number_of_active_users_between_dates', { 'start_date': '{date}', 'end_date': '{end_date}', 'exact': True }, 
+        reference_query_number_of_active_users_between_dates, EXACT_RTOL),
+    ('Task2/Task2-c.py', 'query_number_of_active_users_between_dates', { 'start_date': '{date}', 'end_date': '{end_date}' }, 
+        reference_query_number_of_active_users_between_dates, SKETCH_RTOL),
+    ('Task3/Task3.py', 'query_weekly_trend_of_streams_and_user', { 'exact': True }, reference_query_weekly_trend_of_streams_and_user, EXACT_RTOL),
+]
+
+
+def compare(result:pd.DataFrame, reference:pd.DataFrame, rtol:float = EXACT_RTOL) -> str:
+    """
+    Compares a query result with the reference result. Rows, that tie in the sort order of a query,
+    may come in any order, so if the results differ, they are compared again sorted by all columns.
+    Parameters:
+        result (pd.DataFrame): Result of the query function
+        reference (pd.DataFrame): Result of the reference implementation
+        rtol (float): Relative tolerance of numbers
+    Returns:
+        result (str): Description of the difference, None if the results match
+    """
+    if list(result.columns) != list(reference.columns):
+        return f'columns {list(result.columns)} != {list(reference.columns)}'
+    if len(result) != len(reference):
+        return f'{len(result)} rows != {len(reference)} rows'
+    result = result.reset_index()
+    reference = reference.reset_index()
+    columns = list(result.columns)
+    try:
+        pd.testing.assert_frame_equal(result, reference, check_exact=False, rtol=rtol)
+    except AssertionError:
+        try:
+            pd.testing.assert_frame_equal(result.sort_values(columns, ignore_index=True), reference.sort_values(columns, ignore_index=True),
+                                          check_exact=False, rtol=rtol)
+        except AssertionError as e:
+            return str(e)
+    return None
+
+
+def compare_loads(db_path:str, chunked_db_path:str) -> list:
+    """
+    Compares the tables of a file loaded in one piece with the tables of the same file loaded in chunks.
+    Parameters:
+        db_path (str): Database of the file loaded in one piece
+        chunked_db_path (str): Database of the file loaded in chunks
+    Returns:
+        result (list): Name, rows and difference per table
+    """
+    results = []
+    conn = sqlite3.connect(db_path)
+    chunked_conn = sqlite3.connect(chunked_db_path)
+    try:
+        for table in LOAD_TABLES:
+            sql = f"SELECT * FROM {table} ORDER BY 1"
+            result = pd.read_sql_query(sql, chunked_conn)
+            difference = compare(result, pd.read_sql_query(sql, conn))
+            results.append({ 'name': f"chunked load:{table}", 'rows': len(result), 'identical': difference is None, 'difference': difference })
+    finally:
+        conn.close()
+        chunked_conn.close()
+    return results
+
+
+def load_file(src_path:str, work_path:str, db_name:str, chunk_size:int = None) -> str:
+    """
+    Loads a file into a new database in the bulk load mode.
+    Parameters:
+        src_path (str): File to load
+        work_path (str): Folder of the database and the moved files
+        db_name (str): File name of the database
+        chunk_size (int): Records per batch, None loads the file in one piece
+    Returns:
+        result (str): Path of the database
+    """
+    db_path = os.path.join(work_path, db_name)
+    runner = SpotifyPipelineRunner(db_path=db_path, invalide_data_path=work_path, loaded_data_path=work_path,
+                                   db_schema_path=DB_SCHEMA_PATH, bulk_load=True, chunk_size=chunk_size)
+    runner.create_database()
+    # The pipeline moves the file, the copy is loaded instead
+    copy_path = os.path.join(work_path, f"{db_name}.{os.path.basename(src_path)}")
+    shutil.copy(src_path, copy_path)
+    runner.run_pipeline(copy_path)
+    runner.close()
+    return db_path
+
+
+def check_quarantine_replay(src_path:str, work_path:str) -> list:
+    """
+    Loads a file with a quarantine store and replays its rejected rows, which fail the validation again. They have to be 
+    quarantined again with their source file, row numbers and failures.
+    Parameters:
+        src_path (str): File to load
+        work_path (str): Folder of the database, the quarantine store and the moved files
+    Returns:
+        result (list): Name, rows and difference of the replayed rows
+    """
+    quarantine = QuarantineStore(os.path.join(work_path, 'quarantine'))
+    runner = SpotifyPipelineRunner(db_path=os.path.join(work_path, 'spotify_quarantine.db'), invalide_data_path=work_path, 
+                                   loaded_data_path=work_path, db_schema_path=DB_SCHEMA_PATH, bulk_load=True, quarantine=quarantine)
+    runner.create_database()
+    copy_path = os.path.join(work_path, f"quarantine.{os.path.basename(src_path)}")
+    shutil.copy(src_path, copy_path)
+    try:
+        runner.run_pipeline(copy_path)
+        columns = ['source_file', 'row_number', 'failures']
+        reference = quarantine.query(source_file=copy_path)[columns]
+        runner.replay_quarantine(source_file=copy_path)
+        result = quarantine.query(source_file=copy_path)[columns]
+    finally:
+        runner.close()
+        quarantine.close()
+    difference = compare(result, reference) if len(reference) else 'no rows have been quarantined'
+    return [{ 'name': 'quarantine replay:source_file', 'rows': len(result), 'identical': difference is None, 'difference': difference }]
+
+
+def run(db_path:str, parameters:dict) -> list:
+    """
+    Runs every query function and its reference implementation against a database and compares the results.
+    Parameters:
+        db_path (str): Database
+        parameters (dict): Values for the {year}, {week}, {date} and {end_date} arguments
+    Returns:
+        result (list): Name, rows and difference per query function
+    """
+    results = []
+    modules = {}
+    conn = sqlite3.connect(db_path)
+    try:
+        for path, function_name, arguments, reference, rtol in REGRESSIONS:
+            arguments = { key: value.format(**parameters) if isinstance(value, str) else value for key, value in arguments.items() }
+            reference_arguments = { key: value for key, value in arguments.items() if key != 'exact' }
+            labels = [f'{key}={value}' for key, value in arguments.items()]
+            name = f"{os.path.basename(path)}:{function_name}" + (f"({', '.join(labels)})" if labels else '')
+            if path not in modules:
+                modules[path] = load_module(path)
+            result = getattr(modules[path], function_name)(conn, **arguments)
+            difference = compare(result, reference(conn, **reference_arguments), rtol=rtol)
+            results.append({ 'name': name, 'rows': len(result), 'identical': difference is None, 'difference': difference })
+    finally:
+        conn.close()
+    return results
+
+
+def main(rows:int = 100000, **options) -> bool:
+    """
+    Loads a generated dataset and compares the query functions with their reference implementations,
+    which compute the results from the stream table instead of the rollups. The dataset is also loaded in chunks,
+    which has to give the same tables, and its rejected rows are replayed, which has to keep their source file.
+    Parameters:
+        rows (int): Number of generated listens
+        options: Generator options, see generator.generate_records
+    Returns:
+        result (bool): True if every query function matches its reference
+    """
+    work_path = tempfile.mkdtemp(prefix='spotify_regression_')
+    try:
+        src_path = os.path.join(work_path, 'listens.jsonl')
+        generator.write_file(src_path, generator.generate_records(rows, **options))
+        db_path = load_file(src_path, work_path, 'spotify.db')
+        chunked_db_path = load_file(src_path, work_path, 'spotify_chunked.db', chunk_size=max(1, rows // LOAD_CHUNKS))
+        first_day = datetime.utcfromtimestamp(options.get('start', generator.DEFAULT_START))
+        end_day = first_day + timedelta(days=30)
+        # The charts of the ISO week of the end date need the ranks of the earlier weeks
+        results = run(db_path, { 'year': str(first_day.year), 'week': str(end_day.isocalendar()[1]), 
+                                 'date': first_day.strftime('%Y-%m-%d'), 'end_date': end_day.strftime('%Y-%m-%d') })
+        results += compare_loads(db_path, chunked_db_path)
+        results += check_quarantine_replay(src_path, work_path)
+    finally:
+        shutil.rmtree(work_path, ignore_errors=True)
+    for result in results:
+        print(f"{'OK  ' if result['identical'] else 'FAIL'} {result['name']} ({result['rows']} rows)")
+        if not result['identical']:
+            print(f"     {result['difference']}")
+    return all(result['identical'] for result in results)
@@ -0,0 +1,233 @@
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+import pandas as pd
+from libs.benchmarks import generator
+from libs.etl import etl
+from libs.etl.metrics import process_peak_rss_kb
+from libs.models.spotify_pipelinerunner import SpotifyPipelineRunner
+
+REPO_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+DB_SCHEMA_PATH = os.path.join(REPO_PATH, 'Task1', 'db', 'spotify_db_schema.sql')
+# Query functions of the analyses and their arguments, {year}, {week} and {date} refer to the generated data
+QUERIES = [
+    ('Task2/Task2-a.py', 'query_total_entries_per_table', {}),
+    ('Task2/Task2-a.py', 'query_null_entry_statistic_on_columns', { 'table': 'track', 'columns': ['track_number', 'disc_number', 'track_duration_ms'] }),
+    ('Task2/Task2-a.py', 'query_active_users_over_weeks_and_weekdays_by_year', { 'year': '{year}' }),
+    ('Task2/Task2-a.py', 'query_streams_over_weekdays', {}),
+    ('Task2/Task2-a.py', 'query_entire_table', { 'table_name': 'stream' }),
+    ('Task2/Task2-a.py', 'weekly_trend_track', {}),
+    ('Task2/Task2-a.py', 'weekly_trend_artist', {}),
+    ('Task2/Task2-a.py', 'weekly_trend_release', {}),
+    ('Task2/Task2-a.py', 'weekly_trend_track', { 'year': '{year}', 'week': '{week}' }),
+    ('Task2/Task2-a.py', 'weekly_trend_artist', { 'year': '{year}', 'week': '{week}' }),
+    ('Task2/Task2-a.py', 'weekly_trend_release', { 'year': '{year}', 'week': '{week}' }),
+    ('Task2/Task2-a.py', 'get_table_statistics', { 'table_name': 'time', 'columns': ['day_of_week', 'day', 'week', 'month', 'year'] }),
+    ('Task2/Task2-a.py', 'combine_table_statistics', {}),
+    ('Task2/Task2-b.py', 'query_distribution_of_streams_per_weekday_by_user', {}),
+    ('Task2/Task2-b.py', 'query_distribution_of_stream_time_category_by_user', {}),
+    ('Task2/Task2-b.py', 'query_variation_coefficient_of_dimension_by_user_on_weekly_basis', { 'dimension': 'artist' }),
+    ('Task2/Task2-b.py', 'query_variation_coefficient_of_dimension_by_user_on_weekly_basis', { 'dimension': 'release' }),
+    ('Task2/Task2-b.py', 'query_variation_coefficient_of_dimension_by_user_on_weekly_basis', { 'dimension': 'track' }),
+    ('Task2/Task2-b.py', 'query_clustering_features', {}),
+    ('Task2/Task2-c.py', 'query_most_active_user', {}),
+    ('Task2/Task2-c.py', 'query_number_of_active_users_by_date', { 'date': '{date}' }),
+    ('Task2/Task2-c.py', 'query_first_songs_users_listened_to', {}),
+    ('Task3/Task3.py', 'query_weekly_trend_of_streams_and_user', {}),
+]
+
+
+def measure(run, repeat:int = 3, setup = None) -> dict:
+    """
+    Times a function and profiles its memory. The fastest of the timed runs is reported, 
+    the memory is measured in one additional run with tracemalloc, as tracing slows the function down.
+    Parameters:
+        run (Callable): Function to measure, gets the result of setup if provided
+        repeat (int): Number of timed runs
+        setup (Callable): Untimed preparation before every run
+    Returns:
+        result (dict): seconds, peak_alloc_mb, rows of the result and the result itself
+    """
+    timings = []
+    for _ in range(repeat):
+        arguments = (setup(),) if setup else ()
+        start = time.perf_counter()
+        result = run(*arguments)
+        timings.append(time.perf_counter() - start)
+    arguments = (setup(),) if setup else ()
+    tracemalloc.start()
+    try:
+        run(*arguments)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return { 'seconds': round(min(timings), 6), 
+             'peak_alloc_mb': round(peak / 1024**2, 2), 
+             'rows': len(result) if hasattr(result, '__len__') else None,
+             'result': result }
+
+
+def load_module(path:str):
+    """
+    Imports a script of the repository by path, as the task scripts are no packages.
+    Parameters:
+        path (str): Script path, relative to the repository
+    Returns:
+        result (module): Imported module
+    """
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    name = os.path.splitext(os.path.basename(path))[0].replace('-', '_')
+    spec = importlib.util.spec_from_file_location(name, os.path.join(REPO_PATH, path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def benchmark_etl(src_path:str, work_path:str, repeat:int = 3) -> tuple:
+    """
+    Measures extract, validate, transform and the bulk load of a file. Every stage gets the output of the previous one.
+    Parameters:
+        src_path (str): Generated file
+        work_path (str): Folder for invalid rows and databases
+        repeat (int): Number of timed runs per stage
+    Returns:
+        result (tuple): Results per stage and the transformed data
+    """
+    invalid_path = os.path.join(work_path, 'invalide')
+    os.makedirs(invalid_path, exist_ok=True)
+    results = []
+    extracted = measure(lambda: etl.extract(src_path), repeat=repeat)
+    validated = measure(lambda df: etl.validate_data(df, invalid_data_path=invalid_path), repeat=repeat, 
+                        setup=lambda: extracted['result'].copy())
+    transformed = measure(etl.transform, repeat=repeat, setup=lambda: validated['result'].copy())
+    database_number = iter(range(2 * repeat + 2))
+
+    def new_database():
+        runner = SpotifyPipelineRunner(db_path=os.path.join(work_path, f'load_{next(database_number)}.db'), invalide_data_path=invalid_path,
+                                       loaded_data_path=work_path, db_schema_path=DB_SCHEMA_PATH, bulk_load=True, release_cache_size=0)
+        runner.create_database()
+        return runner
+
+    def load(runner):
+        try:
+            return etl.bulk_load(transformed['result'], db_conn=runner.connection())
+        finally:
+            runner.close()
+    loaded = measure(load, repeat=repeat, setup=new_database)
+    for stage, measurement, rows_in in [('extract', extracted, None), ('validate', validated, len(extracted['result'])),
+                                        ('transform', transformed, len(validated['result'])), ('load', loaded, len(transformed['result']))]:
+        rows_in = rows_in if rows_in is not None else measurement['rows']
+        results.append({ 'group': 'etl', 'name': stage, 'seconds': measurement['seconds'], 'peak_alloc_mb': measurement['peak_alloc_mb'],
+                         'rows': rows_in, 'rows_per_s': round(rows_in / measurement['seconds']) if measurement['seconds'] else None })
+    return results, transformed['result']
+
+
+def benchmark_queries(db_path:str, parameters:dict, repeat:int = 3) -> list:
+    """
+    Measures every query function of the Task2 and Task3 scripts.
+    Parameters:
+        db_path (str): Database with the generated data
+        parameters (dict): Values for the {year}, {week} and {date} arguments
+        repeat (int): Number of timed runs per query
+    Returns:
+        result (list): Result per query function
+    """
+    results = []
+    modules = {}
+    conn = sqlite3.connect(db_path)
+    try:
+        for path, function_name, arguments in QUERIES:
+            arguments = { key: value.format(**parameters) if isinstance(value, str) else value for key, value in arguments.items() }
+            name = f"{os.path.basename(path)}:{function_name}"
+            labels = [f'{key}={value}' for key, value in arguments.items() if isinstance(value, str)]
+            if labels:
+                name += f"({', '.join(labels)})"
+            try:
+                if path not in modules:
+                    modules[path] = load_module(path)
+                function = getattr(modules[path], function_name)
+                measurement = measure(lambda: function(conn, **arguments), repeat=repeat)
+            except Exception as e:
+                results.append({ 'group': 'query', 'name': name, 'error': f'{type(e).__name__}: {e}' })
+                continue
+            results.append({ 'group': 'query', 'name': name, 'seconds': measurement['seconds'], 
+                             'peak_alloc_mb': measurement['peak_alloc_mb'], 'rows': measurement['rows'] })
+    finally:
+        conn.close()
+    return results
+
+
+def git_commit() -> str:
+    """
+    Returns the current commit of the repository, so results can be compared across commits.
+    Returns:
+        result (str): Commit hash, None outside of a git checkout
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_PATH, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(rows:int = 100000, repeat:int = 3, output:str = None, work_path:str = None, **options) -> dict:
+    """
+    Generates a dataset, measures the etl stages on it, loads it into a database and measures the query functions.
+    Parameters:
+        rows (int): Number of generated listens
+        repeat (int): Number of timed runs per measurement
+        output (str): JSON file for the results
+        work_path (str): Folder for the generated file and the databases, a temporary folder is used and removed by default
+        options: Generator options, see generator.generate_records
+    Returns:
+        result (dict): Environment, parameters and results
+    """
+    cleanup = work_path is None
+    work_path = work_path or tempfile.mkdtemp(prefix='spotify_benchmark_')
+    os.makedirs(work_path, exist_ok=True)
+    try:
+        src_path = os.path.join(work_path, 'listens.jsonl')
+        generator.write_file(src_path, generator.generate_records(rows, **options))
+        results, df = benchmark_etl(src_path, work_path, repeat=repeat)
+
+        db_path = os.path.join(work_path, 'spotify.db')
+        runner = SpotifyPipelineRunner(db_path=db_path, invalide_data_path=work_path, loaded_data_path=work_path,
+                                       db_schema_path=DB_SCHEMA_PATH, bulk_load=True, release_cache_size=0)
+        runner.create_database()
+        runner.load(df)
+        runner.close()
+        first_day = datetime.utcfromtimestamp(options.get('start', generator.DEFAULT_START))
+        chart_day = first_day + timedelta(days=options.get('days', 365) // 2)
+        results += benchmark_queries(db_path, { 'year': str(first_day.year), 'week': str(chart_day.isocalendar()[1]),
+                                                'date': first_day.strftime('%Y-%m-%d') }, repeat=repeat)
+    finally:
+        if cleanup:
+            shutil.rmtree(work_path, ignore_errors=True)
+
+    report = { 'commit': git_commit(),
+               'created_at': datetime.now().isoformat(),
+               'python': sys.version.split()[0],
+               'pandas': pd.__version__,
+               'platform': platform.platform(),
+               'cpu_count': os.cpu_count(),
+               'peak_rss_kb': process_peak_rss_kb(),
+               'parameters': { 'rows': rows, 'repeat': repeat, **options },
+               'results': results }
+    if output:
+        with open(output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+        print(f'Wrote results to {output}.')
+    return report
+
+
+def main(rows:int = 100000, repeat:int = 3, output:str = None, **options):
+    report = run(rows=rows, repeat=repeat, output=output, **options)
+    print(pd.DataFrame(report['results']).set_index(['group', 'name']).to_string())
@@ -0,0 +1,57 @@
+import time
+import pandas as pd
+from libs.benchmarks import generator
+from libs.schemas.stream import stream_extractor, stream_schema, stream_validator
+
+
+def make_frame(rows:int, invalid_rate:float = 0.01, seed:int = 0) -> pd.DataFrame:
+    """
+    Creates an extracted dataframe with generated ListenBrainz like records.
+    Parameters:
+        rows (int): Number of records
+        invalid_rate (float): Share of records with an invalid value
+        seed (int): Random seed
+    Returns:
+        result (pd.DataFrame): Dataframe with all stream schema columns
+    """
+    records = generator.generate_records(rows, invalid_rate=invalid_rate, seed=seed)
+    return stream_extractor.extract(records)
+
+
+def benchmark(df:pd.DataFrame, repeat:int = 3) -> pd.DataFrame:
+    """
+    Compares the column validator with the pandas_schema validation. 
+    Parameters:
+        df (pd.DataFrame): Dataframe with all stream schema columns
+        repeat (int): Number of runs, the fastest one is reported
+    Returns:
+        result (pd.DataFrame): Runtime, throughput and invalid rows per validation engine
+    """
+    def run_pandas_schema():
+        return sorted(set(e.row for e in stream_schema.validate(df=df, columns=stream_schema.get_column_names())))
+
+    def run_column_validator():
+        return df.index[stream_validator.validate(df).invalid_rows].tolist()
+
+    results = []
+    invalid_rows = {}
+    for engine, run in [('pandas_schema', run_pandas_schema), ('column_validator', run_column_validator)]:
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            invalid_rows[engine] = run()
+            timings.append(time.perf_counter() - start)
+        seconds = min(timings)
+        results.append({ 'engine': engine, 'rows': len(df), 'seconds': round(seconds, 4),
+                         'rows_per_s': round(len(df) / seconds), 'invalid_rows': len(invalid_rows[engine]) })
+
+    if invalid_rows['pandas_schema'] != invalid_rows['column_validator']:
+        raise AssertionError('Validation engines disagree on the invalid rows')
+    result = pd.DataFrame(results).set_index('engine')
+    result['speedup'] = (result.loc['pandas_schema', 'seconds'] / result['seconds']).round(1)
+    return result
+
+
+def main(rows:int = 100000, repeat:int = 3):
+    df = make_frame(rows)
+    print(benchmark(df, repeat=repeat))
@@ -1,72 +1,234 @@
 import sqlite3
+import time
+from datetime import datetime
+from typing import Iterator
+import numpy as np
 import pandas as pd
-from libs.etl import helper
-from libs.schemas.stream import stream_schema
+from libs.etl import helper, hyperloglog, result_cache
+from libs.etl.quarantine import QuarantineStore
+from libs.etl.release_cache import FileReleases, ReleaseCache, UNKNOWN_RELEASE_MSID
+from libs.etl.time_dimension import CalendarDimension
+from libs.schemas.stream import stream_schema, stream_validator, stream_float_columns, stream_extractor
+
+# Target table, table columns (primary key first) and dataframe columns of each load step, in load order
+LOAD_PLAN = [
+    ('artist', ['artist_msid', 'artist_name'], ['artist_msid', 'artist_name']),
+    ('track', ['track_msid', 'track_name', 'track_number', 'disc_number', 'track_duration_ms'], 
+              ['track_msid', 'track_name', 'track_number', 'discnumber', 'track_duration_ms']),
+    ('release', ['release_msid', 'release_name', 'total_discs', 'total_tracks', 'release_date'], 
+                ['release_msid', 'release_name', 'totaldiscs', 'totaltracks', 'release_date']),
+    ('time', ['timestamp_unix_id', 'timestamp_utc', 'date', 'time', 'weekday', 'day_of_week', 'day', 'week', 'month', 'year'], 
+             ['listened_at', 'timestamp_utc', 'date', 'time', 'weekday', 'day_of_week', 'day_of_month', 'week_of_year', 'month', 'year']),
+    ('stream', ['stream_id', 'track_msid', 'artist_msid', 'release_msid', 'timestamp_unix_id', 'user_name', 'dedup_tag'], 
+               ['stream_id', 'track_msid', 'artist_msid', 'release_msid', 'listened_at', 'user_name', 'dedup_tag'])
+]
+# The statements are built once, so a long-lived connection finds them in its statement cache
+INSERT_STATEMENTS = {table: helper.insert_statement(table, table_columns) for table, table_columns, _ in LOAD_PLAN}
+# Calendar attributes of the days seen so far
+calendar_dimension = CalendarDimension()
+# Adds the streams after a rowid to the rollup tables of the 002_rollups, 005_track_release and 006_release_week migrations
+ROLLUP_STATEMENTS = [
+    """INSERT INTO rollup_day (date, year, week, day_of_week, weekday, streams)
+       SELECT   t.date, t.year, t.week, t.day_of_week, t.weekday, COUNT(1)
+       FROM     stream s INNER JOIN time t ON s.timestamp_unix_id == t.timestamp_unix_id
+       WHERE    s.rowid > ?
+       GROUP BY t.date
+       ON CONFLICT(date) DO UPDATE SET streams = streams + excluded.streams""",
+    """INSERT INTO rollup_user_day (date, user_name, year, week, day_of_week, weekday, streams)
+       SELECT   t.date, s.user_name, t.year, t.week, t.day_of_week, t.weekday, COUNT(1)
+       FROM     stream s INNER JOIN time t ON s.timestamp_unix_id == t.timestamp_unix_id
+       WHERE    s.rowid > ?
+       GROUP BY t.date, s.user_name
+       ON CONFLICT(date, user_name) DO UPDATE SET streams = streams + excluded.streams""",
+    """INSERT INTO rollup_user_week (year, week, user_name, streams)
+       SELECT   t.year, t.week, s.user_name, COUNT(1)
+       FROM     stream s INNER JOIN time t ON s.timestamp_unix_id == t.timestamp_unix_id
+       WHERE    s.rowid > ?
+       GROUP BY t.year, t.week, s.user_name
+       ON CONFLICT(year, week, user_name) DO UPDATE SET streams = streams + excluded.streams""",
+    """INSERT INTO rollup_track_week (year, week, track_msid, artist_msid, streams)
+       SELECT   t.year, t.week, s.track_msid, s.artist_msid, COUNT(1)
+       FROM     stream s INNER JOIN time t ON s.timestamp_unix_id == t.timestamp_unix_id
+       WHERE    s.rowid > ?
+       GROUP BY t.year, t.week, s.track_msid
+       ON CONFLICT(year, week, track_msid) DO UPDATE SET streams = streams + excluded.streams""",
+    """INSERT INTO rollup_artist_week (year, week, artist_msid, streams)
+       SELECT   t.year, t.week, s.artist_msid, COUNT(1)
+       FROM     stream s INNER JOIN time t ON s.timestamp_unix_id == t.timestamp_unix_id
+       WHERE    s.rowid > ?
+       GROUP BY t.year, t.week, s.artist_msid
+       ON CONFLICT(year, week, artist_msid) DO UPDATE SET streams = streams + excluded.streams""",
+    """INSERT INTO rollup_release_week (year, week, release_msid, artist_msid, streams)
+       SELECT   t.year, t.week, s.release_msid, s.artist_msid, COUNT(1)
+       FROM     stream s INNER JOIN time t ON s.timestamp_unix_id == t.timestamp_unix_id
+       WHERE    s.rowid > ?
+       GROUP BY t.year, t.week, s.release_msid, s.artist_msid
+       ON CONFLICT(year, week, release_msid, artist_msid) DO UPDATE SET streams = streams + excluded.streams""",
+    f"""INSERT INTO rollup_track_release (track_msid, release_msid)
+       SELECT   s.track_msid, s.release_msid
+       FROM     stream s
+       WHERE    s.rowid > ? AND s.release_msid != '{UNKNOWN_RELEASE_MSID}'
+       ORDER BY s.rowid
+       ON CONFLICT(track_msid) DO NOTHING""",
+]
+# Columns, that are carried from transform to load, the hash columns are built before the dtypes are compacted
+LOAD_COLUMNS = list(dict.fromkeys(column for _, _, df_columns in LOAD_PLAN for column in df_columns))
+# Repeated strings, that are stored once per batch as categories
+CATEGORICAL_COLUMNS = ['user_name', 'artist_msid', 'artist_name', 'release_msid', 'release_name', 'track_msid', 'track_name', 
+                       'weekday', 'date']
+# Numbers, that arrive as strings or floats with gaps, and become nullable integers
+NULLABLE_INTEGER_COLUMNS = ['track_number', 'discnumber', 'track_duration_ms', 'totaldiscs', 'totaltracks', 'release_date']
+# Calendar attributes, that fit into small integers
+SMALL_INTEGER_COLUMNS = ['day_of_week', 'day_of_month', 'week_of_year', 'month', 'year']
 
 def extract(path:str) -> pd.DataFrame:
     """
-    Extract data from JSON files
+    Extract data from JSON files. Only the schema columns are read from the records.
     Parameters:
         path (str): Path to JSON file
     Returns:
         result (pd.DataFrame): A dataframe with the ectracted data.
     """
     json_struct = helper.read_json(path)
-    return pd.json_normalize(json_struct)
+    return stream_extractor.extract(json_struct)
 
-def validate_data(df: pd.DataFrame, invalid_data_path:str) -> pd.DataFrame :
+def extract_chunks(path:str, chunk_size:int) -> Iterator[pd.DataFrame]:
+    """
+    Extract data from JSON files in batches of chunk_size records, so only one batch is held in memory.
+    Parameters:
+        path (str): Path to JSON file
+        chunk_size (int): Maximum number of records per batch
+    Returns:
+        result (Iterator[pd.DataFrame]): Dataframes with the extracted data, one per batch.
+    """
+    for records in helper.read_json_in_chunks(path, chunk_size):
+        yield stream_extractor.extract(records)
+
+def schema_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Brings df into the columns and float representation the schema expects, whatever path the rows come from 
+    (whole file, chunk, micro-batch or quarantine replay).
+    Parameters:
+        df (pd.DataFrame): Incomming data
+    Returns:
+        result (pd.DataFrame): Dataframe with the schema columns
+    """
+    df = helper.add_required_columns(df=df, required_columns=stream_schema.get_column_names())
+    return helper.cast_float_columns(df, stream_float_columns)
+
+def validate_data(df: pd.DataFrame, invalid_data_path:str, quarantine:QuarantineStore = None, source_file:str = None, 
+                  row_offset:int = 0, origins:pd.DataFrame = None) -> pd.DataFrame :
     """
     Validates the df data against a predefined schema. Data (Rows), that does not match the schema definition,
-    getting extracted and safed in the 'invalid' data bucked for inspection. 
+    getting extracted and safed in the 'invalid' data bucked for inspection, or in the quarantine store if one is provided. 
     Parameters:
         df (pd.DataFrame): Incomming data
         invalid_data_path (str): Data path to 'invalid' data bucked
+        quarantine (QuarantineStore): Store for the rejected rows
+        source_file (str): File the data comes from
+        row_offset (int): Position of the first row in the source file
+        origins (pd.DataFrame): source_file and row_number of each row in the order of df, e.g. of replayed rows, 
+                                instead of source_file and row_offset
     Returns:
         result (pd.DataFrame): Validated dataframe
     """
-    required_columns = stream_schema.get_column_names()
-    df = helper.add_required_columns(df=df,required_columns=required_columns)
-    errors = stream_schema.validate(df=df, columns=required_columns)
-    invalide_rows = [e.row for e in errors]
-    helper.extract_invalid_rows(df=df, path=invalid_data_path, invalide_rows=invalide_rows )
+    df = schema_columns(df)
+    result = stream_validator.validate(df)
+    invalide_rows = df.index[result.invalid_rows].tolist()
+    if quarantine is not None:
+        if invalide_rows:
+            invalid = result.invalid_rows.to_numpy()
+            if origins is not None:
+                source_file, row_numbers = origins['source_file'].to_numpy()[invalid], origins['row_number'].to_numpy()[invalid]
+            else:
+                source_file, row_numbers = source_file or '', row_offset + np.flatnonzero(invalid)
+            quarantine.add(df.loc[invalide_rows], source_file=source_file, row_numbers=row_numbers, 
+                           failures=result.failure_reasons())
+    else:
+        helper.extract_invalid_rows(df=df, path=invalid_data_path, invalide_rows=invalide_rows )
     df = helper.drop_invalid_rows(df=df, invalide_rows=invalide_rows)
     return df
 
-def transform(df: pd.DataFrame) -> pd.DataFrame:
+def find_invalid_rows(df: pd.DataFrame) -> np.ndarray:
     """
-    Transform the data in order to fit the database schema
+    Checks the df data against the schema, like validate_data, but without storing the rejected rows.
     Parameters:
         df (pd.DataFrame): Incomming data
     Returns:
-        result (pd.DataFrame): Transformed dataframe
+        result (np.ndarray): True for the rows, that do not match the schema
+    """
+    return stream_validator.validate(schema_columns(df)).invalid_rows.to_numpy()
+
+def scan_releases(path:str, chunk_size:int) -> FileReleases:
+    """
+    First scan of a file, that is processed in chunks. Collects the first release of every track and the first name 
+    of every release of the valid rows, so the chunks can be filled like the whole file, see FileReleases. 
+    Rejected rows are not stored, the validation of the chunks does that.
+    Parameters:
+        path (str): Path to JSON file
+        chunk_size (int): Maximum number of records per batch
+    Returns:
+        result (FileReleases): Releases of the file
+    """
+    releases = FileReleases()
+    for df in extract_chunks(path, chunk_size):
+        df = schema_columns(df)
+        df = df[~find_invalid_rows(df)]
+        releases.scan(add_track_msid(df))
+    releases.start()
+    return releases
+
+def add_track_msid(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Cleans up the column names and the track names and hashes the track_msid.
+    Parameters:
+        df (pd.DataFrame): Valid data
+    Returns:
+        result (pd.DataFrame): Dataframe with track_msid
     """
     # clean up column names
     df = df.rename(columns=lambda columnName: columnName.replace("track_metadata.","").replace("additional_info.",""))
 
-    # Set duration in ms
-    df['track_duration_ms'] = df["duration_ms"].fillna(df["duration"]*10).fillna(df["track_length"]*10)
-    
-    # Set track number
-    df['track_number'] = df["tracknumber"].fillna(df["track_number"])
-
      # Remove all after and including '('
     df['track_name'] = df['track_name'].str.replace(r'\(.*', '', regex=True)
 
     # Create hash for track_msid
     keys_to_hash: set = ["track_name", "artist_msid"]
     df['track_msid'] =  helper.make_hash_column(df,keys_to_hash)
+    return df
 
-    # Fill Null release_msid with release_msid from other rows, based on the same track_msid (Artist Song combination)
-    df['release_msid'] = df.groupby(['track_msid'], sort=False)['release_msid'].apply(lambda x: x.ffill().bfill())
+def transform(df: pd.DataFrame, releases:FileReleases = None) -> pd.DataFrame:
+    """
+    Transform the data in order to fit the database schema
+    Parameters:
+        df (pd.DataFrame): Incomming data
+        releases (FileReleases): Releases of the whole file, if df is a chunk of it
+    Returns:
+        result (pd.DataFrame): Transformed dataframe
+    """
+    df = add_track_msid(df)
+
+    # Set duration in ms
+    df['track_duration_ms'] = df["duration_ms"].fillna(df["duration"]*10).fillna(df["track_length"]*10)
+    
+    # Set track number
+    df['track_number'] = df["tracknumber"].fillna(df["track_number"])
+
+    if releases is None:
+        # Fill Null release_msid with release_msid from other rows, based on the same track_msid (Artist Song combination)
+        df['release_msid'] = helper.fill_within_groups(df, group_column='track_msid', column='release_msid')
 
-    # Fill Null release_name with release_name from other rows, based on the same release_msid
-    df['release_name'] = df.groupby(['release_msid'], sort=False)['release_name'].apply(lambda x: x.ffill().bfill())
+        # Fill Null release_name with release_name from other rows, based on the same release_msid
+        df['release_name'] = helper.fill_within_groups(df, group_column='release_msid', column='release_name')
+    else:
+        # The same, with the rows of the other chunks of the file
+        df['release_msid'], df['release_name'] = releases.fill(df)
     
     # Set unknown release name where 'release_msid' and 'release_name' is unknown
     df.loc[df[['release_msid', 'release_name']].isna().all(axis=1), 'release_name'] = "Unknown"
 
     # Set unknown release_msid where release_msid is null
-    df['release_msid'] = df["release_msid"].fillna("xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx")
+    df['release_msid'] = df["release_msid"].fillna(UNKNOWN_RELEASE_MSID)
   
      # Get Year from release
     df['release_date'] = df["date"].str[-4:]    
@@ -75,63 +237,301 @@ def transform(df: pd.DataFrame) -> pd.DataFrame:
     keys_to_hash: set = ["track_msid", "listened_at", "user_name","dedup_tag"]
     df['stream_id'] =  helper.make_hash_column(df,keys_to_hash)
 
-    # Create time table data
-    df['timestamp_utc']= pd.to_datetime(df['listened_at'], unit='s', utc=True)
-    df['weekday']= df['timestamp_utc'].dt.day_name()
-    df['day_of_week']= df['timestamp_utc'].dt.dayofweek
-    df['week_of_year']= df['timestamp_utc'].dt.isocalendar().week
-    df['date'] = df['timestamp_utc'].dt.date
-    df['time'] = df['timestamp_utc'].dt.time.apply(str)
-    df['day_of_month'] = df['timestamp_utc'].dt.day
-    df['year'] = df['timestamp_utc'].dt.year
-    df['month'] = df['timestamp_utc'].dt.month
-    df['timestamp_utc'] = df['timestamp_utc'].apply(str)
+    # Create time table data, once per distinct timestamp and day
+    time_columns = calendar_dimension.derive(df['listened_at'])
+    df[time_columns.columns] = time_columns
 
     return df  
 
 
-def load(df: pd.DataFrame, db_conn:sqlite3.Connection):
+def compact(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Keeps the columns of the load plan and stores them in compact dtypes: repeated strings as categories, 
+    numbers as (nullable) integers. The loaded values stay the same.
+    Parameters:
+        df (pd.DataFrame): Transformed data
+    Returns:
+        result (pd.DataFrame): Compact dataframe
+    """
+    df = df[LOAD_COLUMNS].copy()
+    for column in CATEGORICAL_COLUMNS:
+        df[column] = df[column].astype('category')
+    for column in NULLABLE_INTEGER_COLUMNS:
+        df[column] = helper.to_nullable_integer(df[column])
+    for column in SMALL_INTEGER_COLUMNS:
+        df[column] = pd.to_numeric(df[column], downcast='integer')
+    return df
+
+
+def memory_usage(df: pd.DataFrame) -> int:
+    """
+    Returns the memory used by a dataframe, including the strings it references.
+    Parameters:
+        df (pd.DataFrame): Dataframe
+    Returns:
+        result (int): Bytes
+    """
+    return int(df.memory_usage(deep=True).sum())
+
+
+def backfill_releases(df: pd.DataFrame, release_cache:ReleaseCache) -> pd.DataFrame:
     """
-    Load the data into the database
+    Fills unknown releases and release names with the ones of previously loaded files.
+    Parameters:
+        df (pd.DataFrame): Transformed data
+        release_cache (ReleaseCache): Known releases, None to skip the backfill
+    Returns:
+        result (pd.DataFrame): Dataframe with backfilled releases
+    """
+    if release_cache is None:
+        return df
+
+    # Replace the unknown release_msid with the release of the same track_msid from previous files
+    unknown_release = df['release_msid'] == UNKNOWN_RELEASE_MSID
+    if unknown_release.any():
+        tracks = df.loc[unknown_release, 'track_msid']
+        releases = tracks.astype(object).map(release_cache.lookup_releases(tracks.unique())).dropna()
+        df['release_msid'] = helper.add_categories(df['release_msid'], releases)
+        df.loc[releases.index, 'release_msid'] = releases
+        df.loc[releases.index, 'release_name'] = None
+
+    # Fill Null release_name with the release_name of the same release_msid from previous files
+    missing_name = df['release_name'].isna()
+    if missing_name.any():
+        releases = df.loc[missing_name, 'release_msid'].astype(object)
+        release_names = releases.map(release_cache.lookup_release_names(releases.unique()))
+        df['release_name'] = helper.add_categories(df['release_name'], release_names)
+        df.loc[missing_name, 'release_name'] = release_names
+    return df
+
+
+def load(df: pd.DataFrame, db_conn:sqlite3.Connection, sketch_precision:int = hyperloglog.DEFAULT_PRECISION) -> dict:
+    """
+    Load the data into the database. The rollup tables and user sketches are updated together with the streams.
+    Every table, that gets new rows, bumps the load generation, which invalidates the cached query results.
     Parameters:
         df (pd.DataFrame): Incomming data
         db_conn (sqlite3.Connection): Database connection
+        sketch_precision (int): Precision of the daily user sketches
+    Returns:
+        result (dict): Rows in, rows loaded, seconds and rows per second by table
     """
+    statistics = {}
     c = db_conn.cursor()
+    for table, table_columns, df_columns in LOAD_PLAN:
+        start = time.perf_counter()
+        records = helper.to_records(df, df_columns)
+        last_stream_rowid = max_stream_rowid(c) if table == 'stream' else None
+        c.executemany(INSERT_STATEMENTS[table], records)
+        if c.rowcount > 0:
+            result_cache.bump_load_generation(c)
+        rollup_statistics = None
+        if last_stream_rowid is not None:
+            # The rollups are committed together with the streams they count
+            rollup_statistics = update_rollups(c, last_stream_rowid, sketch_precision)
+        db_conn.commit()
+        seconds = time.perf_counter() - start
+        statistics[table] = { 'rows_in': len(df), 'rows_loaded': len(records), 'seconds': seconds,
+                              'rows_per_s': len(df) / seconds if seconds else float('inf') }
+        if rollup_statistics:
+            statistics['rollups'] = rollup_statistics
+    c.close()
+    return statistics
 
-    # Load into artist
-    sql = """INSERT INTO artist (artist_msid, artist_name) VALUES(?,?) 
-             ON CONFLICT(artist_msid) DO NOTHING"""
-    records = df[["artist_msid","artist_name"]].values.tolist()
 
-    c.executemany(sql,records)		
-    db_conn.commit()
+def bulk_load(df: pd.DataFrame, db_conn:sqlite3.Connection, staging:bool = False, 
+              sketch_precision:int = hyperloglog.DEFAULT_PRECISION) -> dict:
+    """
+    Load the data into the database within one transaction. Rows are deduplicated by their primary key
+    before they are sent to the database. The rollup tables, user sketches and the load generation are updated in the same transaction.
+    Parameters:
+        df (pd.DataFrame): Incomming data
+        db_conn (sqlite3.Connection): Database connection
+        staging (bool): Insert the rows into temporary staging tables first and move them with one INSERT ... SELECT per table
+        sketch_precision (int): Precision of the daily user sketches
+    Returns:
+        result (dict): Rows in, rows loaded, seconds and rows per second by table
+    """
+    statistics = {}
+    c = db_conn.cursor()
+    try:
+        if not db_conn.in_transaction:
+            c.execute("BEGIN")
+        last_stream_rowid = max_stream_rowid(c)
+        changed = False
+        for table, table_columns, df_columns in LOAD_PLAN:
+            start = time.perf_counter()
+            rows = df[df_columns].drop_duplicates(subset=df_columns[0])
+            records = helper.to_records(rows, df_columns)
+            if staging:
+                load_staging_table(c, table, table_columns, records)
+            else:
+                c.executemany(INSERT_STATEMENTS[table], records)
+            changed = changed or c.rowcount > 0
+            seconds = time.perf_counter() - start
+            statistics[table] = { 'rows_in': len(df), 'rows_loaded': len(records), 'seconds': seconds,
+                                  'rows_per_s': len(df) / seconds if seconds else float('inf') }
+        statistics['rollups'] = update_rollups(c, last_stream_rowid, sketch_precision)
+        if changed:
+            result_cache.bump_load_generation(c)
+        db_conn.commit()
+    except Exception:
+        db_conn.rollback()
+        raise
+    finally:
+        c.close()
 
-    # Load into track
-    sql = """INSERT INTO track (track_msid, track_name, track_number, disc_number, track_duration_ms) VALUES(?,?,?,?,?) 
-             ON CONFLICT(track_msid) DO NOTHING"""
-    records = df[["track_msid","track_name", "track_number", "discnumber", "track_duration_ms"]].values.tolist()
-    c.executemany(sql,records)
-    db_conn.commit()
+    for table, table_statistics in statistics.items():
+        print(f"Loaded {table_statistics['rows_loaded']} of {table_statistics['rows_in']} rows into {table} "
+              f"({table_statistics['rows_per_s']:.0f} rows/s).")
+    return statistics
 
-    # Load into release
-    sql = """INSERT INTO release (release_msid, release_name, total_discs, total_tracks, release_date) VALUES(?,?,?,?,?) 
-             ON CONFLICT(release_msid) DO NOTHING """
-    records = df[["release_msid","release_name","totaldiscs","totaltracks","release_date"]].values.tolist()
-    c.executemany(sql,records)
-    db_conn.commit()
 
-    # Load into time
-    sql = """INSERT INTO time (timestamp_unix_id, timestamp_utc, date, time, weekday, day_of_week, day, week, month, year ) VALUES(?,?,?,?,?,?,?,?,?,?) 
-              ON CONFLICT(timestamp_unix_id) DO NOTHING """
-    records = df[["listened_at","timestamp_utc","date", "time", "weekday", "day_of_week", "day_of_month", "week_of_year", "month", "year"]].values.tolist()
-    c.executemany(sql,records)
-    db_conn.commit()
+def max_stream_rowid(c:sqlite3.Cursor) -> int:
+    """
+    Returns the rowid of the last stream. Streams, that are inserted afterwards, get higher rowids.
+    Parameters:
+        c (sqlite3.Cursor): Database cursor
+    Returns:
+        result (int): Highest rowid of the stream table, 0 if it is empty
+    """
+    return c.execute("SELECT COALESCE(MAX(rowid), 0) FROM stream").fetchone()[0]
+
+
+def update_rollups(c:sqlite3.Cursor, last_stream_rowid:int, sketch_precision:int = hyperloglog.DEFAULT_PRECISION) -> dict:
+    """
+    Adds the streams, that have been inserted after last_stream_rowid, to the rollup tables and the user sketches. 
+    Duplicates, that the stream insert skipped, are not counted. Runs within the transaction of the caller.
+    Parameters:
+        c (sqlite3.Cursor): Database cursor
+        last_stream_rowid (int): Highest rowid of the stream table before the insert
+        sketch_precision (int): Precision of the daily user sketches
+    Returns:
+        result (dict): Rows in, rows loaded, seconds and rows per second of the rollup update
+    """
+    start = time.perf_counter()
+    new_streams = c.execute("SELECT COUNT(1) FROM stream WHERE rowid > ?", (last_stream_rowid,)).fetchone()[0]
+    if new_streams:
+        for statement in ROLLUP_STATEMENTS:
+            c.execute(statement, (last_stream_rowid,))
+        rows = c.execute("""SELECT t.date, s.user_name 
+                            FROM   stream s INNER JOIN time t ON s.timestamp_unix_id == t.timestamp_unix_id
+                            WHERE  s.rowid > ?""", (last_stream_rowid,)).fetchall()
+        dates, user_names = zip(*rows)
+        store_user_sketches(c, hyperloglog.sketch_groups(dates, user_names, sketch_precision))
+    seconds = time.perf_counter() - start
+    return { 'rows_in': new_streams, 'rows_loaded': new_streams, 'seconds': seconds,
+             'rows_per_s': new_streams / seconds if seconds else float('inf') }
+
+
+def store_user_sketches(c:sqlite3.Cursor, sketches:dict):
+    """
+    Merges sketches into the stored user sketches of their days.
+    Parameters:
+        c (sqlite3.Cursor): Database cursor
+        sketches (dict): date -> HyperLogLog of the users
+    """
+    for date, sketch in sketches.items():
+        stored = c.execute("SELECT sketch FROM user_sketch WHERE date = ?", (date,)).fetchone()
+        if stored is not None:
+            sketch = sketch.merge(hyperloglog.HyperLogLog.from_bytes(stored[0]))
+        c.execute("""INSERT INTO user_sketch (date, sketch) VALUES(?, ?) 
+                     ON CONFLICT(date) DO UPDATE SET sketch = excluded.sketch""", (date, sketch.to_bytes()))
 
-    # Load into stream
-    sql = """INSERT INTO stream (stream_id, track_msid, artist_msid, release_msid, timestamp_unix_id, user_name, dedup_tag) VALUES(?,?,?,?,?,?,?) 
-             ON CONFLICT(stream_id) DO NOTHING """
-    records = df[["stream_id","track_msid","artist_msid", "release_msid", "listened_at", "user_name", "dedup_tag"]].values.tolist()
-    c.executemany(sql,records)
+
+def backfill_user_sketches(db_conn:sqlite3.Connection, sketch_precision:int = hyperloglog.DEFAULT_PRECISION) -> int:
+    """
+    Sketches the users of the days, that have no user sketch yet, e.g. days loaded before the sketches existed.
+    Parameters:
+        db_conn (sqlite3.Connection): Database connection
+        sketch_precision (int): Precision of the daily user sketches
+    Returns:
+        result (int): Number of sketched days
+    """
+    rows = db_conn.execute("""SELECT date, user_name 
+                              FROM   rollup_user_day
+                              WHERE  date NOT IN (SELECT date FROM user_sketch)""").fetchall()
+    if not rows:
+        return 0
+    dates, user_names = zip(*rows)
+    sketches = hyperloglog.sketch_groups(dates, user_names, sketch_precision)
+    c = db_conn.cursor()
+    try:
+        store_user_sketches(c, sketches)
+        result_cache.bump_load_generation(c)
+        db_conn.commit()
+    finally:
+        c.close()
+    return len(sketches)
+
+
+def is_loaded(db_conn:sqlite3.Connection, content_hash:str) -> bool:
+    """
+    Checks the ingest ledger for a file with the same content, that has already been loaded.
+    Parameters:
+        db_conn (sqlite3.Connection): Database connection
+        content_hash (str): Content hash of the file
+    Returns:
+        result (bool): True if the content has been loaded before
+    """
+    row = db_conn.execute("SELECT 1 FROM ingest_ledger WHERE content_hash = ? AND status = 'loaded'", (content_hash,)).fetchone()
+    return row is not None
+
+
+def record_ingest(db_conn:sqlite3.Connection, content_hash:str, file_name:str, size:int, status:str, 
+                  rows_in:int = 0, rows_loaded:int = 0, invalid_rows:int = 0):
+    """
+    Records the outcome of a file in the ingest ledger. A later outcome of the same content replaces the earlier one.
+    Parameters:
+        db_conn (sqlite3.Connection): Database connection
+        content_hash (str): Content hash of the file
+        file_name (str): File name
+        size (int): File size in bytes
+        status (str): Outcome, e.g. 'loaded' or 'invalid'
+        rows_in (int): Extracted rows
+        rows_loaded (int): Valid rows, that have been loaded
+        invalid_rows (int): Rejected rows
+    """
+    db_conn.execute("""INSERT INTO ingest_ledger (content_hash, file_name, size, rows_in, rows_loaded, invalid_rows, status, ingested_at)
+                       VALUES(?,?,?,?,?,?,?,?)
+                       ON CONFLICT(content_hash) DO UPDATE SET file_name = excluded.file_name, size = excluded.size, 
+                            rows_in = excluded.rows_in, rows_loaded = excluded.rows_loaded, invalid_rows = excluded.invalid_rows, 
+                            status = excluded.status, ingested_at = excluded.ingested_at""",
+                    (content_hash, file_name, size, rows_in, rows_loaded, invalid_rows, status, datetime.now().isoformat()))
     db_conn.commit()
-    c.close()
+
+
+def load_staging_table(c:sqlite3.Cursor, table:str, table_columns:list, records:list):
+    """
+    Inserts the records into a temporary staging table and moves them into the target table.
+    Parameters:
+        c (sqlite3.Cursor): Database cursor
+        table (str): Target table
+        table_columns (list): Columns of the target table, the first one is the primary key
+        records (list): Rows to insert
+    """
+    columns = ", ".join(table_columns)
+    c.execute(f"CREATE TEMP TABLE IF NOT EXISTS staging_{table} AS SELECT {columns} FROM main.{table} WHERE 0")
+    c.execute(f"DELETE FROM staging_{table}")
+    c.executemany(helper.insert_statement(f"staging_{table}", table_columns, on_conflict=False), records)
+    c.execute(f"""INSERT INTO main.{table} ({columns}) SELECT {columns} FROM staging_{table} WHERE true 
+                  ON CONFLICT({table_columns[0]}) DO NOTHING""")
+
+
+def set_bulk_pragmas(db_conn:sqlite3.Connection, journal_mode:str = 'WAL', synchronous:str = 'NORMAL', cache_size:int = -65536):
+    """
+    Configures the database connection for bulk loads.
+    Parameters:
+        db_conn (sqlite3.Connection): Database connection
+        journal_mode (str): SQLite journal mode
+        synchronous (str): SQLite synchronous level
+        cache_size (int): Page cache size, negative values are KiB
+    """
+    if journal_mode.upper() not in ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'):
+        raise ValueError(f"Unknown journal mode {journal_mode}")
+    if synchronous.upper() not in ('OFF', 'NORMAL', 'FULL', 'EXTRA'):
+        raise ValueError(f"Unknown synchronous level {synchronous}")
+    db_conn.execute(f"PRAGMA journal_mode={journal_mode}")
+    db_conn.execute(f"PRAGMA synchronous={synchronous}")
+    db_conn.execute(f"PRAGMA cache_size={int(cache_size)}")
+    db_conn.execute("PRAGMA temp_store=MEMORY")
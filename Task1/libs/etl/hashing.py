@@ -0,0 +1,44 @@
+import hashlib
+import numpy as np
+import pandas as pd
+
+
+def build_keys(df:pd.DataFrame, columns:list) -> pd.Series:
+    """
+    Builds the hash keys column by column, by concatenating the string representation of the values.
+    Parameters:
+        df (pd.DataFrame): Dataframe
+        columns (list): Columns of the df, used to build the key from
+    Returns:
+        result (pd.Series): Key per row
+    """
+    keys = df[columns[0]].astype(str)
+    for column in columns[1:]:
+        keys = keys + df[column].astype(str)
+    return keys
+
+
+def hash_keys(keys:pd.Series) -> pd.Series:
+    """
+    Creates the md5 hex digest of each key. Each distinct key gets hashed only once.
+    Parameters:
+        keys (pd.Series): Keys to hash
+    Returns:
+        result (pd.Series): Hash per key
+    """
+    codes, uniques = pd.factorize(keys)
+    digests = [hashlib.md5(key.encode('utf-8')).hexdigest() for key in uniques]
+    return pd.Series(np.array(digests, dtype=object)[codes], index=keys.index, dtype=object)
+
+
+def hash_columns(df:pd.DataFrame, columns:list) -> pd.Series:
+    """
+    Creates a md5 hash based on the values of the provided df columns.
+    Parameters:
+        df (pd.DataFrame): Dataframe
+        columns (list): Columns of the df, used to generate the hash from
+    Returns:
+        result (pd.Series): Column with hash values
+    """
+    return hash_keys(build_keys(df, columns))
+
@@ -1,7 +1,23 @@
+import bz2
 import datetime
+import gzip
 import hashlib
 import json
+import lzma
+import os
+import shutil
+import re
+from typing import Iterable, Iterator
+import numpy as np
 import pandas as pd
+from libs.etl import hashing
+
+READ_BLOCK_SIZE = 1 << 16
+_SKIP_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_SKIP_ARRAY_SEPARATOR = re.compile(r'[ \t\n\r,]*')
+# Readers and writers of compressed files by file suffix and compression name
+DECOMPRESSORS = { '.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open }
+COMPRESSORS = { 'gzip': ('.gz', gzip.open), 'xz': ('.xz', lzma.open) }
 
 def read_json(path:str) -> dict:
     """
@@ -12,8 +28,8 @@ def read_json(path:str) -> dict:
         result (dict): JSON Data as dict
     """
     try:
-        file = open(path)
-        return json.load(file)
+        with open_text(path) as file:
+            return json.load(file)
     except json.JSONDecodeError as err:
         return read_json_line_by_line(path)
 
@@ -27,14 +43,202 @@ def read_json_line_by_line(path:str) -> dict:
         result (dict): JSON Data as dict
     """
     record_list = []
-    with open(path) as f:
+    with open_text(path) as f:
         for jsonObj in f:
             record_dict = json.loads(jsonObj)
             record_list.append(record_dict)
     return record_list
-    
 
-def make_hash_column(df:pd.DataFrame, columns:set) -> pd:
+
+def open_text(path:str):
+    """
+    Opens a text file for reading. Files ending with .gz, .bz2 or .xz are decompressed while they are read.
+    Parameters:
+        path (str): Path to file
+    Returns:
+        result (TextIO): File object
+    """
+    opener = DECOMPRESSORS.get(os.path.splitext(path)[1].lower(), open)
+    return opener(path, 'rt')
+
+
+def move_file(src_path:str, target_path:str, compression:str = None) -> str:
+    """
+    Moves a file into the target folder. On the same filesystem the file is renamed, otherwise it is copied and deleted.
+    With compression the file is compressed into the target folder instead, unless it is compressed already.
+    Parameters:
+        src_path (str): File source path
+        target_path (str): Target folder
+        compression (str): None, 'gzip' or 'xz'
+    Returns:
+        result (str): Path of the moved file
+    """
+    target = f"{target_path}/{os.path.basename(src_path)}"
+    if compression and os.path.splitext(src_path)[1].lower() not in DECOMPRESSORS:
+        suffix, opener = COMPRESSORS[compression]
+        target += suffix
+        partial_target = target + '.partial'
+        with open(src_path, 'rb') as src_file, opener(partial_target, 'wb') as target_file:
+            shutil.copyfileobj(src_file, target_file, READ_BLOCK_SIZE * 16)
+        os.replace(partial_target, target)
+        os.remove(src_path)
+        return target
+    try:
+        os.replace(src_path, target)
+    except OSError:
+        # Different filesystems
+        shutil.copyfile(src_path, target)
+        os.remove(src_path)
+    return target
+
+
+def iter_json_records(path:str) -> Iterator[dict]:
+    """
+    Lazily reads JSON records, either from one JSON array or from JSON lines, without loading the whole file.
+    Parameters:
+        path (str): Path to JSON file
+    Returns:
+        result (Iterator[dict]): JSON records, one at a time
+    """
+    decoder = json.JSONDecoder()
+    with open_text(path) as file:
+        buffer = file.read(READ_BLOCK_SIZE)
+        position = _SKIP_WHITESPACE.match(buffer).end()
+        in_array = buffer[position:position+1] == '['
+        if in_array:
+            position += 1
+        skip = _SKIP_ARRAY_SEPARATOR if in_array else _SKIP_WHITESPACE
+        eof = not buffer
+        while True:
+            position = skip.match(buffer, position).end()
+            if in_array and buffer[position:position+1] == ']':
+                return
+            if position == len(buffer) and eof:
+                return
+            try:
+                record, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                end = len(buffer)
+            # A record touching the end of the buffer may be cut off, so read on before trusting it
+            if end == len(buffer) and not eof:
+                block = file.read(READ_BLOCK_SIZE)
+                eof = not block
+                buffer = buffer[position:] + block
+                position = 0
+                continue
+            position = end
+            yield record
+
+
+def hash_file(path:str, block_size:int = 1 << 20) -> str:
+    """
+    Creates the sha256 hash of a file's content, reading the file block by block.
+    Parameters:
+        path (str): Path to file
+        block_size (int): Bytes per read
+    Returns:
+        result (str): Hex digest
+    """
+    file_hash = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def read_json_in_chunks(path:str, chunk_size:int) -> Iterator[list]:
+    """
+    Reads JSON records in batches of a fixed size.
+    Parameters:
+        path (str): Path to JSON file
+        chunk_size (int): Maximum number of records per batch
+    Returns:
+        result (Iterator[list]): Lists of at most chunk_size JSON records
+    """
+    chunk = []
+    for record in iter_json_records(path):
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def cast_float_columns(df:pd.DataFrame, columns:set) -> pd.DataFrame:
+    """
+    Casts integer columns to float. A column is only read as float if at least one value is missing, 
+    so this keeps batches without gaps in line with the float representation the schema expects.
+    Parameters:
+        df (pd.DataFrame): Dataframe 
+        columns (set): Columns, that are expected as float
+    Returns:
+        df (pd.DataFrame): Dataframe with float columns
+    """
+    for column in columns:
+        if column in df.columns and pd.api.types.is_integer_dtype(df[column]):
+            df[column] = df[column].astype(float)
+    return df
+
+
+def to_nullable_integer(series:pd.Series) -> pd.Series:
+    """
+    Converts a column of numbers and number strings into the nullable Int64 dtype. The column is kept as it is,
+    unless every value converts without loss, e.g. '5' or 5.0, but not '05', '3/12' or 2.5.
+    Parameters:
+        series (pd.Series): Column
+    Returns:
+        result (pd.Series): Int64 column, or the unchanged column
+    """
+    try:
+        numbers = pd.to_numeric(series)
+    except (ValueError, TypeError):
+        return series
+    values = numbers.dropna()
+    if not pd.api.types.is_numeric_dtype(numbers) or pd.api.types.is_bool_dtype(numbers):
+        return series
+    if len(values) and (not np.all(np.mod(values, 1) == 0) or values.abs().max() >= 2**53):
+        return series
+    integers = numbers.astype('Int64')
+    strings = series.map(type) == str
+    if strings.any() and not (integers[strings].astype(str) == series[strings]).all():
+        return series
+    return integers
+
+
+def add_categories(series:pd.Series, values:Iterable) -> pd.Series:
+    """
+    Adds the missing categories of values to a categorical column, so they can be assigned.
+    Other columns are returned unchanged.
+    Parameters:
+        series (pd.Series): Column
+        values (Iterable): Values to assign
+    Returns:
+        result (pd.Series): Column, that accepts the values
+    """
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        return series
+    new_categories = pd.Index(pd.unique(pd.Series(list(values), dtype=object).dropna())).difference(series.cat.categories)
+    return series.cat.add_categories(new_categories) if len(new_categories) else series
+
+
+def to_records(df:pd.DataFrame, columns:list) -> list:
+    """
+    Converts columns of a dataframe into rows of plain Python values, with None for missing values,
+    e.g. pd.NA of nullable integer columns and NaN of categorical columns.
+    Parameters:
+        df (pd.DataFrame): Dataframe
+        columns (list): Columns in row order
+    Returns:
+        result (list): One list of values per row
+    """
+    values = df[columns].astype(object)
+    return values.where(values.notna(), None).values.tolist()
+
+
+def make_hash_column(df:pd.DataFrame, columns:set) -> pd.Series:
     """
     Creates a hash md5-hex-digit hash based on the values provided df columns
     Parameters:
@@ -43,7 +247,22 @@ def make_hash_column(df:pd.DataFrame, columns:set) -> pd:
     Returns:
         df (pd.Series): Column with hash values
     """
-    return pd.DataFrame(df[columns].applymap(str).values.sum(axis=1))[0].str.encode('utf-8').apply(lambda x: (hashlib.md5(x).hexdigest()))
+    return hashing.hash_columns(df, list(columns))
+
+
+def fill_within_groups(df:pd.DataFrame, group_column:str, column:str) -> pd.Series:
+    """
+    Fills null values of a column with the previous, or else the next, value of the same group.
+    Rows without group value are set to null.
+    Parameters:
+        df (pd.DataFrame): Dataframe 
+        group_column (str): Column to group by
+        column (str): Column to fill
+    Returns:
+        result (pd.Series): Filled column
+    """
+    filled = df.groupby(group_column, sort=False)[column].ffill()
+    return filled.groupby(df[group_column], sort=False).bfill()
 
 
 def add_required_columns(df:pd.DataFrame, required_columns:set) -> pd.DataFrame:
@@ -64,14 +283,14 @@ def add_required_columns(df:pd.DataFrame, required_columns:set) -> pd.DataFrame:
 
 def drop_invalid_rows(df:pd.DataFrame, invalide_rows:set[int]) -> pd.DataFrame:
     """
-    Drops invalide rows from the dataframe.
+    Drops invalide rows from the dataframe and renumbers the remaining rows.
     Parameters:
         df (pd.DataFrame): Dataframe 
         invalide_rows (set): Set of invalide row index
     Returns:
         df (pd.DataFrame): Cleaned dataframe
     """
-    return df.drop(index=invalide_rows)
+    return df.drop(index=invalide_rows).reset_index(drop=True)
 
 def extract_invalid_rows(df:pd.DataFrame, path:str, invalide_rows:set[int], ):
     """
@@ -83,4 +302,20 @@ def extract_invalid_rows(df:pd.DataFrame, path:str, invalide_rows:set[int], ):
     if invalide_rows:
         current_timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H:%M:%S.%f")
         file_path = f"{path}/{current_timestamp}.json"
-        df.iloc[invalide_rows].to_json(file_path, orient="records" )
+        df.loc[invalide_rows].to_json(file_path, orient="records" )
+
+
+def insert_statement(table:str, table_columns:list, on_conflict:bool = True) -> str:
+    """
+    Creates the insert statement of a table. Duplicates of the primary key (first column) are skipped.
+    Parameters:
+        table (str): Target table
+        table_columns (list): Columns of the target table, the first one is the primary key
+        on_conflict (bool): Add the ON CONFLICT DO NOTHING clause
+    Returns:
+        result (str): SQL statement
+    """
+    sql = f"INSERT INTO {table} ({', '.join(table_columns)}) VALUES({','.join('?' * len(table_columns))})"
+    if on_conflict:
+        sql += f" ON CONFLICT({table_columns[0]}) DO NOTHING"
+    return sql
@@ -0,0 +1,236 @@
+import math
+import sqlite3
+import struct
+import zlib
+import numpy as np
+import pandas as pd
+
+MIN_PRECISION = 4
+MAX_PRECISION = 18
+# 2^14 registers, about 0.8% standard error
+DEFAULT_PRECISION = 14
+
+
+def precision_for_error(error:float) -> int:
+    """
+    Returns the precision, whose standard error 1.04 / sqrt(2^precision) does not exceed the given error.
+    Parameters:
+        error (float): Relative standard error, e.g. 0.01
+    Returns:
+        result (int): Precision between MIN_PRECISION and MAX_PRECISION
+    """
+    if error <= 0:
+        raise ValueError(f"The error has to be positive, got {error}")
+    precision = math.ceil(2 * math.log2(1.04 / error))
+    return min(max(precision, MIN_PRECISION), MAX_PRECISION)
+
+
+def bit_length(values:np.ndarray) -> np.ndarray:
+    """
+    Returns the number of bits needed to represent each unsigned integer, 0 for 0.
+    Parameters:
+        values (np.ndarray): uint64 values
+    Returns:
+        result (np.ndarray): Bit lengths
+    """
+    values = values.astype(np.uint64, copy=True)
+    lengths = np.zeros(len(values), dtype=np.uint8)
+    for shift in (32, 16, 8, 4, 2, 1):
+        larger = values >= np.uint64(1 << shift)
+        lengths[larger] += shift
+        values[larger] >>= np.uint64(shift)
+    return lengths + (values > 0)
+
+
+def hash_values(values) -> np.ndarray:
+    """
+    Hashes values into 64 bit integers. The hash only depends on the value, so sketches of different processes can be merged.
+    Parameters:
+        values (Iterable): Values, e.g. user names
+    Returns:
+        result (np.ndarray): uint64 hashes
+    """
+    return pd.util.hash_array(np.asarray(values, dtype=object))
+
+
+def registers_of(hashes:np.ndarray, precision:int) -> tuple:
+    """
+    Splits hashes into the register index (first bits) and the rank (position of the first 1 bit of the remaining bits).
+    Parameters:
+        hashes (np.ndarray): uint64 hashes
+        precision (int): Number of index bits
+    Returns:
+        result (tuple): Register indexes and ranks
+    """
+    remaining_bits = 64 - precision
+    indexes = (hashes >> np.uint64(remaining_bits)).astype(np.int64)
+    remainders = hashes & np.uint64((1 << remaining_bits) - 1)
+    ranks = (remaining_bits + 1 - bit_length(remainders)).astype(np.uint8)
+    return indexes, ranks
+
+
+class HyperLogLog:
+    """
+    Approximate distinct count of values in 2^precision one byte registers. Sketches of the same values
+    are mergeable, e.g. the sketches of several days give the distinct count of the whole period.
+    """
+    precision:int
+    registers:np.ndarray
+
+
+    def __init__(self, precision:int = DEFAULT_PRECISION, registers:np.ndarray = None):
+        """
+        Parameters:
+            precision (int): Number of index bits, the standard error is 1.04 / sqrt(2^precision)
+            registers (np.ndarray): Registers of an existing sketch
+        """
+        if not MIN_PRECISION <= precision <= MAX_PRECISION:
+            raise ValueError(f"The precision has to be between {MIN_PRECISION} and {MAX_PRECISION}, got {precision}")
+        self.precision = precision
+        self.registers = registers if registers is not None else np.zeros(1 << precision, dtype=np.uint8)
+
+
+    def add(self, values) -> 'HyperLogLog':
+        """
+        Adds values to the sketch.
+        Parameters:
+            values (Iterable): Values
+        Returns:
+            result (HyperLogLog): The sketch
+        """
+        indexes, ranks = registers_of(hash_values(values), self.precision)
+        np.maximum.at(self.registers, indexes, ranks)
+        return self
+
+
+    def reduce(self, precision:int) -> 'HyperLogLog':
+        """
+        Converts the sketch to a lower precision, as if the values had been added to a sketch of that precision.
+        Parameters:
+            precision (int): Target precision
+        Returns:
+            result (HyperLogLog): New sketch, or this sketch if it has the precision already
+        """
+        if precision == self.precision:
+            return self
+        if precision > self.precision:
+            raise ValueError(f"A sketch of precision {self.precision} can not be raised to {precision}")
+        dropped_bits = self.precision - precision
+        indexes = np.arange(len(self.registers), dtype=np.uint64)
+        # The dropped index bits become the first bits of the remainder
+        dropped = indexes & np.uint64((1 << dropped_bits) - 1)
+        ranks = np.where(dropped > 0, dropped_bits + 1 - bit_length(dropped).astype(np.int64), self.registers.astype(np.int64) + dropped_bits)
+        ranks = np.where(self.registers > 0, ranks, 0).astype(np.uint8)
+        registers = np.zeros(1 << precision, dtype=np.uint8)
+        np.maximum.at(registers, (indexes >> np.uint64(dropped_bits)).astype(np.int64), ranks)
+        return HyperLogLog(precision, registers)
+
+
+    def merge(self, other:'HyperLogLog') -> 'HyperLogLog':
+        """
+        Merges another sketch into this one. Sketches of different precision are merged at the lower precision.
+        Parameters:
+            other (HyperLogLog): Sketch to merge
+        Returns:
+            result (HyperLogLog): The merged sketch
+        """
+        if other.precision < self.precision:
+            reduced = self.reduce(other.precision)
+            self.precision, self.registers = reduced.precision, reduced.registers
+        np.maximum(self.registers, other.reduce(self.precision).registers, out=self.registers)
+        return self
+
+
+    def count(self) -> int:
+        """
+        Estimates the number of distinct values.
+        Returns:
+            result (int): Estimated distinct count
+        """
+        m = len(self.registers)
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        empty_registers = int(np.count_nonzero(self.registers == 0))
+        # Linear counting is more accurate for small cardinalities
+        if estimate <= 2.5 * m and empty_registers:
+            estimate = m * math.log(m / empty_registers)
+        return int(round(estimate))
+
+
+    def to_bytes(self) -> bytes:
+        """
+        Serializes the sketch, e.g. to store it as blob.
+        Returns:
+            result (bytes): Precision and compressed registers
+        """
+        return struct.pack('B', self.precision) + zlib.compress(self.registers.tobytes())
+
+
+    @classmethod
+    def from_bytes(cls, data:bytes) -> 'HyperLogLog':
+        """
+        Deserializes a sketch created by to_bytes.
+        Parameters:
+            data (bytes): Serialized sketch
+        Returns:
+            result (HyperLogLog): Sketch
+        """
+        precision = data[0]
+        registers = np.frombuffer(zlib.decompress(data[1:]), dtype=np.uint8).copy()
+        return cls(precision, registers)
+
+
+def sketch_groups(keys, values, precision:int = DEFAULT_PRECISION) -> dict:
+    """
+    Builds one sketch per key, e.g. the users of each day, hashing all values at once.
+    Parameters:
+        keys (Iterable): Group key of each value
+        values (Iterable): Values
+        precision (int): Precision of the sketches
+    Returns:
+        result (dict): key -> HyperLogLog
+    """
+    codes, uniques = pd.factorize(np.asarray(keys))
+    indexes, ranks = registers_of(hash_values(values), precision)
+    registers = np.zeros((len(uniques), 1 << precision), dtype=np.uint8)
+    np.maximum.at(registers, (codes, indexes), ranks)
+    return { key: HyperLogLog(precision, registers[code]) for code, key in enumerate(uniques) }
+
+
+class MergeAggregate:
+    """
+    SQLite aggregate, that merges sketch blobs into one sketch blob.
+    """
+
+    def __init__(self):
+        self.sketch = None
+
+
+    def step(self, data:bytes):
+        if data is None:
+            return
+        sketch = HyperLogLog.from_bytes(data)
+        self.sketch = sketch if self.sketch is None else self.sketch.merge(sketch)
+
+
+    def finalize(self):
+        return self.sketch.to_bytes() if self.sketch is not None else None
+
+
+class CountAggregate(MergeAggregate):
+    """
+    SQLite aggregate, that estimates the distinct count of the merged sketch blobs.
+    """
+
+    def finalize(self):
+        return self.sketch.count() if self.sketch is not None else 0
+
+
+def register(conn:sqlite3.Connection):
+    """
+    Registers the hll_merge(sketch) and hll_count(sketch) aggregates on a connection.
+    Parameters:
+        conn (sqlite3.Connection): Database connection
+    """
+    conn.create_aggregate('hll_merge', 1, MergeAggregate)
+    conn.create_aggregate('hll_count', 1, CountAggregate)
@@ -0,0 +1,346 @@
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+STAGE_FIELDS = ('calls', 'seconds', 'rows_in', 'rows_out', 'invalid_rows')
+# Seconds between two samples of the resident set size of a running stage
+RSS_SAMPLE_SECONDS = 0.01
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def new_stage() -> dict:
+    """
+    Returns the metrics of a stage, that has not run yet. The STAGE_FIELDS are summed up over the runs, 
+    the peak RSS is the maximum.
+    Returns:
+        result (dict): Stage metrics
+    """
+    return dict.fromkeys(STAGE_FIELDS + ('peak_rss_kb',), 0)
+
+
+def process_peak_rss_kb() -> int:
+    """
+    Returns the peak resident set size of the current process since it has been started.
+    Returns:
+        result (int): Peak RSS in KiB
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux KiB
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def current_rss_kb() -> int:
+    """
+    Returns the resident set size of the current process. Only Linux reports it, elsewhere the peak since the start 
+    of the process is returned, see process_peak_rss_kb.
+    Returns:
+        result (int): RSS in KiB
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * PAGE_SIZE // 1024
+    except (OSError, IndexError, ValueError):
+        return process_peak_rss_kb()
+
+
+class RssSampler:
+    """
+    Samples the resident set size of the process in a background thread and keeps the peak of every open window. 
+    Windows of stages, that run at the same time in different threads, are independent, none of them resets the others.
+    The peak misses spikes shorter than the sample interval.
+    """
+    interval:float
+    windows:dict
+
+
+    def __init__(self, interval:float = RSS_SAMPLE_SECONDS):
+        """
+        Parameters:
+            interval (float): Seconds between two samples
+        """
+        self.interval = interval
+        self.windows = {}
+        self._next_window = 0
+        self._thread = None
+        self._condition = threading.Condition()
+
+
+    def open(self) -> int:
+        """
+        Opens a window, that records the peak from now on.
+        Returns:
+            result (int): Window id
+        """
+        rss = current_rss_kb()
+        with self._condition:
+            self._next_window += 1
+            self.windows[self._next_window] = rss
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample, name='rss-sampler', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+            return self._next_window
+
+
+    def close(self, window:int) -> int:
+        """
+        Closes a window.
+        Parameters:
+            window (int): Window id
+        Returns:
+            result (int): Peak RSS in KiB while the window was open
+        """
+        rss = current_rss_kb()
+        with self._condition:
+            return max(self.windows.pop(window), rss)
+
+
+    def _sample(self):
+        """
+        Updates the peaks of the open windows, it sleeps while no window is open.
+        """
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self.windows)
+            time.sleep(self.interval)
+            rss = current_rss_kb()
+            with self._condition:
+                for window, peak in self.windows.items():
+                    self.windows[window] = max(peak, rss)
+
+
+# Samples the RSS of the stages of this process
+rss_sampler = RssSampler()
+
+
+class FileMetrics:
+    """
+    Wall time, row counts and memory of the pipeline stages of one file. Stages, that run several times
+    (e.g. once per chunk), are summed up, except their peak RSS, which is the maximum of the runs. The peak RSS of a stage
+    is the peak of the process while the stage runs, sampled by the rss_sampler, so it includes the memory of other threads
+    of the process. Outside of Linux it is the peak of the process since it has been started. The metrics can be sent 
+    to another process together with the data.
+    """
+    src_path:str
+    bytes_read:int
+    stages:dict
+    status:str
+    started_at:float
+    seconds:float
+    peak_rss_kb:int
+    frame_bytes:int
+    compact_bytes:int
+
+
+    def __init__(self, src_path:str):
+        """
+        Parameters:
+            src_path (str): File source path
+        """
+        self.src_path = src_path
+        self.bytes_read = 0
+        self.stages = {}
+        self.status = None
+        self.started_at = time.time()
+        self.seconds = None
+        self.peak_rss_kb = 0
+        self.frame_bytes = 0
+        self.compact_bytes = 0
+
+
+    @contextmanager
+    def stage(self, name:str):
+        """
+        Times a stage. The caller fills in the row counts of the yielded dict.
+        Parameters:
+            name (str): Stage name
+        """
+        counts = {}
+        window = rss_sampler.open()
+        start = time.perf_counter()
+        try:
+            yield counts
+        finally:
+            seconds = time.perf_counter() - start
+            self.add(name, seconds, peak_rss_kb=rss_sampler.close(window), **counts)
+
+
+    def add(self, name:str, seconds:float, rows_in:int = 0, rows_out:int = 0, invalid_rows:int = 0, peak_rss_kb:int = 0):
+        """
+        Adds one run of a stage.
+        Parameters:
+            name (str): Stage name
+            seconds (float): Wall time
+            rows_in (int): Rows passed into the stage
+            rows_out (int): Rows returned by the stage
+            invalid_rows (int): Rows rejected by the stage
+            peak_rss_kb (int): Peak RSS in KiB while the stage ran, see RssSampler, 0 if it has not been measured
+        """
+        stage = self.stages.setdefault(name, new_stage())
+        stage['calls'] += 1
+        stage['seconds'] += seconds
+        stage['rows_in'] += rows_in
+        stage['rows_out'] += rows_out
+        stage['invalid_rows'] += invalid_rows
+        stage['peak_rss_kb'] = max(stage['peak_rss_kb'], peak_rss_kb)
+        self.peak_rss_kb = max(self.peak_rss_kb, peak_rss_kb)
+
+
+    def merge(self, other:'FileMetrics'):
+        """
+        Adds the metrics of the same file, that another process has collected, e.g. the stages of a worker process.
+        Their stages come first.
+        Parameters:
+            other (FileMetrics): Metrics of the other process
+        """
+        self.started_at = min(self.started_at, other.started_at)
+        self.bytes_read += other.bytes_read
+        stages = { name: dict(stage) for name, stage in other.stages.items() }
+        for name, own_stage in self.stages.items():
+            stage = stages.setdefault(name, new_stage())
+            for field in STAGE_FIELDS:
+                stage[field] += own_stage[field]
+            stage['peak_rss_kb'] = max(stage['peak_rss_kb'], own_stage['peak_rss_kb'])
+        self.stages = stages
+        self.peak_rss_kb = max(self.peak_rss_kb, other.peak_rss_kb)
+        self.add_memory(other.frame_bytes, other.compact_bytes)
+
+
+    def add_memory(self, frame_bytes:int, compact_bytes:int):
+        """
+        Adds the memory of one transformed batch, before and after its dtypes have been compacted.
+        Parameters:
+            frame_bytes (int): Bytes of the transformed batch
+            compact_bytes (int): Bytes of the compact batch
+        """
+        self.frame_bytes += frame_bytes
+        self.compact_bytes += compact_bytes
+
+
+    def finish(self, status:str) -> 'FileMetrics':
+        """
+        Completes the metrics of the file.
+        Parameters:
+            status (str): Processing status
+        Returns:
+            result (FileMetrics): The metrics
+        """
+        self.status = status
+        self.seconds = time.time() - self.started_at
+        self.peak_rss_kb = max(self.peak_rss_kb, current_rss_kb())
+        return self
+
+
+class MetricsSink:
+    """
+    Receives the metrics of every processed file. The base sink drops them.
+    """
+
+    def emit(self, metrics:FileMetrics):
+        """
+        Parameters:
+            metrics (FileMetrics): Metrics of a processed file
+        """
+        pass
+
+
+class LogSink(MetricsSink):
+    """
+    Prints one line per file and stage.
+    """
+
+    def emit(self, metrics:FileMetrics):
+        print(f"{datetime.now()} - {metrics.src_path} {metrics.status} in {metrics.seconds:.3f}s, "
+              f"{metrics.bytes_read} bytes read, peak RSS {metrics.peak_rss_kb} KiB, "
+              f"batches compacted from {metrics.frame_bytes} to {metrics.compact_bytes} bytes")
+        for name, stage in metrics.stages.items():
+            rows_per_s = stage['rows_in'] / stage['seconds'] if stage['seconds'] else 0
+            # Parts of a stage, e.g. the tables of the load, are not sampled on their own
+            peak = f", peak RSS {stage['peak_rss_kb']} KiB" if stage['peak_rss_kb'] else ''
+            print(f"    {name}: {stage['seconds']:.3f}s, {stage['rows_in']} rows in, {stage['rows_out']} rows out, "
+                  f"{stage['invalid_rows']} invalid ({rows_per_s:.0f} rows/s){peak}")
+
+
+class TextFileSink(MetricsSink):
+    """
+    Appends one 'key=value' line per file and stage to a local text file.
+    """
+    path:str
+
+
+    def __init__(self, path:str):
+        """
+        Parameters:
+            path (str): Metrics file
+        """
+        self.path = path
+        self._lock = threading.Lock()
+
+
+    def emit(self, metrics:FileMetrics):
+        timestamp = datetime.now().isoformat()
+        src_path = os.path.basename(metrics.src_path)
+        lines = [f"ts={timestamp} file={src_path} stage=file status={metrics.status} seconds={metrics.seconds:.6f} "
+                 f"bytes_read={metrics.bytes_read} peak_rss_kb={metrics.peak_rss_kb} "
+                 f"frame_bytes={metrics.frame_bytes} compact_bytes={metrics.compact_bytes}\n"]
+        for name, stage in metrics.stages.items():
+            values = " ".join(f"{field}={stage[field]:.6f}" if field == 'seconds' else f"{field}={stage[field]}" for field in STAGE_FIELDS)
+            lines.append(f"ts={timestamp} file={src_path} stage={name} {values} peak_rss_kb={stage['peak_rss_kb']}\n")
+        with self._lock:
+            with open(self.path, 'a') as metrics_file:
+                metrics_file.writelines(lines)
+
+
+class RegistrySink(MetricsSink):
+    """
+    Keeps running totals in memory, per stage and per status, e.g. to be read by a monitoring thread.
+    """
+    stages:dict
+    files:dict
+    bytes_read:int
+    peak_rss_kb:int
+    frame_bytes:int
+    compact_bytes:int
+
+
+    def __init__(self):
+        self.stages = {}
+        self.files = {}
+        self.bytes_read = 0
+        self.peak_rss_kb = 0
+        self.frame_bytes = 0
+        self.compact_bytes = 0
+        self._lock = threading.Lock()
+
+
+    def emit(self, metrics:FileMetrics):
+        with self._lock:
+            self.files[metrics.status] = self.files.get(metrics.status, 0) + 1
+            self.bytes_read += metrics.bytes_read
+            self.peak_rss_kb = max(self.peak_rss_kb, metrics.peak_rss_kb)
+            self.frame_bytes += metrics.frame_bytes
+            self.compact_bytes += metrics.compact_bytes
+            for name, stage in metrics.stages.items():
+                totals = self.stages.setdefault(name, new_stage())
+                for field in STAGE_FIELDS:
+                    totals[field] += stage[field]
+                totals['peak_rss_kb'] = max(totals['peak_rss_kb'], stage['peak_rss_kb'])
+
+
+    def snapshot(self) -> dict:
+        """
+        Returns a copy of the totals.
+        Returns:
+            result (dict): Files by status, bytes read, peak RSS, batch memory and totals by stage
+        """
+        with self._lock:
+            return { 'files': dict(self.files), 
+                     'bytes_read': self.bytes_read, 
+                     'peak_rss_kb': self.peak_rss_kb,
+                     'frame_bytes': self.frame_bytes,
+                     'compact_bytes': self.compact_bytes,
+                     'stages': { name: dict(totals) for name, totals in self.stages.items() } }
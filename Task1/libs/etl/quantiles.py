@@ -0,0 +1,103 @@
+import numpy as np
+
+# Items kept per level, tables with fewer values get exact quantiles
+DEFAULT_CAPACITY = 2048
+
+
+class QuantileSketch:
+    """
+    Streaming quantile sketch of numbers, a KLL like stack of compactors. Level i keeps items, that stand for 2^i values each.
+    A full level is sorted and every second item moves up a level, so the sketch keeps about capacity items per level
+    and the rank error of a quantile is a small fraction of the count. Sketches of the same column are mergeable.
+    """
+    capacity:int
+    levels:list
+    count:int
+    rng:np.random.Generator
+
+
+    def __init__(self, capacity:int = DEFAULT_CAPACITY, seed:int = 0):
+        """
+        Parameters:
+            capacity (int): Items per level, the rank error shrinks with the capacity
+            seed (int): Seed of the compaction offsets
+        """
+        if capacity < 2:
+            raise ValueError(f"The capacity has to be at least 2, got {capacity}")
+        self.capacity = capacity
+        self.levels = [np.empty(0, dtype=np.float64)]
+        self.count = 0
+        self.rng = np.random.default_rng(seed)
+
+
+    def add(self, values) -> 'QuantileSketch':
+        """
+        Adds numbers to the sketch, NaN values are skipped.
+        Parameters:
+            values (Iterable): Numbers
+        Returns:
+            result (QuantileSketch): The sketch
+        """
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        self.count += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compact()
+        return self
+
+
+    def merge(self, other:'QuantileSketch') -> 'QuantileSketch':
+        """
+        Merges another sketch into this one.
+        Parameters:
+            other (QuantileSketch): Sketch to merge
+        Returns:
+            result (QuantileSketch): The merged sketch
+        """
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0, dtype=np.float64))
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self._compact()
+        return self
+
+
+    def quantiles(self, qs) -> np.ndarray:
+        """
+        Estimates quantiles. As long as no level was compacted, the quantiles are exact and interpolated like pandas does.
+        Parameters:
+            qs (Iterable): Quantiles between 0 and 1
+        Returns:
+            result (np.ndarray): Estimated values, NaN for an empty sketch
+        """
+        qs = np.asarray(qs, dtype=np.float64)
+        if self.count == 0:
+            return np.full(len(qs), np.nan)
+        if len(self.levels) == 1:
+            return np.quantile(self.levels[0], qs)
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level_items), 2.0 ** level) for level, level_items in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        items, ranks = items[order], np.cumsum(weights[order])
+        positions = np.searchsorted(ranks, qs * (ranks[-1] - 1) + 1, side='left')
+        return items[np.minimum(positions, len(items) - 1)]
+
+
+    def _compact(self):
+        """
+        Halves every level above its capacity, from the lowest level up.
+        """
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self.capacity:
+                items = np.sort(items)
+                # An odd item stays on its level
+                odd = len(items) % 2
+                self.levels[level] = items[len(items) - odd:]
+                promoted = items[self.rng.integers(2):len(items) - odd:2]
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0, dtype=np.float64))
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
@@ -0,0 +1,227 @@
+import gzip
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Iterable
+import pandas as pd
+
+CREATE_INDEX_STATEMENT = """
+CREATE TABLE IF NOT EXISTS quarantined_row(
+    id INTEGER PRIMARY KEY,
+    source_file VARCHAR NOT NULL,
+    row_number INTEGER NOT NULL,
+    failures VARCHAR NOT NULL,
+    segment VARCHAR NOT NULL,
+    line INTEGER NOT NULL,
+    quarantined_at VARCHAR NOT NULL,
+    replayed_at VARCHAR
+);
+CREATE INDEX IF NOT EXISTS quarantined_row_source_file ON quarantined_row(source_file);
+CREATE INDEX IF NOT EXISTS quarantined_row_segment ON quarantined_row(segment, line);
+"""
+
+
+class QuarantineStore:
+    """
+    Append-only store of rejected rows. The rows are buffered and appended in batches to rotating JSON lines segments,
+    each row with its source file, row number and validation failures. A SQLite index points to the segment and line
+    of every row, so quarantined rows can be queried and replayed in bulk. Every process writes its own segments.
+    """
+    path:str
+    segment_max_bytes:int
+    compress:bool
+    batch_size:int
+
+
+    def __init__(self, path:str, segment_max_bytes:int = 64 * 1024**2, compress:bool = False, batch_size:int = 10000):
+        """
+        Parameters:
+            path (str): Quarantine folder, it is created if it does not exist
+            segment_max_bytes (int): Size, at which a new segment is started
+            compress (bool): Write gzip compressed segments
+            batch_size (int): Number of buffered rows, at which the buffer is written
+        """
+        self.path = path
+        self.segment_max_bytes = segment_max_bytes
+        self.compress = compress
+        self.batch_size = batch_size
+        self._buffer = []
+        self._segment = None
+        self._lines = 0
+        self._conn = None
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+
+    def __getstate__(self) -> dict:
+        """
+        Leaves out the buffer, the connection and the lock, when the store is sent to a worker process.
+        """
+        state = self.__dict__.copy()
+        state.update(_buffer=[], _segment=None, _lines=0, _conn=None)
+        del state['_lock']
+        return state
+
+
+    def __setstate__(self, state:dict):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+    def connection(self) -> sqlite3.Connection:
+        """
+        Returns the connection to the index, opened on first use.
+        Returns:
+            conn (sqlite3.Connection): Index connection
+        """
+        if self._conn is None:
+            self._conn = sqlite3.connect(os.path.join(self.path, 'index.db'), timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(CREATE_INDEX_STATEMENT)
+        return self._conn
+
+
+    def add(self, df:pd.DataFrame, source_file, row_numbers:list, failures:pd.Series):
+        """
+        Buffers rejected rows and writes the buffer, once it holds batch_size rows.
+        Parameters:
+            df (pd.DataFrame): Rejected rows
+            source_file (str | list): File the rows come from, or the file of each row, e.g. of replayed rows
+            row_numbers (list): Position of each row in its source file
+            failures (pd.Series): Validation failures of each row, indexed like df
+        """
+        if df.empty:
+            return
+        records = json.loads(df.to_json(orient='records'))
+        if isinstance(source_file, str):
+            source_files = [os.path.basename(source_file)] * len(records)
+        else:
+            source_files = [os.path.basename(row_source_file) for row_source_file in source_file]
+        with self._lock:
+            for record, row_source_file, row_number, row_failures in zip(records, source_files, row_numbers, failures.reindex(df.index)):
+                self._buffer.append({ 'source_file': row_source_file, 
+                                      'row_number': int(row_number), 
+                                      'failures': row_failures if isinstance(row_failures, list) else [], 
+                                      'record': record })
+            if len(self._buffer) >= self.batch_size:
+                self._write()
+
+
+    def flush(self):
+        """
+        Writes the buffered rows.
+        """
+        with self._lock:
+            self._write()
+
+
+    def _write(self):
+        """
+        Appends the buffer to the current segment and indexes the rows in one transaction.
+        """
+        if not self._buffer:
+            return
+        conn = self.connection()
+        segment = self._current_segment()
+        quarantined_at = datetime.now().isoformat()
+        opener = gzip.open if self.compress else open
+        with opener(os.path.join(self.path, segment), 'at') as segment_file:
+            segment_file.writelines(json.dumps(row) + '\n' for row in self._buffer)
+        with conn:
+            conn.executemany("""INSERT INTO quarantined_row (source_file, row_number, failures, segment, line, quarantined_at) 
+                                VALUES(?,?,?,?,?,?)""",
+                             [(row['source_file'], row['row_number'], json.dumps(row['failures']), segment, self._lines + line, quarantined_at)
+                              for line, row in enumerate(self._buffer)])
+        self._lines += len(self._buffer)
+        self._buffer = []
+
+
+    def _current_segment(self) -> str:
+        """
+        Returns the segment to append to and starts a new one, if the current one is full.
+        Returns:
+            result (str): Segment file name
+        """
+        if self._segment is None or os.path.getsize(os.path.join(self.path, self._segment)) >= self.segment_max_bytes:
+            suffix = '.jsonl.gz' if self.compress else '.jsonl'
+            self._segment = f"segment_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S_%f')}_{os.getpid()}{suffix}"
+            self._lines = 0
+        return self._segment
+
+
+    def query(self, source_file:str = None, failure:str = None, replayed:bool = False, limit:int = None) -> pd.DataFrame:
+        """
+        Searches the index for quarantined rows.
+        Parameters:
+            source_file (str): Only rows of this file
+            failure (str): Only rows, whose failures contain this text, e.g. a column name
+            replayed (bool): Include rows, that have already been replayed
+            limit (int): Maximum number of rows
+        Returns:
+            result (pd.DataFrame): Index entries
+        """
+        self.flush()
+        conditions = []
+        parameters = []
+        if source_file is not None:
+            conditions.append("source_file = ?")
+            parameters.append(os.path.basename(source_file))
+        if failure is not None:
+            conditions.append("instr(failures, ?) > 0")
+            parameters.append(failure)
+        if not replayed:
+            conditions.append("replayed_at IS NULL")
+        sql = "SELECT * FROM quarantined_row"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY id"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return pd.read_sql_query(sql, self.connection(), params=parameters)
+
+
+    def read(self, entries:pd.DataFrame) -> pd.DataFrame:
+        """
+        Reads the quarantined rows of index entries, one pass per segment.
+        Parameters:
+            entries (pd.DataFrame): Index entries, see query
+        Returns:
+            result (pd.DataFrame): Rejected rows with their original columns, in the order of the entries and indexed by the entry id
+        """
+        records = {}
+        for segment, segment_entries in entries.groupby('segment'):
+            lines = dict(zip(segment_entries['line'], segment_entries['id']))
+            opener = gzip.open if segment.endswith('.gz') else open
+            with opener(os.path.join(self.path, segment), 'rt') as segment_file:
+                for line, row in enumerate(segment_file):
+                    if line in lines:
+                        records[lines[line]] = json.loads(row)['record']
+        entry_ids = [entry_id for entry_id in entries['id'] if entry_id in records]
+        return pd.DataFrame([records[entry_id] for entry_id in entry_ids], index=pd.Index(entry_ids, name='id'))
+
+
+    def mark_replayed(self, entry_ids:Iterable):
+        """
+        Marks quarantined rows as replayed, once they have been loaded or quarantined again.
+        Parameters:
+            entry_ids (Iterable): Entry ids of the rows
+        """
+        with self._lock:
+            conn = self.connection()
+            with conn:
+                replayed_at = datetime.now().isoformat()
+                conn.executemany("UPDATE quarantined_row SET replayed_at = ? WHERE id = ?", 
+                                 [(replayed_at, int(entry_id)) for entry_id in entry_ids])
+
+
+    def close(self):
+        """
+        Writes the buffered rows and closes the index connection.
+        """
+        self.flush()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
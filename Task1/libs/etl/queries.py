@@ -0,0 +1,582 @@
+import sqlite3
+from functools import lru_cache
+import pandas as pd
+from libs.etl import hyperloglog
+from libs.etl.release_cache import UNKNOWN_RELEASE_MSID
+
+# Prepared statements kept per connection. Every query text is built the same way for the same filters,
+# so it is prepared once and reused with new parameters.
+STATEMENT_CACHE_SIZE = 256
+# Filters of the time dimension and their predicates, {year}, {week} and {date} are the columns of the scanned table
+TIME_PREDICATES = {
+    'year': '{year} = :year',
+    'week': '{week} = :week',
+    'start_date': '{date} >= :start_date',
+    'end_date': '{date} <= :end_date',
+}
+STREAM_TIME_COLUMNS = { 'year': 't.year', 'week': 't.week', 'date': 't.date' }
+ROLLUP_COLUMNS = { 'year': 'year', 'week': 'week', 'date': 'date' }
+STREAM_TIME_JOIN = "stream s INNER JOIN time t ON s.timestamp_unix_id == t.timestamp_unix_id"
+DIMENSIONS = ('track', 'artist', 'release')
+# Weekly streams per track, artist and release and the columns to filter them by
+CHART_SOURCES = {
+    'track': {
+        'select': "year, week, track_msid AS msid, artist_msid, streams",
+        'from': "rollup_track_week",
+        'columns': { 'year': 'year', 'week': 'week', 'msid': 'track_msid' },
+        'predicates': (),
+        'group_by': None,
+    },
+    'artist': {
+        'select': "year, week, artist_msid AS msid, artist_msid, streams",
+        'from': "rollup_artist_week",
+        'columns': { 'year': 'year', 'week': 'week', 'msid': 'artist_msid' },
+        'predicates': (),
+        'group_by': None,
+    },
+    'release': {
+        'select': "year, week, release_msid AS msid, artist_msid, SUM(streams) AS streams",
+        'from': "rollup_release_week",
+        'columns': { 'year': 'year', 'week': 'week', 'msid': 'release_msid' },
+        'predicates': ("release_msid != :unknown_release",),
+        'group_by': "release_msid, year, week",
+    },
+}
+# Names and columns of the chart results
+CHART_OUTPUTS = {
+    'track': {
+        'joins': "INNER JOIN track tr ON c.msid == tr.track_msid INNER JOIN artist a ON c.artist_msid == a.artist_msid",
+        'columns': "(tr.track_name || ' ('|| a.artist_name|| ')') AS track_name",
+    },
+    'artist': {
+        'joins': "INNER JOIN artist a ON c.msid == a.artist_msid",
+        'columns': "a.artist_name",
+    },
+    'release': {
+        'joins': "INNER JOIN release r ON c.msid == r.release_msid INNER JOIN artist a ON c.artist_msid == a.artist_msid",
+        'columns': "r.release_name, a.artist_name",
+    },
+}
+
+
+def connect(db_path:str) -> sqlite3.Connection:
+    """
+    Opens a database connection for the analyses, that keeps STATEMENT_CACHE_SIZE prepared statements.
+    Parameters:
+        db_path (str): Path of the database
+    Returns:
+        result (sqlite3.Connection): Database connection
+    """
+    conn = sqlite3.connect(db_path, cached_statements=STATEMENT_CACHE_SIZE)
+    hyperloglog.register(conn)
+    return conn
+
+
+def time_filter(year = None, week = None, start_date:str = None, end_date:str = None) -> tuple:
+    """
+    Collects the given time filters. The names of the filters select the query text, the values are bound as parameters.
+    Parameters:
+        year (int): Year
+        week (int): Calendar week, requires the year
+        start_date (str): First date. Format YYYY-MM-DD.
+        end_date (str): Last date. Format YYYY-MM-DD.
+    Returns:
+        result (tuple): Names of the filters and parameters
+    """
+    if week is not None and year is None:
+        raise ValueError("A week filter requires the year")
+    params = { 'year': int(year) if year is not None else None, 'week': int(week) if week is not None else None,
+               'start_date': start_date, 'end_date': end_date }
+    params = { name: value for name, value in params.items() if value is not None }
+    return tuple(name for name in TIME_PREDICATES if name in params), params
+
+
+def where(filters:tuple, columns:dict, predicates:tuple = ()) -> str:
+    """
+    Builds the WHERE clause of fixed predicates and time filters.
+    Parameters:
+        filters (tuple): Names of the time filters
+        columns (dict): Year, week and date column of the scanned table
+        predicates (tuple): Further predicates
+    Returns:
+        result (str): WHERE clause, empty without predicates
+    """
+    predicates = list(predicates) + [TIME_PREDICATES[name].format(**columns) for name in filters]
+    return f"WHERE {' AND '.join(predicates)}" if predicates else ""
+
+
+def read(conn:sqlite3.Connection, sql:str, params:dict = None) -> pd.DataFrame:
+    """
+    Runs a query with bound parameters.
+    Parameters:
+        conn (sqlite3.Connection): Database connection
+        sql (str): Query text
+        params (dict): Named parameters
+    Returns:
+        result (pd.DataFrame): Query result
+    """
+    return pd.read_sql_query(sql, conn, params=params or {})
+
+
+def table_columns(conn:sqlite3.Connection, table:str) -> list:
+    """
+    Returns the columns of a table. Table and column names can't be bound, so they are checked against the schema.
+    Parameters:
+        conn (sqlite3.Connection): Database connection
+        table (str): Name of the table
+    Returns:
+        result (list): Column names
+    """
+    columns = [row[0] for row in conn.execute("SELECT name FROM pragma_table_info(?)", (table,))]
+    if not columns:
+        raise ValueError(f"Unknown table {table}")
+    return columns
+
+
+def check_columns(conn:sqlite3.Connection, table:str, columns) -> list:
+    """
+    Checks, that the columns belong to the table.
+    Parameters:
+        conn (sqlite3.Connection): Database connection
+        table (str): Name of the table
+        columns (Iterable): Column names
+    Returns:
+        result (list): Column names
+    """
+    known_columns = table_columns(conn, table)
+    unknown_columns = [column for column in columns if column not in known_columns]
+    if unknown_columns:
+        raise ValueError(f"Unknown columns {unknown_columns} of table {table}")
+    return list(columns)
+
+
+def check_dimension(dimension:str) -> str:
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"Unknown dimension {dimension}, expected one of {DIMENSIONS}")
+    return dimension
+
+
+def total_entries(conn:sqlite3.Connection, exact:bool = False) -> pd.DataFrame:
+    """
+    Queries the total entries of users, streams, artists, releases and tracks.
+    Parameters:
+        conn (sqlite3.Connection): Database connection
+        exact (bool): Count the users exactly instead of merging the daily user sketches
+    Returns:
+        result (pd.DataFrame): user_count, stream_count, artist_count, release_count, track_count
+    """
+    hyperloglog.register(conn)
+    return read(conn, total_entries_statement(exact))
+
+
+@lru_cache(maxsize=None)
+def total_entries_statement(exact:bool) -> str:
+    user_count = "SELECT COUNT( DISTINCT user_name) FROM stream" if exact else "SELECT COALESCE(hll_count(sketch), 0) FROM user_sketch"
+    return f"""
+            SELECT  ({user_count}) AS user_count,
+                    (SELECT COUNT(1) FROM stream) AS stream_count,
+                    (SELECT COUNT(1) FROM artist) AS artist_count,
+                    (SELECT COUNT(1) FROM release) AS release_count,
+                    (SELECT COUNT(1) FROM track) AS track_count"""
+
+
+def null_percentages(conn:sqlite3.Connection, table:str, columns:list) -> pd.DataFrame:
+    """
+    Queries the percentage of null values of columns in one scan of the table.
+    Parameters:
+        conn (sqlite3.Connection): Database connection
+        table (str): Name of the table
+        columns (list): Columns of the table
+    Returns:
+        result (pd.DataFrame): One row with the percentage, formatted with 3 decimals, per column
+    """
+    columns = check_columns(conn, table, columns)
+    percentages = ", ".join(f'printf(\'%.3f\', 100.0*(COUNT(*)-COUNT("{column}"))/COUNT(*)) AS "{column}"' for column in columns)
+    return read(conn, f'SELECT {percentages} FROM "{table}"')
+
+
+def entire_table(conn:sqlite3.Connection, table:str) -> pd.DataFrame:
+    """
+    Queries all rows of a table.
+    Parameters:
+        conn (sqlite3.Connection): Database connection
+        table (str): Name of the table
+    Returns:
+        result (pd.DataFrame): Rows of the table
+    """
+    table_columns(conn, table)
+    return read(conn, f'SELECT * FROM "{table}"')
+
+
+def active_users_by_weekday(conn:sqlite3.Connection, year = None, week = None, start_date:str = None, end_date:str = None,
+                            exact:bool = False) -> pd.DataFrame:
+    """
+    Queries the active users of each day, distributed over calendar weeks and weekdays.
+    Parameters:
+        conn (sqlite3.Connection): Database connection
+        year (int): Only days of the year
+        week (int): Only days of the calendar week of the year
+        start_date (str): Only days from this date on. Format YYYY-MM-DD.
+        end_date (str): Only days up to this date. Format YYYY-MM-DD.
+        exact (bool): Count the users exactly instead of reading the daily user sketches
+    Returns:
+        result (pd.DataFrame): active_user, week, weekday, day_of_week, year
+    """
+    filters, params = time_filter(year, week, start_date, end_date)
+    hyperloglog.register(conn)
+    return read(conn, active_users_by_weekday_statement(filters, exact), params)
+
+
+@lru_cache(maxsize=None)
+def active_users_by_weekday_statement(filters:tuple, exact:bool) -> str:
+    if exact:
+        return f"""
+            SELECT   COUNT( DISTINCT user_name) AS active_user, week, weekday, day_of_week, year
+            FROM     rollup_user_day
+            {where(filters, ROLLUP_COLUMNS)}
+            GROUP BY year, week, day_of_week"""
+    return f"""
+            SELECT   COALESCE(hll_count(sketch), 0) AS active_user, week, weekday, day_of_week, year
+            FROM     rollup_day d INNER JOIN user_sketch u ON d.date == u.date
+            {where(filters, { 'year': 'd.year', 'week': 'd.week', 'date': 'd.date' })}
+            GROUP BY year, week, day_of_week"""
+
+
+def active_users(conn:sqlite3.Connection, start_date:str = None, end_date:str = None, exact:bool = False) -> pd.DataFrame:
+    """
+    Queries the number of users, that were active in a period.
+    Parameters:
+        conn (sqlite3.Connection): Database connection
+        start_date (str): First date of the period. Format YYYY-MM-DD.
+        end_date (str): Last date of the period. Format YYYY-MM-DD.
+        exact (bool): Count the users exactly instead of merging the user sketches of the dates
+    Returns:
+        result (pd.DataFrame): active_users
+    """
+    filters, params = time_filter(start_date=start_date, end_date=end_date)
+    hyperloglog.register(conn)
+    return read(conn, active_users_statement(filters, exact), params)
+
+
+@lru_cache(maxsize=None)
+def active_users_statement(filters:tuple, exact:bool) -> str:
+    if exact:
+        return f"""
+            SELECT  COUNT( DISTINCT user_name) as active_users
+            FROM    rollup_user_day
+            {where(filters, ROLLUP_COLUMNS)}"""
+    return f"""
+            SELECT  COALESCE(hll_count(sketch), 0) as active_users
+            FROM    user_sketch
+            {where(filters, ROLLUP_COLUMNS)}"""
+
+
+def streams_over_weekdays(conn:sqlite3.Connection, year = None) -> pd.DataFrame:
+    """
+    Queries the average streams per weekday by year.
+    Parameters:
+        conn (sqlite3.Connection): Database connection
+        year (int): Only the weeks of the year
+    Returns:
+        result (pd.DataFrame): weekday, avg_streams, year
+    """
+    filters, params = time_filter(year)
+    return read(conn, streams_over_weekdays_statement(filters), params)
+
+
+@lru_cache(maxsize=None)
+def streams_over_weekdays_statement(filters:tuple) -> str:
+    return f"""
+            WITH stream_count_weekday_by_week AS (
+                SELECT   year, week, weekday, SUM(streams) AS streams
+                FROM     rollup_day
+                {where(filters, ROLLUP_COLUMNS)}
+                GROUP BY year, week, weekday
+            )
+            SELECT   weekday, AVG(streams) OVER(PARTITION BY weekday) AS avg_streams, year
+            FROM     stream_count_weekday_by_week
+            GROUP BY weekday"""
+
+
+def weekly_chart(conn:sqlite3.Connection, dimension:str, top_n:int = 5, year = None, week = None) -> pd.DataFrame:
+    """
+    Queries the weekly top n tracks, artists or releases and their change of rank to the previous week, in which they were streamed.
+    With a year or week filter only the requested weeks are ranked, the previous ranks of the first requested week
+    are looked up in the latest earlier week of each charted entry.
+    Parameters:
+        conn (sqlite3.Connection): Database connection
+        dimension (str): track, artist or release
+        top_n (int): Ranks per week
+        year (int): Only the weeks of the year
+        week (int): Only the calendar week of the year
+    Returns:
+        result (pd.DataFrame): year, week, weekly_<dimension>_rank, weekly_<dimension>, names and weekly_change_of_ranking
+    """
+    filters, params = time_filter(year, week)
+    params['top_n'] = int(top_n)
+    if dimension == 'release':
+        params['unknown_release'] = UNKNOWN_RELEASE_MSID
+    return read(conn, weekly_chart_statement(check_dimension(dimension), filters), params)
+
+
+def chart_source(dimension:str, predicates:tuple) -> str:
+    """
+    Builds the query of the weekly streams of a dimension: year, week, msid, artist_msid, streams.
+    """
+    source = CHART_SOURCES[dimension]
+    group_by = f"GROUP BY {source['group_by']}" if source['group_by'] else ""
+    predicates = source['predicates'] + tuple(predicate.format(**source['columns']) for predicate in predicates)
+    return f"SELECT {source['select']} FROM {source['from']} {where((), {}, predicates)} {group_by}"
+
+
+@lru_cache(maxsize=None)
+def weekly_chart_statement(dimension:str, filters:tuple) -> str:
+    ranks = f"""
+            WITH weekly_streams AS (
+                {chart_source(dimension, tuple(TIME_PREDICATES[name] for name in filters))}
+            ),
+            weekly_rank AS (
+                SELECT   year, week, msid, artist_msid, streams,
+                         DENSE_RANK() OVER(PARTITION BY year, week ORDER BY streams DESC) AS weekly_rank
+                FROM     weekly_streams
+            )"""
+    ranked_weeks = "SELECT *, 1 AS requested FROM weekly_rank"
+    if filters:
+        # Entries, that are charted in their first requested week, need the rank of their latest earlier week
+        before = "{year} < :year" if 'week' not in filters else "({year} < :year OR ({year} = :year AND {week} < :week))"
+        ranks += f""",
+            first_charted AS (
+                SELECT   msid
+                FROM     (SELECT msid, weekly_rank, ROW_NUMBER() OVER (PARTITION BY msid ORDER BY year, week) AS appearance
+                          FROM   weekly_rank)
+                WHERE    appearance = 1 AND weekly_rank <= :top_n
+            ),
+            earlier_week AS (
+                SELECT   msid, MAX(year * 100 + week) AS year_week
+                FROM     ({chart_source(dimension, ("{msid} IN (SELECT msid FROM first_charted)", before))})
+                GROUP BY msid
+            ),
+            earlier_rank AS (
+                SELECT   year, week, msid, artist_msid, streams,
+                         DENSE_RANK() OVER(PARTITION BY year, week ORDER BY streams DESC) AS weekly_rank
+                FROM     ({chart_source(dimension, ("({year}, {week}) IN (SELECT DISTINCT year_week / 100, year_week % 100 FROM earlier_week)",))})
+            )"""
+        ranked_weeks += """
+                          UNION ALL
+                          SELECT *, 0 AS requested FROM earlier_rank WHERE (msid, year * 100 + week) IN (SELECT msid, year_week FROM earlier_week)"""
+    output = CHART_OUTPUTS[dimension]
+    return f"""{ranks},
+            previous_week_rank AS (
+                SELECT   year, week, msid, artist_msid, streams, weekly_rank, requested,
+                         LAG(weekly_rank) OVER (PARTITION BY msid ORDER BY year, week) AS rank_previous_week
+                FROM     ({ranked_weeks})
+            )
+            SELECT   c.year, c.week, c.weekly_rank AS weekly_{dimension}_rank, c.streams AS weekly_{dimension}, {output['columns']},
+                     CAST(c.rank_previous_week - c.weekly_rank AS REAL) AS weekly_change_of_ranking
+            FROM     previous_week_rank c {output['joins']}
+            WHERE    c.requested AND c.weekly_rank <= :top_n
+            ORDER BY c.year DESC, c.week DESC, c.weekly_rank"""
+
+
+def most_active_users(conn:sqlite3.Connection, top_n:int = 10, start_date:str = None, end_date:str = None) -> pd.DataFrame:
+    """
+    Queries the users with the most streams.
+    Parameters:
+        conn (sqlite3.Connection): Database connection
+        top_n (int): Number of ranks
+        start_date (str): Only streams from this date on. Format YYYY-MM-DD.
+        end_date (str): Only streams up to this date. Format YYYY-MM-DD.
+    Returns:
+        result (pd.DataFrame): rank, user_name
+    """
+    filters, params = time_filter(start_date=start_date, end_date=end_date)
+    params['top_n'] = int(top_n)
+    return read(conn, most_active_users_statement(filters), params)
+
+
+@lru_cache(maxsize=None)
+def most_active_users_statement(filters:tuple) -> str:
+    streams = f"{STREAM_TIME_JOIN} {where(filters, STREAM_TIME_COLUMNS)}" if filters else "stream"
+    return f"""
+            WITH active_user_ranking AS (
+                SELECT      user_name, DENSE_RANK() OVER(ORDER BY COUNT(1) DESC) as rank
+                FROM        {streams}
+                GROUP BY    user_name
+            )
+            SELECT rank, user_name
+            FROM active_user_ranking
+            WHERE rank <= :top_n"""
+
+
+def first_songs(conn:sqlite3.Connection) -> pd.DataFrame:
+    """
+    Queries the first track, every user listened to.
+    Parameters:
+        conn (sqlite3.Connection): Database connection
+    Returns:
+        result (pd.DataFrame): user_name, track_name, listend_at
+    """
+    return read(conn, """
+            SELECT DISTINCT user_name, track_name, MIN(timestamp_utc) AS listend_at
+            FROM   stream lf
+                        INNER JOIN track tr ON lf.track_msid = tr.track_msid
+                        INNER JOIN time t ON lf.timestamp_unix_id = t.timestamp_unix_id
+            GROUP BY user_name
+            ORDER  BY user_name, timestamp_utc""")
+
+
+def streams_per_weekday_by_user(conn:sqlite3.Connection, year = None, week = None, start_date:str = None, end_date:str = None) -> pd.DataFrame:
+    """
+    Queries the share of the streams of every user on each weekday.
+    Parameters:
+        conn (sqlite3.Connection): Database connection
+        year (int): Only streams of the year
+        week (int): Only streams of the calendar week of the year
+        start_date (str): Only streams from this date on. Format YYYY-MM-DD.
+        end_date (str): Only streams up to this date. Format YYYY-MM-DD.
+    Returns:
+        result (pd.DataFrame): user_id, summe, weekday, percentage
+    """
+    filters, params = time_filter(year, week, start_date, end_date)
+    return read(conn, streams_per_weekday_by_user_statement(filters), params)
+
+
+@lru_cache(maxsize=None)
+def streams_per_weekday_by_user_statement(filters:tuple) -> str:
+    return f"""
+            WITH grouped_weekday_count AS (
+                SELECT   COUNT(1) AS streams, weekday, user_name
+                FROM     {STREAM_TIME_JOIN}
+                {where(filters, STREAM_TIME_COLUMNS)}
+                GROUP BY weekday, user_name
+            )
+            SELECT   user_name as user_id, SUM(streams) AS summe, (weekday || '_listener') as weekday,
+                     1.0*SUM(streams) / SUM(sum(streams)) OVER(PARTITION BY user_name) as percentage
+            FROM     grouped_weekday_count
+            GROUP BY weekday, user_name"""
+
+
+def time_categories_by_user(conn:sqlite3.Connection, year = None, week = None, start_date:str = None, end_date:str = None) -> pd.DataFrame:
+    """
+    Queries the share of the streams of every user in each time of the day.
+    Parameters:
+        conn (sqlite3.Connection): Database connection
+        year (int): Only streams of the year
+        week (int): Only streams of the calendar week of the year
+        start_date (str): Only streams from this date on. Format YYYY-MM-DD.
+        end_date (str): Only streams up to this date. Format YYYY-MM-DD.
+    Returns:
+        result (pd.DataFrame): user_id, time_category, time_category_total, percentage
+    """
+    filters, params = time_filter(year, week, start_date, end_date)
+    return read(conn, time_categories_by_user_statement(filters), params)
+
+
+@lru_cache(maxsize=None)
+def time_categories_by_user_statement(filters:tuple) -> str:
+    return f"""
+            WITH time_categorization AS (
+                SELECT user_name, time,
+                    CASE
+                      WHEN time BETWEEN '01:00:00' AND '04:59:59' THEN 'night_listener'
+                      WHEN time BETWEEN '05:00:00' AND '08:59:59' THEN 'early_morning_listener'
+                      WHEN time BETWEEN '09:00:00' AND '12:59:59' THEN 'late_morning_listener'
+                      WHEN time between '13:00:00' and  '16:59:59' THEN 'afternoon_listener'
+                      WHEN time between '17:00:00' and  '20:59:59' THEN 'evening_listener'
+                      WHEN time >= '21:00:00' OR time < '01:00:00'THEN 'early_night_listener'
+                    END AS time_category
+                FROM  {STREAM_TIME_JOIN}
+                {where(filters, STREAM_TIME_COLUMNS)}
+            ),
+            grouped_time_categorization AS (
+                SELECT   user_name, time_category, COUNT(time_category) AS time_category_total
+                FROM     time_categorization
+                GROUP BY time_category,user_name
+            )
+            SELECT   user_name as user_id, time_category,time_category_total,
+                     1.0*SUM(time_category_total) / SUM(sum(time_category_total))
+                        OVER (PARTITION BY user_name) AS percentage
+            FROM     grouped_time_categorization
+            GROUP BY time_category, user_name
+            ORDER BY user_name"""
+
+
+def weekly_unique_entries_variance_by_user(conn:sqlite3.Connection, dimension:str, year = None) -> pd.DataFrame:
+    """
+    Queries the mean and variance of the weekly distinct tracks, artists or releases of every user and year.
+    Parameters:
+        conn (sqlite3.Connection): Database connection
+        dimension (str): track, artist or release
+        year (int): Only streams of the year
+    Returns:
+        result (pd.DataFrame): user_id, avg_unique_entries_per_user, sum_square_root_weekly_minus_avg, variance
+    """
+    filters, params = time_filter(year)
+    return read(conn, weekly_unique_entries_variance_by_user_statement(check_dimension(dimension), filters), params)
+
+
+@lru_cache(maxsize=None)
+def weekly_unique_entries_variance_by_user_statement(dimension:str, filters:tuple) -> str:
+    return f"""
+            WITH total_unique_entries_per_user_by_week AS (
+                SELECT   year, user_name, week, COUNT( DISTINCT {dimension}_msid) AS unique_entries
+                FROM     {STREAM_TIME_JOIN}
+                {where(filters, STREAM_TIME_COLUMNS)}
+                GROUP BY user_name, year, week
+            ),
+            avg_unique_entries_per_user_table AS (
+                SELECT  year, user_name, unique_entries ,
+                        COUNT(1) OVER(PARTITION BY user_name, year ) -1 as n_minus_1,
+                        AVG(unique_entries) OVER(PARTITION BY user_name, year ) AS avg_unique_entries_per_user
+                FROM    total_unique_entries_per_user_by_week
+            ),
+            sum_square_root_weekly_minus_avg_table AS (
+                SELECT   year, user_name, avg_unique_entries_per_user, n_minus_1,
+                         SUM((unique_entries - avg_unique_entries_per_user) * (unique_entries - avg_unique_entries_per_user))
+                            AS sum_square_root_weekly_minus_avg
+                FROM     avg_unique_entries_per_user_table
+                GROUP BY user_name, year
+            )
+            SELECT   user_name as user_id, avg_unique_entries_per_user, sum_square_root_weekly_minus_avg,
+                     sum_square_root_weekly_minus_avg / n_minus_1 as variance
+            FROM     sum_square_root_weekly_minus_avg_table
+            ORDER BY user_name"""
+
+
+def weekly_streams_and_users(conn:sqlite3.Connection, exact:bool = False) -> pd.DataFrame:
+    """
+    Queries the weekly active users, streams and average streams per user and their change to the previous week in percent.
+    Parameters:
+        conn (sqlite3.Connection): Database connection
+        exact (bool): Count the weekly users exactly instead of merging the daily user sketches
+    Returns:
+        result (pd.DataFrame): Weekly numbers and trends, latest week first
+    """
+    hyperloglog.register(conn)
+    return read(conn, weekly_streams_and_users_statement(exact))
+
+
+@lru_cache(maxsize=None)
+def weekly_streams_and_users_statement(exact:bool) -> str:
+    if exact:
+        active_users, weekly_rollup = "COUNT(1)", "rollup_user_week"
+    else:
+        active_users, weekly_rollup = "COALESCE(hll_count(sketch), 0)", "rollup_day d INNER JOIN user_sketch u ON d.date == u.date"
+    return f"""
+            WITH weekly_streams_and_user_table AS (
+                SELECT    year, week,
+                          {active_users} AS weekly_active_user,
+                          LAG({active_users}) OVER ( ORDER BY year, week) AS active_user_previous_week,
+                          SUM(streams) AS weekly_streams,
+                          LAG(SUM(streams)) OVER ( ORDER BY year, week) AS streams_previous_week
+                FROM      {weekly_rollup}
+                GROUP BY  year, week
+            )
+            SELECT    year, week, weekly_active_user, weekly_streams, (weekly_streams /  weekly_active_user)  AS weekly_avg_streams_user,
+                      printf('%.2f' , 100.0*(weekly_active_user - active_user_previous_week) / active_user_previous_week ) AS active_user_previous_week_trend,
+                      printf('%.2f' , 100.0*(weekly_streams - streams_previous_week)  / streams_previous_week ) AS streams_previous_week_trend,
+                      printf('%.2f' , 100.0*((weekly_streams /  weekly_active_user) - LAG((weekly_streams /  weekly_active_user) ) OVER ( ORDER BY year, week))
+                                 / LAG((weekly_streams /  weekly_active_user) ) OVER ( ORDER BY year, week) ) AS avg_streams_user_previous_week_trend
+            FROM      weekly_streams_and_user_table
+            GROUP BY  year, week
+            ORDER BY  year DESC, week DESC"""
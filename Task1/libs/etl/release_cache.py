@@ -0,0 +1,207 @@
+import sqlite3
+from collections import OrderedDict
+from typing import Iterable
+import numpy as np
+import pandas as pd
+
+UNKNOWN_RELEASE_MSID = "xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx"
+
+
+class ReleaseCache:
+    """
+    Size bounded lookup cache of known track_msid -> release_msid and release_msid -> release_name pairs,
+    used to fill missing releases with the ones of previously loaded files. The least recently used entries are evicted first.
+    """
+    max_size:int
+    track_releases:OrderedDict
+    release_names:OrderedDict
+
+
+    def __init__(self, max_size:int = 1000000):
+        """
+        Parameters:
+            max_size (int): Maximum number of entries per lookup
+        """
+        self.max_size = max_size
+        self.track_releases = OrderedDict()
+        self.release_names = OrderedDict()
+
+
+    def warm(self, conn:sqlite3.Connection):
+        """
+        Fills the cache with the releases, that are already stored in the database. The releases of the tracks are read 
+        from the rollup_track_release table, so the cost grows with the tracks, not with the streams.
+        Parameters:
+            conn (sqlite3.Connection): Database connection
+        """
+        track_releases = conn.execute("""
+                SELECT   track_msid, release_msid
+                FROM     rollup_track_release
+                LIMIT    ?""", (self.max_size,))
+        self._store(self.track_releases, track_releases)
+
+        release_names = conn.execute("""
+                SELECT   release_msid, release_name
+                FROM     release
+                WHERE    release_msid != ? AND release_name IS NOT NULL
+                LIMIT    ?""", (UNKNOWN_RELEASE_MSID, self.max_size))
+        self._store(self.release_names, release_names)
+        print(f"Release cache warmed with {len(self.track_releases)} tracks and {len(self.release_names)} releases.")
+
+
+    def update(self, df):
+        """
+        Adds the releases of loaded data to the cache.
+        Parameters:
+            df (pd.DataFrame): Loaded data
+        """
+        known = df[df['release_msid'] != UNKNOWN_RELEASE_MSID]
+        track_releases = known[['track_msid', 'release_msid']].drop_duplicates(subset='track_msid')
+        self._store(self.track_releases, zip(track_releases['track_msid'], track_releases['release_msid']))
+        release_names = known[known['release_name'].notna()][['release_msid', 'release_name']].drop_duplicates(subset='release_msid')
+        self._store(self.release_names, zip(release_names['release_msid'], release_names['release_name']))
+
+
+    def lookup_releases(self, track_msids:Iterable) -> dict:
+        """
+        Looks up the releases of tracks.
+        Parameters:
+            track_msids (Iterable): Distinct track_msid values
+        Returns:
+            result (dict): track_msid -> release_msid of the known tracks
+        """
+        return self._lookup(self.track_releases, track_msids)
+
+
+    def lookup_release_names(self, release_msids:Iterable) -> dict:
+        """
+        Looks up the names of releases.
+        Parameters:
+            release_msids (Iterable): Distinct release_msid values
+        Returns:
+            result (dict): release_msid -> release_name of the known releases
+        """
+        return self._lookup(self.release_names, release_msids)
+
+
+    def _lookup(self, mapping:OrderedDict, keys:Iterable) -> dict:
+        """
+        Looks up keys and marks the found ones as recently used.
+        """
+        found = {}
+        for key in keys:
+            value = mapping.get(key)
+            if value is not None:
+                mapping.move_to_end(key)
+                found[key] = value
+        return found
+
+
+    def _store(self, mapping:OrderedDict, pairs:Iterable):
+        """
+        Stores key value pairs. Existing keys keep their value, like the first loaded row wins in the database.
+        """
+        for key, value in pairs:
+            if key in mapping:
+                mapping.move_to_end(key)
+            else:
+                mapping[key] = value
+        while len(mapping) > self.max_size:
+            mapping.popitem(last=False)
+
+
+class FileReleases:
+    """
+    Releases and release names of one file, carried from chunk to chunk, so a file processed in chunks gets the same releases
+    as a file processed in one piece. There a null release is filled with the previous release of the same track in the file,
+    or else with the next one, and a null release name the same way within the release. The next value is only known
+    at the end of the file, so a first scan over the file collects the first release of every track and the first name
+    of every release. The chunks are then filled with the last values of the preceding chunks, or else with these first values.
+    The memory grows with the distinct tracks and releases of the file, not with its rows.
+    """
+    first_releases:dict
+    first_names:dict
+    last_releases:dict
+    last_names:dict
+    pending_names:dict
+    rows:int
+
+
+    def __init__(self):
+        self.first_releases = {}
+        self.first_names = {}
+        self.last_releases = {}
+        self.last_names = {}
+        # Names of rows, whose track has no release yet, they belong to the first release of the track
+        self.pending_names = {}
+        self.rows = 0
+
+
+    def scan(self, df):
+        """
+        Collects the first releases and release names of a chunk of the first scan.
+        Parameters:
+            df (pd.DataFrame): Valid rows of a chunk with track_msid, release_msid and release_name
+        """
+        track, release, name = df['track_msid'], df['release_msid'], df['release_name']
+        positions = pd.Series(np.arange(self.rows, self.rows + len(df)), index=df.index)
+        self.rows += len(df)
+        filled = self._fill_from_previous(track, release).groupby(track, sort=False).bfill()
+
+        known = release.notna()
+        first_releases = release[known].groupby(track[known], sort=False).first()
+        for track_msid, release_msid in first_releases[~first_releases.index.isin(list(self.first_releases))].items():
+            self.first_releases[track_msid] = release_msid
+            if track_msid in self.pending_names:
+                self._add_first_name(release_msid, *self.pending_names.pop(track_msid))
+
+        named = filled.notna() & name.notna()
+        first_rows = positions[named].groupby(filled[named], sort=False).idxmin()
+        for release_msid, row in first_rows.items():
+            self._add_first_name(release_msid, positions[row], name[row])
+
+        pending = filled.isna() & name.notna()
+        first_rows = positions[pending].groupby(track[pending], sort=False).idxmin()
+        for track_msid, row in first_rows.items():
+            self.pending_names.setdefault(track_msid, (positions[row], name[row]))
+        self.last_releases.update(release[known].groupby(track[known], sort=False).last())
+
+
+    def start(self):
+        """
+        Ends the first scan, the chunks can be filled from now on.
+        """
+        self.first_names = { release_msid: name for release_msid, (_, name) in self.first_names.items() }
+        self.last_releases = {}
+        self.last_names = {}
+        self.pending_names = {}
+
+
+    def fill(self, df) -> tuple:
+        """
+        Fills the null releases and release names of the next chunk.
+        Parameters:
+            df (pd.DataFrame): Valid rows of a chunk with track_msid, release_msid and release_name
+        Returns:
+            result (tuple): Filled release_msid and release_name
+        """
+        track, release, name = df['track_msid'], df['release_msid'], df['release_name']
+        filled = self._fill_from_previous(track, release).fillna(track.map(self.first_releases))
+        filled_name = name.groupby(filled, sort=False).ffill().fillna(filled.map(self.last_names)).fillna(filled.map(self.first_names))
+        known = release.notna()
+        self.last_releases.update(release[known].groupby(track[known], sort=False).last())
+        named = filled.notna() & name.notna()
+        self.last_names.update(name[named].groupby(filled[named], sort=False).last())
+        return filled, filled_name
+
+
+    def _fill_from_previous(self, track, release):
+        """
+        Fills null releases with the previous release of the track in the chunk, or else in the preceding chunks.
+        """
+        return release.groupby(track, sort=False).ffill().fillna(track.map(self.last_releases))
+
+
+    def _add_first_name(self, release_msid:str, position:int, name:str):
+        if release_msid not in self.first_names or position < self.first_names[release_msid][0]:
+            self.first_names[release_msid] = (position, name)
@@ -0,0 +1,263 @@
+import hashlib
+import os
+import pickle
+import sqlite3
+from collections import OrderedDict
+from typing import Callable
+
+# 256 MiB of pickled results in memory and on disk
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# Part of every cache key, has to be incremented whenever the SQL or the code of a cached query function changes
+CACHE_VERSION = 1
+
+
+def load_generation(conn:sqlite3.Connection) -> tuple:
+    """
+    Returns the load generation of the database. It changes with every load, that changes the data, and with every schema migration.
+    Parameters:
+        conn (sqlite3.Connection): Database connection
+    Returns:
+        result (tuple): Schema version and load counter, None if the database has no load counter yet
+    """
+    try:
+        row = conn.execute("SELECT generation FROM load_generation").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    if row is None:
+        return None
+    return (conn.execute("PRAGMA user_version").fetchone()[0], row[0])
+
+
+def database_path(conn:sqlite3.Connection) -> str:
+    """
+    Parameters:
+        conn (sqlite3.Connection): Database connection
+    Returns:
+        result (str): Absolute path of the main database, ':memory:' for an in-memory database
+    """
+    database = next((row[2] for row in conn.execute("PRAGMA database_list") if row[1] == 'main'), '')
+    return os.path.abspath(database) if database else ':memory:'
+
+
+def database_identity(conn:sqlite3.Connection) -> tuple:
+    """
+    Returns the path of the database and the random id, that it got when it was created. The id tells a recreated database
+    apart from the former one at the same path, even if both reached the same load generation.
+    Parameters:
+        conn (sqlite3.Connection): Database connection
+    Returns:
+        result (tuple): Path and id, the id is None if the database has no id yet
+    """
+    try:
+        row = conn.execute("SELECT database_id FROM load_generation").fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    return (database_path(conn), row[0] if row else None)
+
+
+def bump_load_generation(c:sqlite3.Cursor):
+    """
+    Increments the load counter, which invalidates the cached query results. Runs within the transaction of the caller.
+    Parameters:
+        c (sqlite3.Cursor): Database cursor
+    """
+    c.execute("UPDATE load_generation SET generation = generation + 1")
+
+
+class ResultCache:
+    """
+    Cache of query results in memory and on disk, keyed by the query function, its arguments, the database (see database_identity),
+    its load generation and the CACHE_VERSION. A load, that changes the database, starts a new generation, so the results of 
+    the older ones are not hit anymore and are evicted with the least recently used entries, when the pickled results exceed max_bytes 
+    in memory or on disk. Results are kept pickled, so callers can't change the cached result.
+    The cached results are unpickled, which can run arbitrary code, so the folder of the cache must only be writable 
+    by trusted users.
+    """
+    path:str
+    max_bytes:int
+    entries:OrderedDict
+    memory_bytes:int
+    hits:int
+    misses:int
+
+
+    def __init__(self, path:str, max_bytes:int = DEFAULT_MAX_BYTES):
+        """
+        Parameters:
+            path (str): Folder of the cached results, None to cache in memory only. It must be trusted, see the class docstring
+            max_bytes (int): Maximum size of the pickled results in memory and on disk each
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.memory_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        if path:
+            os.makedirs(path, exist_ok=True)
+
+
+    def call(self, function:Callable, conn:sqlite3.Connection, **arguments):
+        """
+        Returns the cached result of a query function, or calls it and caches the result.
+        Parameters:
+            function (Callable): Query function, that takes the connection as first argument
+            conn (sqlite3.Connection): Database connection
+            arguments: Further arguments of the query function
+        Returns:
+            result: Result of the query function
+        """
+        generation = load_generation(conn)
+        if generation is None:
+            return function(conn, **arguments)
+        key = self.key(function, conn, generation, arguments)
+        data = self.get(key)
+        if data is not None:
+            self.hits += 1
+            return pickle.loads(data)
+        self.misses += 1
+        result = function(conn, **arguments)
+        self.put(key, pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+        return result
+
+
+    def key(self, function:Callable, conn:sqlite3.Connection, generation:tuple, arguments:dict) -> str:
+        """
+        Builds the cache key of a function call. Changes of the code or the SQL of a query function are not detected,
+        they need a new CACHE_VERSION.
+        Parameters:
+            function (Callable): Query function
+            conn (sqlite3.Connection): Database connection
+            generation (tuple): Load generation of the database
+            arguments (dict): Arguments of the query function
+        Returns:
+            result (str): Hex digest of the key
+        """
+        parts = [str(CACHE_VERSION), repr(database_identity(conn)), repr(generation),
+                 f"{function.__module__}.{function.__qualname__}",
+                 repr(sorted((name, repr(value)) for name, value in arguments.items()))]
+        return hashlib.sha1("\x1f".join(parts).encode('utf-8')).hexdigest()
+
+
+    def get(self, key:str) -> bytes:
+        """
+        Looks up a pickled result in memory, then on disk, and marks it as recently used.
+        Parameters:
+            key (str): Cache key
+        Returns:
+            result (bytes): Pickled result, None if it is not cached
+        """
+        data = self.entries.get(key)
+        if data is not None:
+            self.entries.move_to_end(key)
+            return data
+        if not self.path:
+            return None
+        file_path = self._file_path(key)
+        try:
+            with open(file_path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        # The modification time orders the files by their last use
+        os.utime(file_path)
+        self._remember(key, data)
+        return data
+
+
+    def put(self, key:str, data:bytes):
+        """
+        Stores a pickled result in memory and on disk, then evicts the least recently used entries above max_bytes.
+        Parameters:
+            key (str): Cache key
+            data (bytes): Pickled result
+        """
+        if len(data) > self.max_bytes:
+            return
+        self._remember(key, data)
+        if not self.path:
+            return
+        file_path = self._file_path(key)
+        temporary_path = f"{file_path}.{os.getpid()}.tmp"
+        with open(temporary_path, 'wb') as f:
+            f.write(data)
+        os.replace(temporary_path, file_path)
+        self._evict_files()
+
+
+    def clear(self):
+        """
+        Removes all cached results from memory and disk.
+        """
+        self.entries.clear()
+        self.memory_bytes = 0
+        if self.path:
+            for file_name in os.listdir(self.path):
+                if file_name.endswith('.pkl'):
+                    self._remove(os.path.join(self.path, file_name))
+
+
+    def _file_path(self, key:str) -> str:
+        return os.path.join(self.path, f"{key}.pkl")
+
+
+    def _remember(self, key:str, data:bytes):
+        """
+        Stores an entry in memory and evicts the least recently used ones above max_bytes.
+        """
+        self._forget(key)
+        self.entries[key] = data
+        self.memory_bytes += len(data)
+        while self.memory_bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.memory_bytes -= len(evicted)
+
+
+    def _forget(self, key:str):
+        data = self.entries.pop(key, None)
+        if data is not None:
+            self.memory_bytes -= len(data)
+
+
+    def _evict_files(self):
+        """
+        Removes the least recently used files, until the cached files fit into max_bytes.
+        """
+        files = []
+        for file_name in os.listdir(self.path):
+            if file_name.endswith('.pkl'):
+                file_path = os.path.join(self.path, file_name)
+                try:
+                    stat = os.stat(file_path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, file_path))
+        total_bytes = sum(size for _, size, _ in files)
+        for _, size, file_path in sorted(files):
+            if total_bytes <= self.max_bytes:
+                break
+            self._remove(file_path)
+            total_bytes -= size
+
+
+    def _remove(self, file_path:str):
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
+
+
+def call(cache:ResultCache, function:Callable, conn:sqlite3.Connection, **arguments):
+    """
+    Calls a query function through the cache, or directly if there is no cache.
+    Parameters:
+        cache (ResultCache): Result cache, or None
+        function (Callable): Query function, that takes the connection as first argument
+        conn (sqlite3.Connection): Database connection
+        arguments: Further arguments of the query function
+    Returns:
+        result: Result of the query function
+    """
+    if cache is None:
+        return function(conn, **arguments)
+    return cache.call(function, conn, **arguments)
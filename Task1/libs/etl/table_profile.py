@@ -0,0 +1,155 @@
+import sqlite3
+import numpy as np
+import pandas as pd
+from libs.etl import hyperloglog, queries
+from libs.etl.quantiles import QuantileSketch, DEFAULT_CAPACITY
+
+# Rows fetched per chunk of the table scan
+DEFAULT_CHUNK_SIZE = 100000
+# Counters of the frequent values of a column, top and freq are exact, if the column has fewer distinct values
+DEFAULT_FREQUENT_VALUES = 1000
+PERCENTILES = (0.25, 0.5, 0.75)
+# Columns of pandas describe(include='all') after the null percentage
+STATISTIC_COLUMNS = ['count', 'unique', 'top', 'freq', 'mean', 'std', 'min'] + [f"{percentile:.0%}" for percentile in PERCENTILES] + ['max']
+
+
+class ColumnProfile:
+    """
+    Statistics of one column, updated chunk by chunk: nulls, count, mean and variance (merged per chunk like Chan et al.),
+    min and max, a HyperLogLog sketch of the distinct values, a quantile sketch of the numbers and counters of the
+    frequent values. Numbers and texts are told apart by their SQLite type.
+    """
+    rows:int
+    nulls:int
+    numbers:int
+    texts:int
+    mean:float
+    m2:float
+    minimum:float
+    maximum:float
+    distinct:hyperloglog.HyperLogLog
+    quantiles:QuantileSketch
+    frequent:pd.Series
+    max_frequent:int
+
+
+    def __init__(self, sketch_precision:int = hyperloglog.DEFAULT_PRECISION, quantile_capacity:int = DEFAULT_CAPACITY,
+                 max_frequent:int = DEFAULT_FREQUENT_VALUES):
+        """
+        Parameters:
+            sketch_precision (int): Precision of the distinct count sketch
+            quantile_capacity (int): Items per level of the quantile sketch
+            max_frequent (int): Counters of the frequent values
+        """
+        self.rows = 0
+        self.nulls = 0
+        self.numbers = 0
+        self.texts = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = np.nan
+        self.maximum = np.nan
+        self.distinct = hyperloglog.HyperLogLog(sketch_precision)
+        self.quantiles = QuantileSketch(quantile_capacity)
+        self.frequent = pd.Series(dtype=np.int64)
+        self.max_frequent = max_frequent
+
+
+    def add(self, values:np.ndarray, is_number:np.ndarray):
+        """
+        Adds a chunk of column values.
+        Parameters:
+            values (np.ndarray): Values of the chunk, None for null
+            is_number (np.ndarray): Whether SQLite stores the value as integer or real
+        """
+        not_null = pd.notna(values)
+        self.rows += len(values)
+        self.nulls += int(len(values) - not_null.sum())
+        values, is_number = values[not_null], is_number[not_null].astype(bool)
+        if len(values) == 0:
+            return
+        self.distinct.add(values)
+        self._add_frequent(pd.Series(values).value_counts(sort=False))
+        self.texts += int(len(values) - is_number.sum())
+        numbers = values[is_number].astype(np.float64)
+        if len(numbers):
+            self._add_moments(numbers)
+            self.quantiles.add(numbers)
+
+
+    def _add_moments(self, numbers:np.ndarray):
+        count, mean = len(numbers), numbers.mean()
+        m2 = float(((numbers - mean) ** 2).sum())
+        total = self.numbers + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.numbers * count / total
+        self.numbers = total
+        self.minimum = np.nanmin([self.minimum, numbers.min()])
+        self.maximum = np.nanmax([self.maximum, numbers.max()])
+
+
+    def _add_frequent(self, counts:pd.Series):
+        """
+        Merges the value counts of a chunk and keeps the max_frequent largest counters. A value, that occurs more often
+        than once in max_frequent values of every chunk, is never dropped, so the top value of skewed columns is exact.
+        """
+        frequent = self.frequent.add(counts, fill_value=0)
+        if len(frequent) > self.max_frequent:
+            frequent = frequent.nlargest(self.max_frequent)
+        self.frequent = frequent
+
+
+    def statistics(self) -> dict:
+        """
+        Returns the statistics like pandas describe(include='all'): count, unique, top and freq of text columns,
+        mean, std, min, percentiles and max of numeric columns. unique is estimated for every column.
+        Returns:
+            result (dict): Null percentage and statistics
+        """
+        count = self.rows - self.nulls
+        result = { 'null_values_in_percent': f"{100.0 * self.nulls / self.rows:.3f}" if self.rows else None,
+                   'count': count, 'unique': self.distinct.count() if count else 0 }
+        result.update({ column: np.nan for column in STATISTIC_COLUMNS[2:] })
+        if self.texts:
+            top = self.frequent.idxmax()
+            result.update({ 'top': top, 'freq': int(self.frequent[top]) })
+        elif self.numbers:
+            percentiles = self.quantiles.quantiles(PERCENTILES)
+            result.update({ 'mean': self.mean, 'std': np.sqrt(self.m2 / (self.numbers - 1)) if self.numbers > 1 else np.nan,
+                            'min': self.minimum, 'max': self.maximum })
+            result.update({ f"{percentile:.0%}": value for percentile, value in zip(PERCENTILES, percentiles) })
+        return result
+
+
+def profile_table(conn:sqlite3.Connection, table:str, columns:list, chunk_size:int = DEFAULT_CHUNK_SIZE,
+                  sketch_precision:int = hyperloglog.DEFAULT_PRECISION, quantile_capacity:int = DEFAULT_CAPACITY) -> pd.DataFrame:
+    """
+    Profiles columns of a table in one scan, that only reads the given columns, chunk by chunk. The memory does not grow with the table.
+    Parameters:
+        conn (sqlite3.Connection): Database connection
+        table (str): Name of the table
+        columns (list): Columns to profile
+        chunk_size (int): Rows per chunk
+        sketch_precision (int): Precision of the distinct count sketches
+        quantile_capacity (int): Items per level of the quantile sketches
+    Returns:
+        result (pd.DataFrame): Null percentage, count, unique, top, freq, mean, std, min, 25%, 50%, 75%, max and table per column
+    """
+    columns = queries.check_columns(conn, table, columns)
+    profiles = [ColumnProfile(sketch_precision, quantile_capacity) for _ in columns]
+    selection = ", ".join(f'"{column}", typeof("{column}") IN (\'integer\', \'real\')' for column in columns)
+    cursor = conn.execute(f'SELECT {selection} FROM "{table}"')
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            chunk = np.array(rows, dtype=object)
+            for position, profile in enumerate(profiles):
+                profile.add(chunk[:, 2 * position], chunk[:, 2 * position + 1])
+    finally:
+        cursor.close()
+    result = pd.DataFrame([profile.statistics() for profile in profiles], index=pd.Index(columns, name='column'))
+    result['table'] = table
+    return result[['null_values_in_percent'] + STATISTIC_COLUMNS + ['table']]
@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+
+SECONDS_PER_DAY = 86400
+WEEKDAY_NAMES = np.array(['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'], dtype=object)
+# 'HH:MM:SS' for every second of a day
+TIMES_OF_DAY = np.array([f'{second // 3600:02d}:{second // 60 % 60:02d}:{second % 60:02d}' for second in range(SECONDS_PER_DAY)], dtype=object)
+DAY_COLUMNS = ['date', 'weekday', 'day_of_week', 'week_of_year', 'day_of_month', 'month', 'year']
+
+
+def civil_from_days(days:np.ndarray) -> tuple:
+    """
+    Converts days since 1970-01-01 into the proleptic gregorian calendar date.
+    Parameters:
+        days (np.ndarray): Days since 1970-01-01
+    Returns:
+        result (tuple): Year, month and day arrays
+    """
+    days = days.astype(np.int64) + 719468
+    era = np.floor_divide(days, 146097)
+    day_of_era = days - era * 146097
+    year_of_era = (day_of_era - day_of_era // 1460 + day_of_era // 36524 - day_of_era // 146096) // 365
+    day_of_year = day_of_era - (365 * year_of_era + year_of_era // 4 - year_of_era // 100)
+    shifted_month = (5 * day_of_year + 2) // 153
+    day = day_of_year - (153 * shifted_month + 2) // 5 + 1
+    month = np.where(shifted_month < 10, shifted_month + 3, shifted_month - 9)
+    year = year_of_era + era * 400 + (month <= 2)
+    return year, month, day
+
+
+def days_from_civil(year:np.ndarray, month:np.ndarray, day:np.ndarray) -> np.ndarray:
+    """
+    Converts proleptic gregorian calendar dates into days since 1970-01-01.
+    Parameters:
+        year (np.ndarray): Years
+        month (np.ndarray): Months
+        day (np.ndarray): Days of month
+    Returns:
+        result (np.ndarray): Days since 1970-01-01
+    """
+    year = year - (month <= 2)
+    era = np.floor_divide(year, 400)
+    year_of_era = year - era * 400
+    day_of_year = (153 * np.where(month > 2, month - 3, month + 9) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+
+def day_attributes(days:np.ndarray) -> dict:
+    """
+    Derives the calendar attributes of days.
+    Parameters:
+        days (np.ndarray): Days since 1970-01-01
+    Returns:
+        result (dict): Array per day column
+    """
+    year, month, day = civil_from_days(days)
+    # 1970-01-01 was a Thursday, Monday is 0
+    day_of_week = (days + 3) % 7
+    # The ISO week belongs to the year of its Thursday
+    thursday = days - day_of_week + 3
+    iso_year, _, _ = civil_from_days(thursday)
+    week_of_year = (thursday - days_from_civil(iso_year, np.ones_like(iso_year), np.ones_like(iso_year))) // 7 + 1
+    dates = [f'{y:04d}-{m:02d}-{d:02d}' for y, m, d in zip(year.tolist(), month.tolist(), day.tolist())]
+    return { 'date': np.array(dates, dtype=object),
+             'weekday': WEEKDAY_NAMES[day_of_week],
+             'day_of_week': day_of_week,
+             'week_of_year': week_of_year,
+             'day_of_month': day,
+             'month': month,
+             'year': year }
+
+
+class CalendarDimension:
+    """
+    Derives the time table columns from unix timestamps. Every distinct timestamp is converted only once 
+    and the attributes of a day are kept between batches, so they are derived once per distinct day.
+    """
+    max_days:int
+    days:dict
+
+
+    def __init__(self, max_days:int = 100000):
+        """
+        Parameters:
+            max_days (int): Maximum number of memoized days, the memo is cleared once it is full
+        """
+        self.max_days = max_days
+        self.days = {}
+
+
+    def derive(self, timestamps:pd.Series) -> pd.DataFrame:
+        """
+        Derives timestamp_utc, date, time, weekday, day_of_week, week_of_year, day_of_month, month and year.
+        The values are the same as the ones of the pandas datetime accessors, with date as 'YYYY-MM-DD' string.
+        Parameters:
+            timestamps (pd.Series): Unix timestamps in seconds
+        Returns:
+            result (pd.DataFrame): Time columns, with the index of the timestamps
+        """
+        unique_seconds, inverse = np.unique(timestamps.to_numpy(dtype=np.int64), return_inverse=True)
+        days = np.floor_divide(unique_seconds, SECONDS_PER_DAY)
+        unique_days, day_inverse = np.unique(days, return_inverse=True)
+        attributes = self._lookup(unique_days)
+
+        times = TIMES_OF_DAY[unique_seconds - days * SECONDS_PER_DAY]
+        dates = attributes['date'][day_inverse]
+        columns = { 'timestamp_utc': (dates + ' ' + times + '+00:00')[inverse],
+                    'time': times[inverse] }
+        row_days = day_inverse[inverse]
+        for column in DAY_COLUMNS:
+            columns[column] = attributes[column][row_days]
+        return pd.DataFrame(columns, index=timestamps.index)
+
+
+    def _lookup(self, unique_days:np.ndarray) -> dict:
+        """
+        Returns the attributes of the days, derives and memoizes the missing ones.
+        Parameters:
+            unique_days (np.ndarray): Sorted distinct days since 1970-01-01
+        Returns:
+            result (dict): Array per day column, in the order of the days
+        """
+        missing = np.array([day for day in unique_days.tolist() if day not in self.days], dtype=np.int64)
+        if len(missing):
+            if len(self.days) + len(missing) > self.max_days:
+                self.days.clear()
+            derived = day_attributes(missing)
+            for position, day in enumerate(missing.tolist()):
+                self.days[day] = tuple(derived[column][position] for column in DAY_COLUMNS)
+        rows = [self.days[day] for day in unique_days.tolist()]
+        return { column: np.array([row[position] for row in rows], dtype=object if column in ('date', 'weekday') else np.int64)
+                 for position, column in enumerate(DAY_COLUMNS) }
@@ -0,0 +1,322 @@
+import os
+import sqlite3
+import numpy as np
+import pandas as pd
+from libs.etl import result_cache
+
+# Rows fetched per chunk of the stream scan
+DEFAULT_CHUNK_SIZE = 100000
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+TIME_CATEGORIES = ['night', 'early_morning', 'late_morning', 'afternoon', 'evening', 'early_night']
+# Time category of every hour of the day, 01:00 - 04:59 is night, 05:00 - 08:59 early morning and so on
+HOUR_CATEGORIES = np.array([5, 0, 0, 0, 0, 1, 1, 1, 1, 2, 2, 2, 2, 3, 3, 3, 3, 4, 4, 4, 4, 5, 5, 5])
+DIMENSIONS = ('artist', 'release', 'track')
+# Columns of the feature matrix, in the order of the former clustering table
+FEATURE_COLUMNS = sorted(f"{category}_listener" for category in TIME_CATEGORIES) \
+                  + sorted(f"{weekday}_listener" for weekday in WEEKDAYS) \
+                  + [f"variation_coefficient_over_listened_{dimension}s_on_weekly_basis" for dimension in DIMENSIONS]
+# Bits of the user, week and item ids packed into one int64 key per distinct (user, week, item)
+USER_BITS = 24
+WEEK_BITS = 12
+ITEM_BITS = 27
+# Bits of the year in the (user, year) keys of the feature rows
+YEAR_BITS = 16
+FEATURES_FILE = 'features.npy'
+USERS_FILE = 'users.npy'
+STATE_FILE = 'state.npz'
+# Reads of the feature matrix, while an update replaces its files
+READ_ATTEMPTS = 3
+SCAN_STATEMENT = """
+        SELECT s.rowid, s.user_name, t.year * 100 + t.week, t.day_of_week, CAST(substr(t.time, 1, 2) AS INTEGER),
+               s.artist_msid, s.release_msid, s.track_msid
+        FROM   stream s INNER JOIN time t ON s.timestamp_unix_id == t.timestamp_unix_id
+        WHERE  s.rowid > :last_rowid"""
+
+
+class UserFeatureStore:
+    """
+    Clustering features of every user, built in one scan of stream and time. Per user the streams per weekday and time category
+    are counted and per user and week the distinct artists, releases and tracks are kept as packed int64 keys, all in numpy arrays
+    indexed by user id. The counters are saved with the rowid of the last scanned stream, so an update after a load only scans
+    the new streams. They are only trusted for the database they were built from, see result_cache.database_identity.
+    The feature matrix has one row per user and year, like the former query, and is written as .npy file, that can be 
+    memory mapped, with the user names of its rows in a second file.
+    """
+    path:str
+    users:pd.Index
+    weeks:pd.Index
+    items:dict
+    weekday_counts:np.ndarray
+    category_counts:np.ndarray
+    user_weeks:np.ndarray
+    week_items:dict
+    last_rowid:int
+    generation:tuple
+    database:tuple
+
+
+    def __init__(self, path:str = None):
+        """
+        Parameters:
+            path (str): Folder of the feature matrix and the counters, None to keep them in memory only
+        """
+        self.path = path
+        self.reset()
+        if path:
+            os.makedirs(path, exist_ok=True)
+            if os.path.exists(os.path.join(path, STATE_FILE)):
+                self._load_state()
+
+
+    def reset(self):
+        """
+        Drops all counters, the next update scans all streams again.
+        """
+        self.users = pd.Index([], dtype=object)
+        self.weeks = pd.Index([], dtype=np.int64)
+        self.items = { dimension: pd.Index([], dtype=object) for dimension in DIMENSIONS }
+        self.weekday_counts = np.zeros((0, len(WEEKDAYS)), dtype=np.int64)
+        self.category_counts = np.zeros((0, len(TIME_CATEGORIES)), dtype=np.int64)
+        self.user_weeks = np.empty(0, dtype=np.int64)
+        self.week_items = { dimension: np.empty(0, dtype=np.int64) for dimension in DIMENSIONS }
+        self.last_rowid = 0
+        self.generation = None
+        self.database = None
+
+
+    def update(self, conn:sqlite3.Connection, chunk_size:int = DEFAULT_CHUNK_SIZE) -> bool:
+        """
+        Adds the streams loaded since the last update and writes the feature matrix. The counters are rebuilt,
+        if they were built from another database, e.g. one recreated at the same path, or if the database is older than them.
+        Parameters:
+            conn (sqlite3.Connection): Database connection
+            chunk_size (int): Rows per chunk
+        Returns:
+            result (bool): True if new streams were added
+        """
+        database = result_cache.database_identity(conn)
+        if database != self.database:
+            self.reset()
+        generation = result_cache.load_generation(conn)
+        if generation is not None and generation == self.generation:
+            return False
+        max_rowid = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM stream").fetchone()[0]
+        if max_rowid < self.last_rowid or (generation is not None and self.generation is not None and generation < self.generation):
+            self.reset()
+        user_weeks = [self.user_weeks]
+        week_items = { dimension: [self.week_items[dimension]] for dimension in DIMENSIONS }
+        cursor = conn.execute(SCAN_STATEMENT, { 'last_rowid': self.last_rowid })
+        try:
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                self._add_chunk(pd.DataFrame(rows, columns=['rowid', 'user_name', 'year_week', 'day_of_week', 'hour'] + list(DIMENSIONS)),
+                                user_weeks, week_items)
+        finally:
+            cursor.close()
+        changed = len(user_weeks) > 1
+        # The keys of the chunks are deduplicated once, as the same user, week and item can appear in every chunk
+        self.user_weeks = np.unique(np.concatenate(user_weeks))
+        self.week_items = { dimension: np.unique(np.concatenate(keys)) for dimension, keys in week_items.items() }
+        self.generation = generation
+        self.database = database
+        if self.path:
+            self._save()
+        return changed
+
+
+    def _add_chunk(self, chunk:pd.DataFrame, user_weeks:list, week_items:dict):
+        """
+        Counts the streams of a chunk per user, weekday and time category and collects the keys of the user weeks and their items.
+        """
+        self.last_rowid = max(self.last_rowid, int(chunk['rowid'].max()))
+        self.users = extend_index(self.users, chunk['user_name'])
+        self.weeks = extend_index(self.weeks, chunk['year_week'])
+        user_ids = self.users.get_indexer(chunk['user_name'])
+        check_ids(len(self.users), USER_BITS, 'users')
+        check_ids(len(self.weeks), WEEK_BITS, 'weeks')
+        self.weekday_counts = grow(self.weekday_counts, len(self.users))
+        self.category_counts = grow(self.category_counts, len(self.users))
+        day_of_week = chunk['day_of_week'].to_numpy(dtype=np.float64)
+        known = ~np.isnan(day_of_week)
+        np.add.at(self.weekday_counts, (user_ids[known], day_of_week[known].astype(np.int64)), 1)
+        hour = chunk['hour'].to_numpy(dtype=np.float64)
+        known = ~np.isnan(hour)
+        np.add.at(self.category_counts, (user_ids[known], HOUR_CATEGORIES[hour[known].astype(np.int64) % 24]), 1)
+        user_week = (user_ids.astype(np.int64) << WEEK_BITS) | self.weeks.get_indexer(chunk['year_week'])
+        user_weeks.append(np.unique(user_week))
+        for dimension in DIMENSIONS:
+            values = chunk[dimension]
+            known = values.notna().to_numpy()
+            self.items[dimension] = extend_index(self.items[dimension], values[known])
+            check_ids(len(self.items[dimension]), ITEM_BITS, f"{dimension}s")
+            item_ids = self.items[dimension].get_indexer(values[known])
+            week_items[dimension].append(np.unique((user_week[known] << ITEM_BITS) | item_ids))
+
+
+    def features(self) -> np.ndarray:
+        """
+        Computes the feature matrix: the share of the streams of each user per time category and weekday and the variation coefficient
+        of the distinct artists, releases and tracks per week of each user and year. Users, that streamed in a single week 
+        of a year only, get a coefficient of 0 for that year.
+        Returns:
+            result (np.ndarray): One row per user and year, see user_rows, FEATURE_COLUMNS in the columns
+        """
+        user_ids, row_ids = self._user_years()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            categories = self.category_counts / self.category_counts.sum(axis=1, keepdims=True)
+            weekdays = self.weekday_counts / self.weekday_counts.sum(axis=1, keepdims=True)
+            columns = { f"{category}_listener": categories[user_ids, position] for position, category in enumerate(TIME_CATEGORIES) }
+            columns.update({ f"{weekday}_listener": weekdays[user_ids, position] for position, weekday in enumerate(WEEKDAYS) })
+            columns.update({ f"variation_coefficient_over_listened_{dimension}s_on_weekly_basis": 
+                             self._variation_coefficient(dimension, row_ids, len(user_ids))
+                             for dimension in DIMENSIONS })
+        matrix = np.column_stack([columns[column] for column in FEATURE_COLUMNS]) if len(user_ids) \
+                 else np.zeros((0, len(FEATURE_COLUMNS)))
+        return np.nan_to_num(matrix, nan=0.0, posinf=np.inf, neginf=-np.inf)
+
+
+    def user_rows(self) -> pd.Index:
+        """
+        Returns:
+            result (pd.Index): User names of the rows of the feature matrix, a user has a row for every year, sorted by the year
+        """
+        user_ids, _ = self._user_years()
+        return pd.Index(self.users[user_ids], name='user_id')
+
+
+    def _user_years(self) -> tuple:
+        """
+        Numbers the distinct (user, year) pairs of the user weeks, ordered by user id and year.
+        Returns:
+            result (tuple): User id of every pair and the pair of every user week
+        """
+        years = self.weeks.to_numpy(dtype=np.int64)[self.user_weeks & ((1 << WEEK_BITS) - 1)] // 100
+        user_years, row_ids = np.unique(((self.user_weeks >> WEEK_BITS) << YEAR_BITS) | years, return_inverse=True)
+        return user_years >> YEAR_BITS, row_ids
+
+
+    def _variation_coefficient(self, dimension:str, row_ids:np.ndarray, rows:int) -> np.ndarray:
+        """
+        Standard deviation of the distinct items per week of every user and year divided by their mean, over the weeks 
+        of the year the user streamed in.
+        """
+        item_user_weeks = self.week_items[dimension] >> ITEM_BITS
+        distinct = np.searchsorted(item_user_weeks, self.user_weeks, side='right') \
+                   - np.searchsorted(item_user_weeks, self.user_weeks, side='left')
+        weeks = np.bincount(row_ids, minlength=rows)
+        mean = np.bincount(row_ids, weights=distinct, minlength=rows) / weeks
+        squares = np.bincount(row_ids, weights=(distinct - mean[row_ids]) ** 2, minlength=rows)
+        variance = np.where(weeks > 1, squares / (weeks - 1), np.nan)
+        return np.sqrt(variance) / mean
+
+
+    def frame(self) -> pd.DataFrame:
+        """
+        Returns:
+            result (pd.DataFrame): Feature matrix indexed by user_id, a user has a row for every year
+        """
+        return pd.DataFrame(self.features(), index=self.user_rows(), columns=FEATURE_COLUMNS)
+
+
+    def _save(self):
+        """
+        Writes the feature matrix, the user index and the counters. Every file is replaced at once, so readers never see a partial file.
+        The counters are written last, so they are never ahead of the matrix, and read_features checks, that the matrix
+        and the user index have the same rows.
+        """
+        matrix = self.features()
+        temporary_path = self._file_path(f"{FEATURES_FILE}.{os.getpid()}.tmp")
+        features = np.lib.format.open_memmap(temporary_path, mode='w+', dtype=np.float64, shape=matrix.shape)
+        features[:] = matrix
+        features.flush()
+        del features
+        os.replace(temporary_path, self._file_path(FEATURES_FILE))
+        self._write(USERS_FILE, lambda f: np.save(f, np.array(self.user_rows(), dtype=str)))
+        state = { 'users': np.array(self.users, dtype=str), 'weeks': self.weeks.to_numpy(dtype=np.int64),
+                  'weekday_counts': self.weekday_counts, 'category_counts': self.category_counts, 'user_weeks': self.user_weeks,
+                  'last_rowid': np.array(self.last_rowid), 'generation': np.array(self.generation or (), dtype=np.int64),
+                  'database': np.array([value or '' for value in self.database or ()], dtype=str) }
+        for dimension in DIMENSIONS:
+            state[f"{dimension}_items"] = np.array(self.items[dimension], dtype=str)
+            state[f"{dimension}_week_items"] = self.week_items[dimension]
+        self._write(STATE_FILE, lambda f: np.savez(f, **state))
+
+
+    def _load_state(self):
+        with np.load(self._file_path(STATE_FILE)) as state:
+            self.users = pd.Index(state['users'].astype(object))
+            self.weeks = pd.Index(state['weeks'])
+            self.weekday_counts = state['weekday_counts']
+            self.category_counts = state['category_counts']
+            self.user_weeks = state['user_weeks']
+            self.last_rowid = int(state['last_rowid'])
+            self.generation = tuple(int(value) for value in state['generation']) or None
+            # Counters saved without the database identity are rebuilt by the next update
+            database = state['database'] if 'database' in state.files else ()
+            self.database = tuple(str(value) or None for value in database) or None
+            for dimension in DIMENSIONS:
+                self.items[dimension] = pd.Index(state[f"{dimension}_items"].astype(object))
+                self.week_items[dimension] = state[f"{dimension}_week_items"]
+
+
+    def _write(self, file_name:str, write):
+        temporary_path = self._file_path(f"{file_name}.{os.getpid()}.tmp")
+        with open(temporary_path, 'wb') as f:
+            write(f)
+        os.replace(temporary_path, self._file_path(file_name))
+
+
+    def _file_path(self, file_name:str) -> str:
+        return os.path.join(self.path, file_name)
+
+
+def read_features(path:str) -> pd.DataFrame:
+    """
+    Reads the feature matrix of a UserFeatureStore folder, memory mapped. The matrix and the user index are replaced one after
+    the other by an update, so they are read again, if their rows don't match.
+    Parameters:
+        path (str): Folder of the feature matrix
+    Returns:
+        result (pd.DataFrame): Feature matrix indexed by user_id
+    """
+    for _ in range(READ_ATTEMPTS):
+        matrix = np.load(os.path.join(path, FEATURES_FILE), mmap_mode='r')
+        users = np.load(os.path.join(path, USERS_FILE))
+        if len(matrix) == len(users):
+            return pd.DataFrame(matrix, index=pd.Index(users.astype(object), name='user_id'), columns=FEATURE_COLUMNS, copy=False)
+    raise ValueError(f"The feature matrix and the user index in {path} have different rows, an update is still writing them")
+
+
+def extend_index(index:pd.Index, values:pd.Series) -> pd.Index:
+    """
+    Appends the values, that are not in the index yet, so the ids of the known values stay the same.
+    Parameters:
+        index (pd.Index): Known values, their position is their id
+        values (pd.Series): Values of a chunk
+    Returns:
+        result (pd.Index): Known and new values
+    """
+    unique_values = pd.unique(values)
+    new_values = unique_values[index.get_indexer(unique_values) == -1]
+    return index.append(pd.Index(new_values, dtype=index.dtype)) if len(new_values) else index
+
+
+def grow(counts:np.ndarray, rows:int) -> np.ndarray:
+    """
+    Adds zero rows for new users to a counter array.
+    Parameters:
+        counts (np.ndarray): Counters per user
+        rows (int): Number of users
+    Returns:
+        result (np.ndarray): Counters with a row per user
+    """
+    if rows <= len(counts):
+        return counts
+    return np.vstack([counts, np.zeros((rows - len(counts), counts.shape[1]), dtype=counts.dtype)])
+
+
+def check_ids(count:int, bits:int, name:str):
+    if count > 1 << bits:
+        raise ValueError(f"More than {1 << bits} {name} don't fit into the packed keys")
@@ -0,0 +1,88 @@
+import os
+from datetime import datetime
+from libs.etl import helper
+from libs.models.manifest import Manifest, STATUS_INVALID, STATUS_LOADED
+from libs.models.scheduler import PipelineScheduler
+from libs.models.spotify_pipelinerunner import SpotifyPipelineRunner
+
+# Data files, that are picked up from the ingest folder on startup
+BACKLOG_SUFFIXES = tuple(suffix + compression for suffix in ('.json', '.jsonl', '.ndjson') for compression in ('', *helper.DECOMPRESSORS))
+
+
+def scan_backlog(ingest_path:str, modified_before:float = None) -> list:
+    """
+    Lists the data files, that are waiting in the ingest folder, oldest first.
+    Parameters:
+        ingest_path (str): Ingest folder
+        modified_before (float): Only list files modified before this timestamp, 
+                                 newer files are left to the observer
+    Returns:
+        result (list): File paths
+    """
+    files = []
+    with os.scandir(ingest_path) as entries:
+        for entry in entries:
+            if not entry.is_file() or not entry.name.lower().endswith(BACKLOG_SUFFIXES):
+                continue
+            modified = entry.stat().st_mtime
+            if modified_before is not None and modified >= modified_before:
+                continue
+            files.append((modified, entry.name, entry.path))
+    return [path for _, _, path in sorted(files)]
+
+
+def drain_backlog(ingest_path:str, pipeline_runner:SpotifyPipelineRunner, manifest:Manifest, 
+                  scheduler:PipelineScheduler = None, modified_before:float = None, defer_indexes_from:int = None) -> dict:
+    """
+    Processes the files, that arrived while the pipeline was not running. Files the manifest already marks as
+    loaded or invalid are only moved to their folder. All other files are processed by the scheduler in parallel,
+    or one after another if there is no scheduler. Returns after the last file has been processed.
+    Parameters:
+        ingest_path (str): Ingest folder
+        pipeline_runner (SpotifyPipelineRunner): Pipeline runner
+        manifest (Manifest): Manifest of processed files
+        scheduler (PipelineScheduler): Running scheduler
+        modified_before (float): Only process files modified before this timestamp
+        defer_indexes_from (int): Drop the secondary indexes while processing at least this many files, 
+                                  None keeps them
+    Returns:
+        result (dict): Number of processed and skipped files
+    """
+    backlog = scan_backlog(ingest_path, modified_before=modified_before)
+    print(f'{datetime.now()} - Draining backlog of {len(backlog)} files.')
+    stats = { 'processed': 0, 'skipped': 0 }
+    pending = []
+    for src_path in backlog:
+        content_hash = helper.hash_file(src_path)
+        status = manifest.lookup(src_path, content_hash=content_hash)
+        if status == STATUS_LOADED:
+            pipeline_runner.copy_file(src_path, pipeline_runner.loaded_data_path)
+            stats['skipped'] += 1
+        elif status == STATUS_INVALID:
+            pipeline_runner.copy_file(src_path, pipeline_runner.invalide_data_path)
+            stats['skipped'] += 1
+        else:
+            # The hash is passed on, so the file is not read again to hash it
+            pending.append((src_path, content_hash))
+
+    defer_indexes = defer_indexes_from is not None and len(pending) >= defer_indexes_from
+    if defer_indexes:
+        pipeline_runner.defer_indexes()
+    try:
+        for src_path, content_hash in pending:
+            stats['processed'] += 1
+            if scheduler:
+                scheduler.submit(src_path, content_hash=content_hash)
+                continue
+            try:
+                pipeline_runner.run_pipeline(src_path=src_path, content_hash=content_hash)
+            except Exception as e:
+                print(e)
+                pipeline_runner.on_error(src_path=src_path)
+        if scheduler:
+            scheduler.wait_until_idle()
+    finally:
+        if defer_indexes:
+            pipeline_runner.rebuild_indexes()
+    print(f"{datetime.now()} - Backlog drained, processed {stats['processed']} and skipped {stats['skipped']} files.")
+    return stats
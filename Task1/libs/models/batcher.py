@@ -0,0 +1,107 @@
+import os
+import threading
+import time
+from libs.models.spotify_pipelinerunner import SpotifyPipelineRunner
+
+
+class MicroBatcher:
+    """
+    Collects incoming files and runs them through the pipeline as one batch, as soon as the batch reaches 
+    its file or size limit or the oldest file has waited for max_latency seconds.
+    """
+    pipeline_runner:SpotifyPipelineRunner
+    max_files:int
+    max_bytes:int
+    max_latency:float
+
+
+    def __init__(self, pipeline_runner:SpotifyPipelineRunner, max_files:int = 100, max_bytes:int = 64 * 1024**2, max_latency:float = 5.0):
+        """
+        Parameters:
+            pipeline_runner (SpotifyPipelineRunner): Pipeline runner
+            max_files (int): Maximum number of files per batch
+            max_bytes (int): Maximum total file size per batch
+            max_latency (float): Maximum seconds a file waits for its batch
+        """
+        self.pipeline_runner = pipeline_runner
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.max_latency = max_latency
+        self._condition = threading.Condition()
+        self._paths = []
+        self._bytes = 0
+        self._first_arrival = None
+        self._stopped = False
+        self._flusher = None
+
+
+    def start(self):
+        """
+        Starts the thread, that runs the batches.
+        """
+        self._flusher = threading.Thread(target=self._run, name='pipeline-batcher', daemon=True)
+        self._flusher.start()
+        print(f'MicroBatcher is running with batches of up to {self.max_files} files, {self.max_bytes} bytes or {self.max_latency} seconds.')
+
+
+    def add(self, src_path:str):
+        """
+        Adds a file to the current batch.
+        Parameters:
+            src_path (str): File source path
+        """
+        try:
+            size = os.path.getsize(src_path)
+        except OSError:
+            size = 0
+        with self._condition:
+            if not self._paths:
+                self._first_arrival = time.monotonic()
+            self._paths.append(src_path)
+            self._bytes += size
+            self._condition.notify()
+
+
+    def stop(self):
+        """
+        Runs the remaining files and stops the batch thread.
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._flusher.join()
+        print('MicroBatcher stopped.')
+
+
+    def _is_due(self) -> bool:
+        """
+        Checks whether the current batch has to be run.
+        Returns:
+            result (bool): True if a limit is reached
+        """
+        return ( self._stopped
+                 or len(self._paths) >= self.max_files
+                 or self._bytes >= self.max_bytes
+                 or time.monotonic() - self._first_arrival >= self.max_latency )
+
+
+    def _run(self):
+        """
+        Waits for due batches and runs them.
+        """
+        while True:
+            with self._condition:
+                while not self._paths or not self._is_due():
+                    if self._stopped and not self._paths:
+                        return
+                    timeout = None
+                    if self._paths:
+                        timeout = self._first_arrival + self.max_latency - time.monotonic()
+                    self._condition.wait(timeout)
+                src_paths = self._paths
+                self._paths = []
+                self._bytes = 0
+            try:
+                self.pipeline_runner.run_batch(src_paths)
+            except Exception as e:
+                print(e)
@@ -0,0 +1,71 @@
+import json
+import os
+import threading
+from datetime import datetime
+from libs.etl import helper
+
+STATUS_LOADED = 'loaded'
+STATUS_INVALID = 'invalid'
+
+
+class Manifest:
+    """
+    Append-only record of processed files (name, size, content hash and status), stored as JSON lines.
+    The last entry of a file name wins.
+    """
+    path:str
+    entries:dict
+
+
+    def __init__(self, path:str):
+        """
+        Parameters:
+            path (str): Path to the manifest file, it is created if it does not exist
+        """
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as manifest_file:
+                for line in manifest_file:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries[entry['name']] = entry
+
+
+    def lookup(self, src_path:str, content_hash:str = None) -> str:
+        """
+        Looks up the status of a file. The entry only counts if name, size and content hash are unchanged.
+        Parameters:
+            src_path (str): File source path
+            content_hash (str): Content hash of the file, computed if not provided
+        Returns:
+            result (str): Status of the file, None if it has not been processed
+        """
+        entry = self.entries.get(os.path.basename(src_path))
+        if entry is None or entry['size'] != os.path.getsize(src_path):
+            return None
+        if entry['content_hash'] != (content_hash or helper.hash_file(src_path)):
+            return None
+        return entry['status']
+
+
+    def record(self, src_path:str, status:str, content_hash:str = None):
+        """
+        Records the status of a file, while it is still at its source path.
+        Parameters:
+            src_path (str): File source path
+            status (str): Processing status
+            content_hash (str): Content hash of the file, computed if not provided
+        """
+        entry = { 'name': os.path.basename(src_path), 
+                  'size': os.path.getsize(src_path), 
+                  'content_hash': content_hash or helper.hash_file(src_path), 
+                  'status': status, 
+                  'recorded_at': datetime.now().isoformat() }
+        with self._lock:
+            with open(self.path, 'a') as manifest_file:
+                manifest_file.write(json.dumps(entry) + '\n')
+                manifest_file.flush()
+                os.fsync(manifest_file.fileno())
+            self.entries[entry['name']] = entry
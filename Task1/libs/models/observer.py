@@ -2,17 +2,23 @@ from datetime import datetime
 from watchdog.events import FileSystemEventHandler
 from libs.models.spotify_pipelinerunner import SpotifyPipelineRunner
 from libs.models.pipelinerunner import PipelineRunner
+from libs.models.scheduler import PipelineScheduler
+from libs.models.batcher import MicroBatcher
 
 class PipelineHandler(FileSystemEventHandler):
     """
     PipelineHandler used to observe the ingestion folder for incomming files.
     """
     pipeline_runner:SpotifyPipelineRunner
+    scheduler:PipelineScheduler
+    batcher:MicroBatcher
 
 
-    def __init__(self, pipeline_runner:PipelineRunner):
+    def __init__(self, pipeline_runner:PipelineRunner, scheduler:PipelineScheduler = None, batcher:MicroBatcher = None):
         print('PipelineHandler is running.')
         print('Waiting for new files to arrive in data/ingest')
+        self.scheduler = scheduler
+        self.batcher = batcher
         try:
             self.pipeline_runner = pipeline_runner
             self.pipeline_runner.create_database()
@@ -29,6 +35,12 @@ class PipelineHandler(FileSystemEventHandler):
             event (): Incomming event
         """
         print(f"{datetime.now()} - New file in pipeline: {event.src_path}")
+        if self.batcher:
+            self.batcher.add(event.src_path)
+            return
+        if self.scheduler:
+            self.scheduler.submit(event.src_path)
+            return
         try:             
             self.pipeline_runner.run_pipeline(src_path=event.src_path)   
         except Exception as e:
@@ -13,4 +13,9 @@ class PipelineRunner:
         Runs the data etl pipeline.
         Parameters:
             src_path (str): File source path
-        """
\ No newline at end of file
+        """
+
+    def close(self):
+        """
+        Releases the resources of the runner.
+        """
@@ -0,0 +1,248 @@
+import multiprocessing
+import queue
+import signal
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing.managers import SyncManager
+from typing import Iterator
+import pandas as pd
+from libs.etl import helper
+from libs.etl.metrics import FileMetrics
+from libs.models.spotify_pipelinerunner import SpotifyPipelineRunner
+
+_STOP = object()
+# Seconds the writer waits for the next batch, before it checks whether the worker has failed
+RESULT_POLL_SECONDS = 0.5
+# Pipeline runner of a worker process, see start_worker
+_worker_runner:SpotifyPipelineRunner = None
+
+
+def ignore_interrupts():
+    """
+    Lets the worker and manager processes ignore Control + c. The terminal sends it to all processes, but only the main 
+    process stops the pipeline, it finishes the queued files and then shuts the processes down.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def start_worker(pipeline_runner:SpotifyPipelineRunner):
+    """
+    Sets up a worker process. The pipeline runner is sent once per worker instead of with every file, so the worker keeps
+    its quarantine store and appends the rejected rows of all its files to the same segments.
+    Parameters:
+        pipeline_runner (SpotifyPipelineRunner): Pipeline runner
+    """
+    global _worker_runner
+    ignore_interrupts()
+    _worker_runner = pipeline_runner
+
+
+def prepare_file(src_path:str, batches) -> FileMetrics:
+    """
+    Extracts, validates and transforms a file in a worker process. The batches are handed to the writer one by one
+    through a bounded queue, so the worker holds only a few batches of the file at a time.
+    Parameters:
+        src_path (str): File source path
+        batches (queue.Queue): Queue of the transformed batches, followed by the stage metrics
+    Returns:
+        result (FileMetrics): The stage metrics
+    """
+    metrics = FileMetrics(src_path)
+    for df in _worker_runner.prepare(src_path, metrics):
+        batches.put((df, None))
+    batches.put((None, metrics))
+    return metrics
+
+
+def receive_batches(batches, future:Future, metrics:FileMetrics) -> Iterator[pd.DataFrame]:
+    """
+    Yields the batches of a file, that a worker process puts into the queue, and adds the stage metrics of the worker.
+    Parameters:
+        batches (queue.Queue): Queue of the transformed batches, followed by the stage metrics
+        future (Future): Worker task, that fills the queue
+        metrics (FileMetrics): Metrics of the writer
+    Returns:
+        result (Iterator[pd.DataFrame]): Transformed data, one dataframe per batch
+    """
+    while True:
+        try:
+            df, worker_metrics = batches.get(timeout=RESULT_POLL_SECONDS)
+        except queue.Empty:
+            if future.done():
+                # Raises the error of the worker
+                future.result()
+                raise RuntimeError('The worker finished without sending the end of the file')
+            continue
+        if worker_metrics is not None:
+            metrics.merge(worker_metrics)
+            return
+        yield df
+
+
+def discard_batches(batches, future:Future):
+    """
+    Drops the remaining batches of a file, that can't be loaded, so the worker doesn't block on the full queue.
+    Parameters:
+        batches (queue.Queue): Queue of the transformed batches
+        future (Future): Worker task, that fills the queue
+    """
+    while not future.done():
+        try:
+            batches.get(timeout=RESULT_POLL_SECONDS)
+        except queue.Empty:
+            pass
+
+
+class PipelineScheduler:
+    """
+    Runs the pipeline for several files at once. Extraction, validation and transformation run in a process pool,
+    while a single writer thread loads the results into the database one file after another. Each file streams its batches
+    to the writer through its own bounded queue, so the memory is bound by the batches in flight, not by the file sizes.
+    """
+    pipeline_runner:SpotifyPipelineRunner
+    workers:int
+    max_pending_batches:int
+    work_queue:queue.Queue
+    result_queue:queue.Queue
+
+
+    def __init__(self, pipeline_runner:SpotifyPipelineRunner, workers:int = None, queue_size:int = 100, max_pending_results:int = None,
+                 max_pending_batches:int = 2):
+        """
+        Parameters:
+            pipeline_runner (SpotifyPipelineRunner): Pipeline runner
+            workers (int): Number of worker processes, defaults to the number of cores
+            queue_size (int): Maximum number of waiting files, submit blocks as long as the queue is full
+            max_pending_results (int): Maximum number of files, that are in progress or wait for the writer,
+                                       defaults to twice the number of workers
+            max_pending_batches (int): Maximum number of transformed batches per file, that wait for the writer
+        """
+        self.pipeline_runner = pipeline_runner
+        self.workers = workers or multiprocessing.cpu_count()
+        self.max_pending_batches = max_pending_batches
+        self.work_queue = queue.Queue(maxsize=queue_size)
+        self.result_queue = queue.Queue()
+        self._pending_results = threading.BoundedSemaphore(max_pending_results or 2 * self.workers)
+        self._manager = None
+        self._pool = None
+        self._dispatcher = None
+        self._writer = None
+        self._in_flight = 0
+        self._idle = threading.Condition()
+
+
+    def start(self):
+        """
+        Starts the worker processes, the dispatcher and the writer thread. The queues of the batches live in a manager process,
+        which the workers and the writer can both reach.
+        """
+        context = multiprocessing.get_context('spawn')
+        self._manager = SyncManager(ctx=context)
+        self._manager.start(initializer=ignore_interrupts)
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=start_worker, 
+                                         initargs=(self.pipeline_runner,))
+        self._dispatcher = threading.Thread(target=self._dispatch, name='pipeline-dispatcher', daemon=True)
+        self._writer = threading.Thread(target=self._write, name='pipeline-writer', daemon=True)
+        self._dispatcher.start()
+        self._writer.start()
+        print(f'PipelineScheduler is running with {self.workers} workers.')
+
+
+    def submit(self, src_path:str, timeout:float = None, content_hash:str = None):
+        """
+        Queues a file for processing. Blocks while the work queue is full.
+        Parameters:
+            src_path (str): File source path
+            timeout (float): Maximum seconds to wait for a free slot, None waits forever
+            content_hash (str): Content hash of the file, computed by the dispatcher if not provided
+        """
+        with self._idle:
+            self._in_flight += 1
+        try:
+            self.work_queue.put((src_path, content_hash), timeout=timeout)
+        except queue.Full:
+            self._finished()
+            raise
+
+
+    def wait_until_idle(self):
+        """
+        Blocks until every submitted file has been loaded or moved to the invalid folder.
+        """
+        with self._idle:
+            self._idle.wait_for(lambda: self._in_flight == 0)
+
+
+    def _finished(self):
+        """
+        Marks one submitted file as done.
+        """
+        with self._idle:
+            self._in_flight -= 1
+            if self._in_flight == 0:
+                self._idle.notify_all()
+
+
+    def stop(self):
+        """
+        Processes all queued files and stops the workers and threads.
+        """
+        self.work_queue.put((_STOP, None))
+        self._dispatcher.join()
+        self._writer.join()
+        self._pool.shutdown()
+        self._manager.shutdown()
+        print('PipelineScheduler stopped.')
+
+
+    def _dispatch(self):
+        """
+        Hands queued files to the process pool, as long as the number of pending results allows it.
+        The results are passed on in the order the files arrived.
+        """
+        while True:
+            src_path, content_hash = self.work_queue.get()
+            if src_path is _STOP:
+                break
+            # Files, that have already been loaded, cost one hash instead of a pipeline run
+            try:
+                content_hash = content_hash or helper.hash_file(src_path)
+                if self.pipeline_runner.skip_if_loaded(src_path, content_hash):
+                    self._finished()
+                    continue
+            except Exception as e:
+                print(e)
+            self._pending_results.acquire()
+            batches = None
+            try:
+                batches = self._manager.Queue(maxsize=self.max_pending_batches)
+                future = self._pool.submit(prepare_file, src_path, batches)
+            except Exception as e:
+                future = Future()
+                future.set_exception(e)
+            self.result_queue.put((src_path, content_hash, batches, future))
+        self.result_queue.put((None, None, None, _STOP))
+
+
+    def _write(self):
+        """
+        Loads the transformed data into the database, one file at a time and batch by batch, while the worker
+        is still transforming the next batches, and moves the files.
+        """
+        while True:
+            src_path, content_hash, batches, future = self.result_queue.get()
+            if future is _STOP:
+                break
+            try:
+                if batches is None:
+                    future.result()
+                metrics = FileMetrics(src_path)
+                self.pipeline_runner.load_file(src_path, receive_batches(batches, future, metrics), metrics, content_hash=content_hash)
+            except Exception as e:
+                print(e)
+                if batches is not None:
+                    discard_batches(batches, future)
+                self.pipeline_runner.on_error(src_path=src_path)
+            finally:
+                self._pending_results.release()
+                self._finished()
@@ -0,0 +1,149 @@
+import os
+import re
+import sqlite3
+from contextlib import contextmanager
+
+MIGRATION_FILE = re.compile(r'^(\d+)_.+\.sql$')
+
+
+class SchemaManager:
+    """
+    Creates the database schema and applies the versioned migrations of the migrations folder in order.
+    The applied version is kept in PRAGMA user_version. Secondary indexes can be dropped for a bulk backfill
+    and rebuilt afterwards, their definitions are kept in the deferred_index table in the meantime.
+    """
+    db_schema_path:str
+    migrations_path:str
+
+
+    def __init__(self, db_schema_path:str, migrations_path:str = None):
+        """
+        Parameters:
+            db_schema_path (str): Base schema script
+            migrations_path (str): Folder of the migration scripts named <version>_<name>.sql, 
+                                   defaults to the migrations folder next to the base schema
+        """
+        self.db_schema_path = db_schema_path
+        self.migrations_path = migrations_path or os.path.join(os.path.dirname(db_schema_path), 'migrations')
+
+
+    def migrations(self) -> list:
+        """
+        Lists the migration scripts.
+        Returns:
+            result (list): (version, path) tuples, ordered by version
+        """
+        if not os.path.isdir(self.migrations_path):
+            return []
+        migrations = []
+        for file_name in os.listdir(self.migrations_path):
+            match = MIGRATION_FILE.match(file_name)
+            if match:
+                migrations.append((int(match.group(1)), os.path.join(self.migrations_path, file_name)))
+        return sorted(migrations)
+
+
+    def version(self, conn:sqlite3.Connection) -> int:
+        """
+        Returns the schema version of the database.
+        Parameters:
+            conn (sqlite3.Connection): Database connection
+        Returns:
+            result (int): Version of the last applied migration
+        """
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+    def migrate(self, conn:sqlite3.Connection) -> int:
+        """
+        Creates the base schema and applies every migration, that is newer than the database. 
+        Each migration runs in its own transaction, together with the version update.
+        Parameters:
+            conn (sqlite3.Connection): Database connection
+        Returns:
+            result (int): Schema version after the migration
+        """
+        with open(self.db_schema_path, 'r') as sql_schema_file:
+            conn.executescript(sql_schema_file.read())
+        conn.commit()
+        version = self.version(conn)
+        for migration_version, path in self.migrations():
+            if migration_version <= version:
+                continue
+            with open(path, 'r') as migration_file:
+                sql_script = migration_file.read()
+            try:
+                conn.executescript(f"BEGIN;\n{sql_script}\nPRAGMA user_version = {migration_version};\nCOMMIT;")
+            except sqlite3.Error:
+                if conn.in_transaction:
+                    conn.rollback()
+                raise
+            print(f'Applied schema migration {os.path.basename(path)}.')
+            version = migration_version
+        return version
+
+
+    def secondary_indexes(self, conn:sqlite3.Connection) -> list:
+        """
+        Lists the indexes, that have been created by the schema or the migrations.
+        Parameters:
+            conn (sqlite3.Connection): Database connection
+        Returns:
+            result (list): (name, sql) tuples
+        """
+        return conn.execute("""SELECT name, sql FROM sqlite_master 
+                               WHERE  type = 'index' AND sql IS NOT NULL AND tbl_name != 'deferred_index'""").fetchall()
+
+
+    def defer_indexes(self, conn:sqlite3.Connection) -> int:
+        """
+        Drops the secondary indexes and keeps their definitions for rebuild_indexes.
+        Parameters:
+            conn (sqlite3.Connection): Database connection
+        Returns:
+            result (int): Number of dropped indexes
+        """
+        indexes = self.secondary_indexes(conn)
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO deferred_index (name, sql) VALUES(?,?)", indexes)
+            for name, _ in indexes:
+                conn.execute(f'DROP INDEX IF EXISTS "{name}"')
+        print(f'Deferred {len(indexes)} secondary indexes.')
+        return len(indexes)
+
+
+    def rebuild_indexes(self, conn:sqlite3.Connection) -> int:
+        """
+        Recreates the deferred indexes and updates the query planner statistics.
+        Parameters:
+            conn (sqlite3.Connection): Database connection
+        Returns:
+            result (int): Number of rebuilt indexes
+        """
+        deferred = conn.execute("SELECT name, sql FROM deferred_index").fetchall()
+        if not deferred:
+            return 0
+        existing = {name for name, _ in self.secondary_indexes(conn)}
+        with conn:
+            for name, sql in deferred:
+                if name not in existing:
+                    conn.execute(sql)
+                conn.execute("DELETE FROM deferred_index WHERE name = ?", (name,))
+        conn.execute("ANALYZE")
+        conn.commit()
+        print(f'Rebuilt {len(deferred)} secondary indexes.')
+        return len(deferred)
+
+
+    @contextmanager
+    def deferred_indexes(self, conn:sqlite3.Connection):
+        """
+        Drops the secondary indexes for the duration of a bulk backfill and rebuilds them afterwards.
+        Parameters:
+            conn (sqlite3.Connection): Database connection
+        """
+        self.defer_indexes(conn)
+        try:
+            yield
+        finally:
+            self.rebuild_indexes(conn)
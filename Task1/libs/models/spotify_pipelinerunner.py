@@ -1,8 +1,16 @@
 import os
-import shutil
 import sqlite3
-from libs.etl import etl
+import threading
+import time
+from typing import Iterable, Iterator
+import pandas as pd
+from libs.etl import etl, helper, hyperloglog
+from libs.etl.metrics import FileMetrics, rss_sampler
+from libs.etl.quarantine import QuarantineStore
+from libs.etl.release_cache import FileReleases, ReleaseCache
+from libs.models.manifest import Manifest, STATUS_INVALID, STATUS_LOADED
 from libs.models.pipelinerunner import PipelineRunner
+from libs.models.schema_manager import SchemaManager
 
 
 class SpotifyPipelineRunner(PipelineRunner):
@@ -13,53 +21,445 @@ class SpotifyPipelineRunner(PipelineRunner):
     db_schema_path: str
     invalide_data_path: str
     loaded_data_path:str
+    chunk_size:int
+    bulk_load:bool
+    staging:bool
+    cached_statements:int
+    release_cache:ReleaseCache
+    manifest:Manifest
+    metrics_sinks:list
+    quarantine:QuarantineStore
+    archive_compression:str
+    sketch_precision:int
+    schema_manager:SchemaManager
     
 
-    def __init__(self, db_path:str, invalide_data_path:str, loaded_data_path:str, db_schema_path:str  ):
+    def __init__(self, db_path:str, invalide_data_path:str, loaded_data_path:str, db_schema_path:str, chunk_size:int=None,
+                 bulk_load:bool=False, staging:bool=False, cached_statements:int=128, release_cache_size:int=1000000,
+                 manifest:Manifest=None, metrics_sinks:list=None, quarantine:QuarantineStore=None,
+                 archive_compression:str=None, user_sketch_error:float=0.01 ):
         self.db_path = db_path
         self.invalide_data_path = invalide_data_path
         self.loaded_data_path = loaded_data_path
         self.db_schema_path = db_schema_path
+        self.chunk_size = chunk_size
+        self.bulk_load = bulk_load
+        self.staging = staging
+        self.cached_statements = cached_statements
+        self.release_cache = ReleaseCache(max_size=release_cache_size) if release_cache_size else None
+        self.manifest = manifest
+        self.metrics_sinks = metrics_sinks or []
+        self.quarantine = quarantine
+        if archive_compression not in (None, *helper.COMPRESSORS):
+            raise ValueError(f"Unknown archive compression {archive_compression}")
+        self.archive_compression = archive_compression
+        self.sketch_precision = hyperloglog.precision_for_error(user_sketch_error)
+        self.schema_manager = SchemaManager(db_schema_path)
+        self._conn = None
+        self._lock = threading.RLock()
+
+
+    def __getstate__(self) -> dict:
+        """
+        Leaves out the connection, the lock, the release cache, the manifest and the metrics sinks, when the runner 
+        is sent to a worker process. The release backfill and the bookkeeping happen in the loading process.
+        """
+        state = self.__dict__.copy()
+        state['_conn'] = None
+        state['release_cache'] = None
+        state['manifest'] = None
+        state['metrics_sinks'] = []
+        del state['_lock']
+        return state
+
+
+    def __setstate__(self, state:dict):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
 
 
     def create_database(self):
         """
-        Creates the database.
+        Creates the database and migrates it to the latest schema version. Indexes, that are still deferred 
+        from an interrupted backfill, are rebuilt, and days without user sketch are sketched.
         """
-        conn= sqlite3.connect(self.db_path, check_same_thread=False)
-        with open(self.db_schema_path, 'r') as sql_schema_file:
-            sql_script = sql_schema_file.read()
-        conn.cursor().executescript(sql_script)
-        conn.commit()
-        conn.close()
+        with self._lock:
+            conn= self.connection()
+            self.schema_manager.migrate(conn)
+            self.schema_manager.rebuild_indexes(conn)
+            sketched_days = etl.backfill_user_sketches(conn, self.sketch_precision)
+            if sketched_days:
+                print(f"Sketched the users of {sketched_days} days.")
+            if self.release_cache is not None:
+                self.release_cache.warm(conn)
         
 
 
-    def run_pipeline(self, src_path:str):
+    def run_pipeline(self, src_path:str, content_hash:str = None):
         """
         Runs the data etl pipeline.
         Parameters:
             src_path (str): File source path
+            content_hash (str): Content hash of the file, computed if not provided
         """
+        content_hash = content_hash or helper.hash_file(src_path)
+        if self.skip_if_loaded(src_path, content_hash):
+            return
+        metrics = FileMetrics(src_path)
+        self.load_file(src_path, self.prepare(src_path, metrics), metrics, content_hash=content_hash)
+
+
+    def skip_if_loaded(self, src_path:str, content_hash:str) -> bool:
+        """
+        Moves a file to the loaded folder without processing it, if the ingest ledger shows, 
+        that the same content has already been loaded.
+        Parameters:
+            src_path (str): File source path
+            content_hash (str): Content hash of the file
+        Returns:
+            result (bool): True if the file has been skipped
+        """
+        with self._lock:
+            loaded = etl.is_loaded(self.connection(), content_hash)
+        if not loaded:
+            return False
+        print(f'{src_path} has already been loaded, skipping it.')
+        self.record(src_path, STATUS_LOADED, content_hash=content_hash)
+        self.copy_file(src_path, self.loaded_data_path)
+        self.emit_metrics(FileMetrics(src_path).finish('skipped'))
+        return True
+
+
+    def prepare(self, src_path:str, metrics:FileMetrics = None) -> Iterator[pd.DataFrame]:
+        """
+        Extracts, validates and transforms a file. In chunked mode the file is processed batch by batch, 
+        so the memory usage is bound by the chunk size instead of the file size. A first scan over the file collects
+        the releases of its tracks, so the chunks get the same releases as the whole file.
+        Parameters:
+            src_path (str): File source path
+            metrics (FileMetrics): Collects the stage metrics
+        Returns:
+            result (Iterator[pd.DataFrame]): Transformed data, one dataframe per batch
+        """
+        metrics = metrics or FileMetrics(src_path)
+        metrics.bytes_read += os.path.getsize(src_path)
+        if self.chunk_size:
+            with metrics.stage('scan_releases') as stage:
+                releases = etl.scan_releases(src_path, self.chunk_size)
+                stage.update(rows_in=releases.rows, rows_out=releases.rows)
+            metrics.bytes_read += os.path.getsize(src_path)
+            chunks = etl.extract_chunks(src_path, self.chunk_size)
+            chunk_number = 0
+            row_offset = 0
+            while True:
+                window = rss_sampler.open()
+                start = time.perf_counter()
+                try:
+                    df = next(chunks, None)
+                finally:
+                    peak_rss_kb = rss_sampler.close(window)
+                seconds = time.perf_counter() - start
+                if df is None:
+                    break
+                metrics.add('extract', seconds, rows_out=len(df), peak_rss_kb=peak_rss_kb)
+                chunk_number += 1
+                print(f'Start processing chunk {chunk_number}.')
+                rows = len(df)
+                df = self.validate(df, metrics, src_path=src_path, row_offset=row_offset)
+                row_offset += rows
+                if df.empty:
+                    continue
+                yield self.transform(df, metrics, releases)
+            self.flush_quarantine()
+            return
+
         print('Start extraction.')
-        df = etl.extract(src_path)
+        with metrics.stage('extract') as stage:
+            df = etl.extract(src_path)
+            stage['rows_out'] = len(df)
         print('Finished extraction.')
 
         print('Start validation.')
-        df = etl.validate_data(df, invalid_data_path=self.invalide_data_path)
+        df = self.validate(df, metrics, src_path=src_path)
+        self.flush_quarantine()
         print('Finished validateion.')
 
         print('Start transformation.')
-        df = etl.transform(df)
+        df = self.transform(df, metrics)
         print('Finished transformation.')
+        yield df
+
+
+    def validate(self, df:pd.DataFrame, metrics:FileMetrics, src_path:str = None, row_offset:int = 0, 
+                 origins:pd.DataFrame = None) -> pd.DataFrame:
+        """
+        Validates the extracted data and records the stage metrics.
+        Parameters:
+            df (pd.DataFrame): Extracted data
+            metrics (FileMetrics): Collects the stage metrics
+            src_path (str): File source path
+            row_offset (int): Position of the first row in the file
+            origins (pd.DataFrame): source_file and row_number of each row, see etl.validate_data
+        Returns:
+            result (pd.DataFrame): Valid data
+        """
+        with metrics.stage('validate') as stage:
+            rows_in = len(df)
+            df = etl.validate_data(df, invalid_data_path=self.invalide_data_path, quarantine=self.quarantine, 
+                                   source_file=src_path, row_offset=row_offset, origins=origins)
+            stage.update(rows_in=rows_in, rows_out=len(df), invalid_rows=rows_in - len(df))
+        return df
+
+
+    def transform(self, df:pd.DataFrame, metrics:FileMetrics, releases:FileReleases = None) -> pd.DataFrame:
+        """
+        Transforms the valid data into a compact dataframe and records the stage and memory metrics.
+        Parameters:
+            df (pd.DataFrame): Valid data
+            metrics (FileMetrics): Collects the stage metrics
+            releases (FileReleases): Releases of the whole file, if df is a chunk of it
+        Returns:
+            result (pd.DataFrame): Transformed data
+        """
+        with metrics.stage('transform') as stage:
+            rows_in = len(df)
+            df = etl.transform(df, releases=releases)
+            stage.update(rows_in=rows_in, rows_out=len(df))
+        # The compact batch is what the writer and, in the scheduler, the inter-process transfer have to hold
+        with metrics.stage('compact') as stage:
+            frame_bytes = etl.memory_usage(df)
+            df = etl.compact(df)
+            compact_bytes = etl.memory_usage(df)
+            stage.update(rows_in=len(df), rows_out=len(df))
+        metrics.add_memory(frame_bytes, compact_bytes)
+        print(f'Compacted batch of {len(df)} rows from {frame_bytes / 2**20:.2f} MiB to {compact_bytes / 2**20:.2f} MiB.')
+        return df
+
+
+    def load_file(self, src_path:str, frames:Iterable[pd.DataFrame], metrics:FileMetrics = None, content_hash:str = None):
+        """
+        Loads the transformed data of a file. The file is recorded in the ingest ledger and moved 
+        after the last batch has been loaded.
+        Parameters:
+            src_path (str): File source path
+            frames (Iterable[pd.DataFrame]): Transformed data, one dataframe per batch
+            metrics (FileMetrics): Collects the stage metrics
+            content_hash (str): Content hash of the file, computed if not provided
+        """
+        metrics = metrics or FileMetrics(src_path)
+        for df in frames:
+            print('Start load.')
+            self.load(df, metrics)
+            print('Finished load.')
+        content_hash = content_hash or helper.hash_file(src_path)
+        extracted = metrics.stages.get('extract', {}).get('rows_out', 0)
+        invalid = metrics.stages.get('validate', {}).get('invalid_rows', 0)
+        self.record_ingest(src_path, content_hash, STATUS_LOADED, rows_in=extracted, rows_loaded=extracted - invalid, invalid_rows=invalid)
+        self.record(src_path, STATUS_LOADED, content_hash=content_hash)
+        self.copy_file(src_path, self.loaded_data_path)
+        self.emit_metrics(metrics.finish(STATUS_LOADED))
+
+
+    def run_batch(self, src_paths:list):
+        """
+        Runs the data etl pipeline for several files at once. The files are extracted and validated one by one, 
+        transformed and loaded together, and moved one by one. If the batch can not be loaded, 
+        the files are processed separately.
+        Parameters:
+            src_paths (list): File source paths
+        """
+        frames = []
+        extracted_paths = []
+        content_hashes = {}
+        row_counts = {}
+        metrics = FileMetrics(f'batch of {len(src_paths)} files')
+        for src_path in src_paths:
+            try:
+                content_hashes[src_path] = helper.hash_file(src_path)
+                if self.skip_if_loaded(src_path, content_hashes[src_path]):
+                    continue
+                with metrics.stage('extract') as stage:
+                    df = etl.extract(src_path)
+                    stage['rows_out'] = len(df)
+                metrics.bytes_read += os.path.getsize(src_path)
+                frames.append(self.validate(df, metrics, src_path=src_path))
+                row_counts[src_path] = (len(df), len(frames[-1]))
+                extracted_paths.append(src_path)
+            except Exception as e:
+                print(e)
+                self.on_error(src_path=src_path)
+        self.flush_quarantine()
+        if not frames:
+            return
+
+        print(f'Start processing batch of {len(extracted_paths)} files.')
+        try:
+            df = pd.concat(frames, ignore_index=True)
+            self.load(self.transform(df, metrics), metrics)
+        except Exception as e:
+            print(e)
+            print('Batch load failed, processing the files separately.')
+            for src_path in extracted_paths:
+                try:
+                    self.run_pipeline(src_path, content_hash=content_hashes[src_path])
+                except Exception as e:
+                    print(e)
+                    self.on_error(src_path=src_path)
+            return
+
+        for src_path in extracted_paths:
+            rows_in, rows_loaded = row_counts[src_path]
+            self.record_ingest(src_path, content_hashes[src_path], STATUS_LOADED, rows_in=rows_in, rows_loaded=rows_loaded, 
+                               invalid_rows=rows_in - rows_loaded)
+            self.record(src_path, STATUS_LOADED, content_hash=content_hashes[src_path])
+            self.copy_file(src_path, self.loaded_data_path)
+        self.emit_metrics(metrics.finish(STATUS_LOADED))
+        print(f'Finished batch of {len(extracted_paths)} files.')
+
+
+    def replay_quarantine(self, source_file:str = None, failure:str = None):
+        """
+        Runs the quarantined rows, that have not been replayed yet, through validation, transformation and load again,
+        e.g. after the schema has been fixed. Rows, that are still invalid, are quarantined again with their source file 
+        and row number. The rows are only marked as replayed, once they have been quarantined again or loaded, 
+        so they are replayed again after a failed load.
+        Parameters:
+            source_file (str): Only rows of this file
+            failure (str): Only rows, whose failures contain this text
+        """
+        if self.quarantine is None:
+            return
+        entries = self.quarantine.query(source_file=source_file, failure=failure)
+        df = self.quarantine.read(entries)
+        print(f'Replaying {len(df)} quarantined rows.')
+        if df.empty:
+            return
+        metrics = FileMetrics('quarantine replay')
+        invalid = etl.find_invalid_rows(df)
+        entry_ids = df.index
+        origins = entries.set_index('id').loc[entry_ids, ['source_file', 'row_number']].reset_index(drop=True)
+        df = self.validate(df.reset_index(drop=True), metrics, src_path='quarantine replay', origins=origins)
+        self.flush_quarantine()
+        self.quarantine.mark_replayed(entry_ids[invalid])
+        if not df.empty:
+            self.load(self.transform(df, metrics), metrics)
+        self.quarantine.mark_replayed(entry_ids[~invalid])
+        self.emit_metrics(metrics.finish(STATUS_LOADED))
+
+
+    def flush_quarantine(self):
+        """
+        Writes the buffered rows of the quarantine store.
+        """
+        if self.quarantine is not None:
+            self.quarantine.flush()
+
+
+    def defer_indexes(self):
+        """
+        Drops the secondary indexes before a bulk backfill, see rebuild_indexes.
+        """
+        with self._lock:
+            self.schema_manager.defer_indexes(self.connection())
+
+
+    def rebuild_indexes(self):
+        """
+        Rebuilds the secondary indexes after a bulk backfill.
+        """
+        with self._lock:
+            self.schema_manager.rebuild_indexes(self.connection())
+
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        Opens a database connection, configured for bulk loads if the bulk load mode is active.
+        Returns:
+            conn (sqlite3.Connection): Database connection
+        """
+        conn= sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=self.cached_statements)
+        if self.bulk_load:
+            etl.set_bulk_pragmas(conn)
+        return conn
+
+
+    def connection(self) -> sqlite3.Connection:
+        """
+        Returns the long-lived writer connection. It is opened on first use and reopened if it is no longer usable.
+        Returns:
+            conn (sqlite3.Connection): Database connection
+        """
+        with self._lock:
+            if self._conn is not None and not self.is_connection_healthy():
+                print('Database connection is broken, reconnecting.')
+                self.close()
+            if self._conn is None:
+                self._conn = self.connect()
+            return self._conn
+
+
+    def is_connection_healthy(self) -> bool:
+        """
+        Checks whether the writer connection still answers queries.
+        Returns:
+            result (bool): True if the connection is usable
+        """
+        try:
+            self._conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+
+    def close(self):
+        """
+        Closes the writer connection.
+        """
+        with self._lock:
+            if self._conn is None:
+                return
+            try:
+                if self._conn.in_transaction:
+                    self._conn.rollback()
+                self._conn.close()
+            except sqlite3.Error as e:
+                print(e)
+            self._conn = None
+
+
+    def load(self, df:pd.DataFrame, metrics:FileMetrics = None):
+        """
+        Backfills the releases and loads the transformed data, either table by table or in one bulk load transaction. 
+        On database errors the writer connection is closed, so the next load reconnects.
+        Parameters:
+            df (pd.DataFrame): Transformed data
+            metrics (FileMetrics): Collects the load metrics, in total and by table
+        """
+        with self._lock:
+            window = rss_sampler.open()
+            start = time.perf_counter()
+            try:
+                df = etl.backfill_releases(df, self.release_cache)
+                conn = self.connection()
+                try:
+                    if self.bulk_load:
+                        statistics = etl.bulk_load(df, db_conn=conn, staging=self.staging, sketch_precision=self.sketch_precision)
+                    else:
+                        statistics = etl.load(df, db_conn=conn, sketch_precision=self.sketch_precision)
+                except sqlite3.Error:
+                    self.close()
+                    raise
+                if self.release_cache is not None:
+                    self.release_cache.update(df)
+            finally:
+                peak_rss_kb = rss_sampler.close(window)
+            seconds = time.perf_counter() - start
+            if metrics is not None:
+                metrics.add('load', seconds, rows_in=len(df), rows_out=len(df), peak_rss_kb=peak_rss_kb)
+                for table, table_statistics in statistics.items():
+                    metrics.add(f'load.{table}', table_statistics['seconds'], 
+                                rows_in=table_statistics['rows_in'], rows_out=table_statistics['rows_loaded'])
 
-        print('Start load.')
-        conn= sqlite3.connect(self.db_path, check_same_thread=False)
-        etl.load(df, db_conn=conn)
-        self.copy_file(src_path, self.loaded_data_path)   
-        conn.close()
-        print('Finished load.')
-        
 
     def on_error(self, src_path:str):
         """
@@ -67,20 +467,73 @@ class SpotifyPipelineRunner(PipelineRunner):
         Parameters:
             src_path (str): File source path
         """
+        try:
+            self.record_ingest(src_path, helper.hash_file(src_path), STATUS_INVALID)
+        except OSError as e:
+            print(e)
+        self.record(src_path, STATUS_INVALID)
         faulty_file = self.copy_file(src_path, self.invalide_data_path)
         print(f"Data processing failed for file {faulty_file}")
+        self.emit_metrics(FileMetrics(src_path).finish(STATUS_INVALID))
+
+
+    def emit_metrics(self, metrics:FileMetrics):
+        """
+        Sends the metrics of a processed file to the metrics sinks.
+        Parameters:
+            metrics (FileMetrics): Metrics of a processed file
+        """
+        for sink in self.metrics_sinks:
+            try:
+                sink.emit(metrics)
+            except Exception as e:
+                print(e)
+
+
+    def record(self, src_path:str, status:str, content_hash:str = None):
+        """
+        Records the outcome of a file in the manifest, before the file is moved.
+        Parameters:
+            src_path (str): File source path
+            status (str): Processing status
+            content_hash (str): Content hash of the file, computed if not provided
+        """
+        if self.manifest is None:
+            return
+        try:
+            self.manifest.record(src_path, status, content_hash=content_hash)
+        except OSError as e:
+            print(e)
+
+
+    def record_ingest(self, src_path:str, content_hash:str, status:str, rows_in:int = 0, rows_loaded:int = 0, invalid_rows:int = 0):
+        """
+        Records the outcome and the row counts of a file in the ingest ledger of the database.
+        Parameters:
+            src_path (str): File source path
+            content_hash (str): Content hash of the file
+            status (str): Processing status
+            rows_in (int): Extracted rows
+            rows_loaded (int): Valid rows, that have been loaded
+            invalid_rows (int): Rejected rows
+        """
+        with self._lock:
+            try:
+                etl.record_ingest(self.connection(), content_hash, os.path.basename(src_path), os.path.getsize(src_path), status,
+                                  rows_in=rows_in, rows_loaded=rows_loaded, invalid_rows=invalid_rows)
+            except sqlite3.Error as e:
+                print(e)
 
 
     def copy_file(self, src_path:str, target_path):
         """
-        Copies a file to the target folder and deletes the source. 
+        Moves a file to the target folder. Files moved to the loaded folder are compressed, if archive compression is set.
         Parameters:
             src_path (str): File source path
             target_path (str): Target path
         """
-        target = f"{target_path}/{ os.path.basename(src_path)}"
-        shutil.copyfile(src_path, target)
-        os.remove(src_path)
+        compression = self.archive_compression if target_path == self.loaded_data_path else None
+        target = helper.move_file(src_path, target_path, compression=compression)
         print(f'Transfared {src_path} to {target}')
         return target
 
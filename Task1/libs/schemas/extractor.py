@@ -0,0 +1,89 @@
+from typing import Callable, Iterable
+import numpy as np
+import pandas as pd
+
+_MISSING = object()
+
+
+class ColumnExtractor:
+    """
+    Extracts the columns of a schema from JSON records, without flattening the whole records. 
+    The columns are the dotted paths json_normalize would create, and get the same values and dtypes:
+    a missing field is NaN, an explicit null None and a column, that no record contains, None.
+    """
+    columns: list
+
+
+    def __init__(self, columns:list):
+        """
+        Parameters:
+            columns (list): Dotted column paths, e.g. 'track_metadata.track_name'
+        """
+        self.columns = list(columns)
+        tree = {}
+        for position, column in enumerate(self.columns):
+            *parents, leaf = column.split('.')
+            node = tree
+            for key in parents:
+                node = node.setdefault(key, {})
+            node[leaf] = position
+        self._tree = tree
+
+
+    def extract(self, records:Iterable[dict]) -> pd.DataFrame:
+        """
+        Builds the dataframe of the schema columns, one column array at a time.
+        Parameters:
+            records (Iterable[dict]): JSON records, a single record may also be passed as dict
+        Returns:
+            result (pd.DataFrame): Dataframe with the schema columns
+        """
+        if isinstance(records, dict):
+            records = [records]
+        values = [[] for _ in self.columns]
+        read = _compile_node(self._tree, values)
+        for record in records:
+            read(record)
+        return pd.DataFrame({ column: _to_series(column_values) for column, column_values in zip(self.columns, values) },
+                            columns=self.columns)
+
+
+def _compile_node(node:dict, values:list) -> Callable[[dict], None]:
+    """
+    Builds the reader of one nesting level, which appends the value of each leaf to its column.
+    Parameters:
+        node (dict): Keys of the nesting level, either the position of a column or the next nesting level
+        values (list): Value list per column
+    Returns:
+        result (Callable): Function, that reads one (nested) record
+    """
+    leaves = [(key, values[child].append) for key, child in node.items() if not isinstance(child, dict)]
+    branches = [(key, _compile_node(child, values)) for key, child in node.items() if isinstance(child, dict)]
+
+    def read(record):
+        if not isinstance(record, dict):
+            for _, append in leaves:
+                append(_MISSING)
+            for _, read_branch in branches:
+                read_branch(None)
+            return
+        for key, append in leaves:
+            value = record.get(key, _MISSING)
+            # json_normalize flattens nested objects, so the path itself does not exist
+            append(_MISSING if isinstance(value, dict) else value)
+        for key, read_branch in branches:
+            read_branch(record.get(key))
+    return read
+
+
+def _to_series(values:list) -> pd.Series:
+    """
+    Turns the values of a column into a series, with the dtype pandas infers for records.
+    Parameters:
+        values (list): Column values, with a marker for missing fields
+    Returns:
+        result (pd.Series): Column
+    """
+    if all(value is _MISSING for value in values):
+        return pd.Series([None] * len(values), dtype=object)
+    return pd.Series([np.nan if value is _MISSING else value for value in values])
@@ -1,5 +1,7 @@
 from pandas_schema import Column, Schema
 from pandas_schema.validation import MatchesPatternValidation
+from libs.schemas.extractor import ColumnExtractor
+from libs.schemas.validator import SchemaValidator
 
 stream_schema=Schema([
         Column('track_metadata.additional_info.artist_msid', [MatchesPatternValidation(r'^[a-fA-F0-9]{8}-[a-fA-F0-9]{4}-[a-fA-F0-9]{4}-[a-fA-F0-9]{4}-[a-fA-F0-9]{12}$')], allow_empty=False),
@@ -20,3 +22,9 @@ stream_schema=Schema([
         Column('track_metadata.additional_info.totaldiscs', [MatchesPatternValidation(r'^\d+$')], allow_empty=True),
         Column('track_metadata.additional_info.totaltracks', [MatchesPatternValidation(r'^\d+$')], allow_empty=True)
 ])
+
+# Columns, the schema validates in their float representation (e.g. '0.0')
+stream_float_columns = ['track_metadata.additional_info.dedup_tag', 'track_metadata.additional_info.duration_ms']
+
+stream_validator = SchemaValidator(stream_schema)
+stream_extractor = ColumnExtractor(stream_schema.get_column_names())
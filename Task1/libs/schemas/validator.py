@@ -0,0 +1,234 @@
+import re
+from typing import Callable
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_categorical_dtype, is_float_dtype, is_integer_dtype, is_numeric_dtype
+from pandas_schema import Schema
+from pandas_schema.validation import MatchesPatternValidation
+
+UUID_PATTERN = r'^[a-fA-F0-9]{8}-[a-fA-F0-9]{4}-[a-fA-F0-9]{4}-[a-fA-F0-9]{4}-[a-fA-F0-9]{12}$'
+UUID_CHARACTERS = re.compile(r'[a-fA-F0-9]{8}-[a-fA-F0-9]{4}-[a-fA-F0-9]{4}-[a-fA-F0-9]{4}-[a-fA-F0-9]{12}')
+DIGITS_PATTERN = re.compile(r'\^\\d(?:\+|\{(\d+)\})\$')
+# Largest float, whose string representation is still written without exponent
+MAX_PLAIN_FLOAT = 1e16
+
+
+class ValidationResult:
+    """
+    Outcome of a schema validation.
+    """
+    invalid_rows: pd.Series
+    failures: dict
+    messages: dict
+
+
+    def __init__(self, invalid_rows:pd.Series, failures:dict, messages:dict):
+        self.invalid_rows = invalid_rows
+        self.failures = failures
+        self.messages = messages
+
+
+    def failure_reasons(self) -> pd.Series:
+        """
+        Collects the failure messages of every invalid row.
+        Returns:
+            result (pd.Series): List of '<column>: <message>' strings, indexed by the invalid rows
+        """
+        reasons = {row: [] for row in self.invalid_rows.index[self.invalid_rows]}
+        for column, failed in self.failures.items():
+            for row in failed.index[failed]:
+                reasons[row].extend(f"{column}: {message}" for message in self.messages[column])
+        return pd.Series(reasons, dtype=object)
+
+
+class SchemaValidator:
+    """
+    Validates a dataframe against a pandas_schema Schema. Every column gets checked at once instead of cell by cell,
+    with the same outcome as Schema.validate.
+    """
+    columns: list
+
+
+    def __init__(self, schema:Schema, columns:list=None):
+        column_names = columns or schema.get_column_names()
+        self.columns = [ (column, [(validation.message, compile_validation(validation)) for validation in column.validations])
+                         for column in schema.columns if column.name in column_names and column.validations ]
+
+
+    def validate(self, df:pd.DataFrame) -> ValidationResult:
+        """
+        Validates the df data against the schema.
+        Parameters:
+            df (pd.DataFrame): Dataframe, that contains all schema columns
+        Returns:
+            result (ValidationResult): Invalid row mask and failing rows per column
+        """
+        invalid_rows = pd.Series(False, index=df.index)
+        failures = {}
+        messages = {}
+        for column, checks in self.columns:
+            series = df[column.name]
+            failed = pd.Series(False, index=df.index)
+            failed_messages = []
+            for message, check in checks:
+                failed_check = ~check(series)
+                if column.allow_empty:
+                    failed_check &= is_not_empty(series)
+                if failed_check.any():
+                    failed |= failed_check
+                    failed_messages.append(message)
+            if failed_messages:
+                failures[column.name] = failed
+                messages[column.name] = failed_messages
+                invalid_rows |= failed
+        return ValidationResult(invalid_rows=invalid_rows, failures=failures, messages=messages)
+
+
+def is_not_empty(series:pd.Series) -> pd.Series:
+    """
+    Flags non empty values, the same way pandas_schema does for columns that allow empty values.
+    Parameters:
+        series (pd.Series): Column to check
+    Returns:
+        result (pd.Series): True for every non empty value
+    """
+    if is_categorical_dtype(series) or is_numeric_dtype(series):
+        return series.notnull()
+    # Values, that are not strings, count as empty
+    codes, uniques = pd.factorize(series.to_numpy(dtype=object))
+    not_empty = np.fromiter((isinstance(value, str) and len(value) > 0 for value in uniques), dtype=bool, count=len(uniques))
+    return pd.Series(np.append(not_empty, False)[codes], index=series.index)
+
+
+def compile_validation(validation) -> Callable[[pd.Series], pd.Series]:
+    """
+    Turns a pandas_schema validation into a column check. Pattern validations get a dedicated check,
+    every other validation keeps its own implementation.
+    Parameters:
+        validation (_SeriesValidation): pandas_schema validation
+    Returns:
+        result (Callable): Function, that returns True for every valid value of a column
+    """
+    if isinstance(validation, MatchesPatternValidation) and not validation.options and isinstance(validation.pattern, str):
+        return compile_pattern(validation.pattern)
+    return validation.validate
+
+
+def compile_pattern(pattern:str) -> Callable[[pd.Series], pd.Series]:
+    """
+    Builds a column check with the same result as pd.Series.astype(str).str.contains(pattern).
+    Parameters:
+        pattern (str): Regular expression
+    Returns:
+        result (Callable): Function, that returns True for every valid value of a column
+    """
+    if pattern == UUID_PATTERN:
+        return lambda series: _check_strings(series, lambda strings: _strip_line_break(strings).str.fullmatch(UUID_CHARACTERS))
+
+    digits = DIGITS_PATTERN.fullmatch(pattern)
+    if digits:
+        return _compile_digits_check(length=int(digits.group(1)) if digits.group(1) else None)
+
+    if pattern.startswith('^') and pattern.endswith('$') and not pattern.endswith('\\$') and '|' not in pattern:
+        inner = re.compile(pattern[1:-1])
+        float_pattern = pattern == r'^\d+.0$'
+        def check(series:pd.Series) -> pd.Series:
+            if float_pattern and is_float_dtype(series):
+                return _is_plain_integral_float(series)
+            return _check_strings(series, lambda strings: _fullmatch(strings, inner))
+        return check
+
+    return lambda series: _check_strings(series, lambda strings: strings.str.contains(pattern))
+
+
+def _compile_digits_check(length:int=None) -> Callable[[pd.Series], pd.Series]:
+    """
+    Builds a check for '^\\d+$' and '^\\d{n}$' patterns.
+    Parameters:
+        length (int): Exact number of digits, None for any number of digits
+    Returns:
+        result (Callable): Function, that returns True for every valid value of a column
+    """
+    def check(series:pd.Series) -> pd.Series:
+        if is_integer_dtype(series) and not is_categorical_dtype(series):
+            values = series.to_numpy(dtype=float, na_value=np.nan)
+            if length is None:
+                return pd.Series(values >= 0, index=series.index)
+            lower = 0 if length == 1 else 10**(length-1)
+            return pd.Series((values >= lower) & (values < 10**length), index=series.index)
+        if is_float_dtype(series):
+            # The string representation of a float always contains '.', 'e', 'nan' or 'inf'
+            return pd.Series(False, index=series.index)
+        return _check_strings(series, lambda strings: _is_decimal(_strip_line_break(strings), length))
+    return check
+
+
+def _is_plain_integral_float(series:pd.Series) -> pd.Series:
+    """
+    Flags floats, that are written as '<digits>.0'.
+    Parameters:
+        series (pd.Series): Float column
+    Returns:
+        result (pd.Series): True for every valid value of a column
+    """
+    values = series.to_numpy(dtype=float, na_value=np.nan)
+    with np.errstate(invalid='ignore'):
+        valid = (values >= 0) & ~np.signbit(values) & (values < MAX_PLAIN_FLOAT) & (np.floor(values) == values)
+    return pd.Series(valid, index=series.index)
+
+
+def _check_strings(series:pd.Series, check:Callable[[pd.Series], pd.Series]) -> pd.Series:
+    """
+    Runs a check on the string representation of a column. Each distinct value gets checked only once.
+    Parameters:
+        series (pd.Series): Column
+        check (Callable): Function, that returns True for every valid string
+    Returns:
+        result (pd.Series): True for every valid value of a column
+    """
+    codes, uniques = pd.factorize(series.astype(str))
+    valid = check(pd.Series(uniques, dtype=object)).to_numpy(dtype=bool)
+    return pd.Series(valid[codes], index=series.index)
+
+
+def _fullmatch(strings:pd.Series, pattern:re.Pattern) -> pd.Series:
+    """
+    Matches the whole string or, as '$' matches in front of a trailing line break, the string without it.
+    Parameters:
+        strings (pd.Series): Distinct strings
+        pattern (re.Pattern): Regular expression without '^' and '$'
+    Returns:
+        result (pd.Series): True for every matching string
+    """
+    valid = strings.str.fullmatch(pattern)
+    line_break = strings.str.endswith('\n')
+    if line_break.any():
+        valid |= line_break & strings.str[:-1].str.fullmatch(pattern)
+    return valid
+
+
+def _is_decimal(strings:pd.Series, length:int=None) -> pd.Series:
+    """
+    Flags strings, that only consist of digits.
+    Parameters:
+        strings (pd.Series): Distinct strings
+        length (int): Exact number of digits, None for any number of digits
+    Returns:
+        result (pd.Series): True for every valid string
+    """
+    valid = strings.str.isdecimal()
+    if length is not None:
+        valid &= strings.str.len() == length
+    return valid
+
+
+def _strip_line_break(strings:pd.Series) -> pd.Series:
+    """
+    Removes one trailing line break, as '$' matches in front of it. 
+    Only used for patterns, that can not match a line break themselves.
+    Parameters:
+        strings (pd.Series): Distinct strings
+    Returns:
+        result (pd.Series): Strings without trailing line break
+    """
+    return strings.str.removesuffix('\n')
@@ -1,6 +1,12 @@
 from watchdog.observers import Observer
 from libs.models.spotify_pipelinerunner import SpotifyPipelineRunner
 from libs.models.observer import PipelineHandler
+from libs.models.scheduler import PipelineScheduler
+from libs.models.batcher import MicroBatcher
+from libs.models.manifest import Manifest
+from libs.models.backlog import drain_backlog
+from libs.etl.metrics import LogSink, TextFileSink
+from libs.etl.quarantine import QuarantineStore
 import time
 
 DB_PATH = r'./database/spotify.db'
@@ -8,18 +14,84 @@ INGEST_PATH = r'./data/ingest'
 INVALIDE_DATA_PATH = r'./data/invalide'
 FINISHED_DATA_PATH = r'./data/loaded'
 CREATE_DB_TABLE_STATEMENT = r'./Task1/db/spotify_db_schema.sql'
+# Record of processed files, so a restarted pipeline skips files it already finished
+MANIFEST_PATH = r'./data/manifest.jsonl'
+# Process the files, that are already in the ingest folder on startup
+DRAIN_BACKLOG = True
+# Drop the secondary indexes while draining a backlog of at least this many files and rebuild them afterwards (None never drops them)
+DEFER_INDEXES_FROM_FILES = 20
+# Records per batch, set to None to process each file in one piece
+CHUNK_SIZE = 50000
+# Load each batch in one transaction, optionally through temporary staging tables
+BULK_LOAD = True
+STAGING_TABLES = False
+# Worker processes for extraction, validation and transformation (None uses all cores, 0 runs the pipeline on the observer thread)
+WORKERS = None
+# Maximum number of files waiting for a worker, new files are blocked while the queue is full
+QUEUE_SIZE = 100
+# Collect small files and process them as one batch, until one of the limits is reached
+MICRO_BATCH = False
+MICRO_BATCH_MAX_FILES = 100
+MICRO_BATCH_MAX_BYTES = 64 * 1024**2
+MICRO_BATCH_MAX_LATENCY = 5.0
+# Per file and stage metrics (wall time, rows, invalid rows, bytes read, peak RSS), printed and/or appended to a text file
+METRICS_LOG = True
+METRICS_PATH = None
+# Invalid rows are appended to rotating JSON lines segments with an index for replay (None writes one JSON file per file instead)
+QUARANTINE_PATH = r'./data/invalide/quarantine'
+QUARANTINE_COMPRESS = True
+# Compress files moved to the loaded folder (None, 'gzip' or 'xz')
+ARCHIVE_COMPRESSION = 'gzip'
+# Relative standard error of the daily active user sketches, the analyses can still count exactly
+USER_SKETCH_ERROR = 0.01
 
 def main():
+    metrics_sinks = []
+    if METRICS_LOG:
+        metrics_sinks.append(LogSink())
+    if METRICS_PATH:
+        metrics_sinks.append(TextFileSink(METRICS_PATH))
+    quarantine = QuarantineStore(QUARANTINE_PATH, compress=QUARANTINE_COMPRESS) if QUARANTINE_PATH else None
     pipeline_runner = SpotifyPipelineRunner(    db_path=DB_PATH, 
                                                 invalide_data_path=INVALIDE_DATA_PATH, 
                                                 loaded_data_path= FINISHED_DATA_PATH,
-                                                db_schema_path=CREATE_DB_TABLE_STATEMENT)
-    event_handler = PipelineHandler(pipeline_runner)
+                                                db_schema_path=CREATE_DB_TABLE_STATEMENT,
+                                                chunk_size=CHUNK_SIZE,
+                                                bulk_load=BULK_LOAD,
+                                                staging=STAGING_TABLES,
+                                                manifest=Manifest(MANIFEST_PATH),
+                                                metrics_sinks=metrics_sinks,
+                                                quarantine=quarantine,
+                                                archive_compression=ARCHIVE_COMPRESSION,
+                                                user_sketch_error=USER_SKETCH_ERROR)
+    scheduler = None
+    batcher = None
+    if MICRO_BATCH:
+        batcher = MicroBatcher(pipeline_runner, max_files=MICRO_BATCH_MAX_FILES, 
+                               max_bytes=MICRO_BATCH_MAX_BYTES, max_latency=MICRO_BATCH_MAX_LATENCY)
+        batcher.start()
+    elif WORKERS != 0:
+        scheduler = PipelineScheduler(pipeline_runner, workers=WORKERS, queue_size=QUEUE_SIZE)
+        scheduler.start()
+    event_handler = PipelineHandler(pipeline_runner, scheduler=scheduler, batcher=batcher)
     observer = Observer()
     observer.schedule(event_handler, path=INGEST_PATH, recursive=False)
+    started_at = time.time()
     observer.start()
-
     try:
+        if DRAIN_BACKLOG:
+            # Files created after the observer started are picked up by the observer
+            drain_scheduler = scheduler
+            if drain_scheduler is None and WORKERS != 0:
+                drain_scheduler = PipelineScheduler(pipeline_runner, workers=WORKERS, queue_size=QUEUE_SIZE)
+                drain_scheduler.start()
+            try:
+                drain_backlog(INGEST_PATH, pipeline_runner, pipeline_runner.manifest, scheduler=drain_scheduler, 
+                              modified_before=started_at, defer_indexes_from=DEFER_INDEXES_FROM_FILES)
+            finally:
+                if drain_scheduler is not scheduler:
+                    drain_scheduler.stop()
+
         while True:
             # Set the thread sleep time
             time.sleep(1)
@@ -27,6 +99,13 @@ def main():
         print('Stop')
         observer.stop()
     observer.join()
+    if scheduler:
+        scheduler.stop()
+    if batcher:
+        batcher.stop()
+    pipeline_runner.close()
+    if quarantine:
+        quarantine.close()
 
 
 if __name__ == '__main__':
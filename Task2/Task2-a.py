@@ -1,10 +1,16 @@
 from matplotlib import pyplot as plt
-from pandasql import sqldf
 import pandas as pd
 import sqlite3
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Task1'))
+from libs.etl import queries, result_cache, table_profile
 
 DB_PATH= r'database/spotify.db'
-pysqldf = lambda q: sqldf(q, locals())
+# Folder and size of the cached query results, they are reused until the next load changes the database.
+# The results are unpickled, so the folder must only be writable by trusted users
+CACHE_PATH= r'database/query_cache'
+CACHE_MAX_BYTES= 256 * 1024 * 1024
 
 #################################################################################################
 #                                                                                               #
@@ -13,35 +19,16 @@ pysqldf = lambda q: sqldf(q, locals())
 #################################################################################################
 
 
-def query_total_entries_per_table(conn:sqlite3.Connection) -> pd.DataFrame:
+def query_total_entries_per_table(conn:sqlite3.Connection, exact:bool = False) -> pd.DataFrame:
     """
     Queries the total entries of users, streams, artists, releases and tracks.
     Parameters:
         conn (sqlite3.Connection): Databse connection
+        exact (bool): Count the users exactly instead of merging the daily user sketches
     Returns:
         result (pd.DataFrame): Total entries of users, streams, artists, releases and tracks.
     """
-    return pd.read_sql_query("""
-            SELECT  (  
-                        SELECT COUNT( DISTINCT user_name) 
-                        FROM stream
-                    ) AS user_count, 
-                    (   
-                        SELECT COUNT(1) 
-                        FROM stream
-                    ) AS stream_count, 
-                    (   
-                        SELECT COUNT(1) 
-                        FROM artist
-                    ) AS artist_count, 
-                    (   
-                        SELECT COUNT(1) 
-                        FROM release
-                    ) AS release_count, 
-                    (   
-                        SELECT COUNT(1) 
-                        FROM track
-                    ) AS track_count""",conn)
+    return queries.total_entries(conn, exact=exact)
 
 
 def query_null_entry_statistic_on_columns(conn:sqlite3.Connection, table:str, columns:set) -> pd.DataFrame:
@@ -54,55 +41,34 @@ def query_null_entry_statistic_on_columns(conn:sqlite3.Connection, table:str, co
     Returns:
         result (pd.DataFrame): 
     """
-    frames = []
-    for column in columns:
-        null_statistic = pd.read_sql_query(f"""  
-                SELECT  
-                    ( printf( "%.3f" , 100.0*(COUNT(*)-COUNT({column}))/COUNT(*)) ) AS {column}
-                FROM {table}; """, conn)
-
-        frames.append( pd.melt( frame=null_statistic,
-                                id_vars=None, 
-                                value_vars=null_statistic.columns, 
-                                value_name='null_values_in_percent',
-                                var_name='column'))
-        
-        result = pd.concat(frames)
-        result = result.set_index('column')
-    return result
+    null_statistic = queries.null_percentages(conn, table=table, columns=columns)
+    result = pd.melt( frame=null_statistic,
+                      id_vars=None, 
+                      value_vars=null_statistic.columns, 
+                      value_name='null_values_in_percent',
+                      var_name='column')
+    return result.set_index('column')
 
 
-def query_active_users_over_weeks_and_weekdays_by_year(conn:sqlite3.Connection, year: str) -> pd.DataFrame:
+def query_active_users_over_weeks_and_weekdays_by_year(conn:sqlite3.Connection, year: str, exact:bool = False) -> pd.DataFrame:
     """
     Queries active users distributed over calendar weeks and weekdays based on a defined year.
     Parameters:
         conn (sqlite3.Connection): Databse connection
         year (str): The year for which the data is to be queried
+        exact (bool): Count the users exactly instead of merging the daily user sketches
     """
-    return pd.read_sql_query(f"""  
-            SELECT   COUNT( DISTINCT lf.user_name) AS active_user, week, weekday, day_of_week, year
-            FROM     stream lf 
-                        INNER JOIN time t on lf.timestamp_unix_id == t.timestamp_unix_id
-            WHERE year = '{year}'
-            GROUP BY year, week, day_of_week""", conn)
+    return queries.active_users_by_weekday(conn, year=year, exact=exact)
 
 
-def query_streams_over_weekdays(conn:sqlite3.Connection) -> pd.DataFrame:
+def query_streams_over_weekdays(conn:sqlite3.Connection, year:str = None) -> pd.DataFrame:
     """
     Queries the average streams over weekdays by year.
     Parameters:
         conn (sqlite3.Connection): Databse connection
+        year (str): Only the given year, all years by default
     """
-    stream_count_weekday_by_week = pd.read_sql_query(f"""  
-            SELECT year, week, weekday, COUNT(1) AS streams
-            FROM stream lf 
-                    INNER JOIN time t ON lf.timestamp_unix_id == t.timestamp_unix_id
-            GROUP BY year, week, weekday""", conn)
-
-    return sqldf("""
-            SELECT weekday, AVG(streams ) OVER(PARTITION BY weekday ) AS avg_streams, year
-            FROM stream_count_weekday_by_week
-            GROUP BY weekday""")
+    return queries.streams_over_weekdays(conn, year=year)
 
 
 def query_entire_table(conn:sqlite3.Connection, table_name: str) -> pd.DataFrame:
@@ -114,108 +80,49 @@ def query_entire_table(conn:sqlite3.Connection, table_name: str) -> pd.DataFrame
     Returns:
         result (pd.DataFrame): Total entries of users, streams, artists, releases and tracks.
     """
-    return pd.read_sql_query(f"SELECT  * from {table_name}",conn)
+    return queries.entire_table(conn, table=table_name)
 
 
-def weekly_trend_track(conn:sqlite3.Connection, top_n:str = "5") -> pd.DataFrame:
+def weekly_trend_track(conn:sqlite3.Connection, top_n:str = "5", year:int = None, week:int = None) -> pd.DataFrame:
     """
     Queries the weekly top n ranked tracks and the positoin changes to prev week.
     Parameters:
         conn (sqlite3.Connection): Databse connection
         top_n (str): Amount of top tracks per week
+        year (int): Only the weeks of the given year, all weeks by default
+        week (int): Only the given week of the year
     Returns:
         result (pd.DataFrame): dataframe with the query output
     """
-    top_track_weekly_rank_table = pd.read_sql_query("""
-	        SELECT   year, week, track_name, artist_name, lf.track_msid,
-                     DENSE_RANK() OVER(PARTITION by year, week ORDER BY COUNT(lf.track_msid) DESC) as weekly_track_rank,
-                     COUNT(lf.track_msid) AS weekly_track
-            FROM    stream lf    INNER JOIN track tr ON lf.track_msid == tr.track_msid
-                                        INNER JOIN time t   ON lf.timestamp_unix_id == t.timestamp_unix_id
-                                        INNER JOIN artist a   ON lf.artist_msid == a.artist_msid
-            GROUP BY  lf.track_msid, year, week
-            ORDER BY  year, week, weekly_track DESC""", conn)
-
-    top_track_prev_week_rank_table = sqldf("""
-            SELECT    year, week, weekly_track_rank, weekly_track, track_name, artist_name,
-                            LAG(weekly_track_rank) OVER (partition by track_msid ) AS rank_previous_week
-            FROM      top_track_weekly_rank_table
-            ORDER BY  year, week, weekly_track_rank""")      
-	       
-    return sqldf(f"""
-            SELECT    year, week, weekly_track_rank, weekly_track, (track_name || ' ('|| artist_name|| ')') AS track_name , 
-                      (rank_previous_week - weekly_track_rank) as weekly_change_of_ranking
-            FROM      top_track_prev_week_rank_table
-            WHERE     weekly_track_rank <= {top_n}
-            ORDER BY  year DESC, week DESC, weekly_track_rank""")  
-
-
-def weekly_trend_artist(conn:sqlite3.Connection, top_n:str = "5") -> pd.DataFrame:
+    return queries.weekly_chart(conn, 'track', top_n=top_n, year=year, week=week)
+
+
+def weekly_trend_artist(conn:sqlite3.Connection, top_n:str = "5", year:int = None, week:int = None) -> pd.DataFrame:
     """
     Queries the weekly top n ranked artists and the positoin changes to prev week.
     Parameters:
         conn (sqlite3.Connection): Databse connection
         top_n (str): Amount of top artists per week
+        year (int): Only the weeks of the given year, all weeks by default
+        week (int): Only the given week of the year
     Returns:
         result (pd.DataFrame): dataframe with the query output
     """
-   
-    top_artist_weekly_rank_table = pd.read_sql_query("""
-	        SELECT   year, week, artist_name, lf.artist_msid,
-                     DENSE_RANK() OVER(PARTITION by year, week ORDER BY COUNT(lf.artist_msid) DESC) as weekly_artist_rank,
-                     COUNT(lf.artist_msid) AS weekly_artist
-            FROM     stream lf INNER JOIN artist a ON lf.artist_msid == a.artist_msid 
-                                INNER JOIN time t   ON lf.timestamp_unix_id == t.timestamp_unix_id
-
-            GROUP BY lf.artist_msid, year, week
-            ORDER BY year, week, weekly_artist DESC""", conn)
-
-    top_artist_prev_week_rank_table = sqldf("""
-            SELECT   year, week, weekly_artist_rank, weekly_artist, artist_name,
-                     LAG(weekly_artist_rank) OVER (partition by artist_msid ) AS rank_previous_week
-            FROM     top_artist_weekly_rank_table
-            ORDER BY year, week, weekly_artist_rank""")      
-	       
-    return sqldf(f"""
-            SELECT   year, week, weekly_artist_rank, weekly_artist, artist_name,
-                     (rank_previous_week- weekly_artist_rank) as weekly_change_of_ranking
-            FROM     top_artist_prev_week_rank_table
-            where    weekly_artist_rank <= {top_n} 
-            ORDER BY year DESC, week DESC, weekly_artist_rank""")
-
-
-def weekly_trend_release(conn:sqlite3.Connection, top_n:str = "5") -> pd.DataFrame:
+    return queries.weekly_chart(conn, 'artist', top_n=top_n, year=year, week=week)
+
+
+def weekly_trend_release(conn:sqlite3.Connection, top_n:str = "5", year:int = None, week:int = None) -> pd.DataFrame:
     """
     Queries the weekly top n ranked release and the positoin changes to prev week.
     Parameters:
         conn (sqlite3.Connection): Databse connection
         top_n (str): Amount of top release per week
+        year (int): Only the weeks of the given year, all weeks by default
+        week (int): Only the given week of the year
     Returns:
         result (pd.DataFrame): dataframe with the query output
     """
-    top_release_rank_table = pd.read_sql_query("""
-	        SELECT   year, week, release_name, artist_name, lf.release_msid,
-                     DENSE_RANK() OVER(PARTITION by year, week ORDER BY COUNT(lf.release_msid) DESC) as weekly_release_rank,
-                     COUNT(lf.release_msid) AS weekly_release
-            FROM     stream lf    INNER JOIN release r ON lf.release_msid == r.release_msid
-                                            INNER JOIN time t   ON lf.timestamp_unix_id == t.timestamp_unix_id
-                                            INNER JOIN artist a   ON lf.artist_msid == a.artist_msid
-            WHERE    lf.release_msid != "xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx"
-            GROUP BY lf.release_msid, year, week
-            ORDER BY year, week, weekly_release DESC""", conn)
-
-    top_release_prev_rank_table = sqldf("""
-            SELECT    year, week, weekly_release_rank, weekly_release, release_name, artist_name,
-                      LAG(weekly_release_rank) OVER (partition by release_msid ) AS rank_previous_week
-            FROM      top_release_rank_table
-            ORDER BY  year, week, weekly_release_rank""")      
-	       
-    return sqldf(f"""
-            SELECT    year, week, weekly_release_rank, weekly_release, release_name, artist_name,
-                      (rank_previous_week - weekly_release_rank) as weekly_change_of_ranking
-            FROM      top_release_prev_rank_table
-            where     weekly_release_rank <= {top_n}
-            ORDER BY  year DESC, week DESC, weekly_release_rank""")
+    return queries.weekly_chart(conn, 'release', top_n=top_n, year=year, week=week)
 
 
 #################################################################################################
@@ -303,30 +210,32 @@ def plot_chart_table(df:pd.DataFrame,year:int,week:int, ax:plt.axes, subject:str
 #################################################################################################
 
 
-def combine_chart_table_plots(conn:sqlite3.Connection, week:int, year:int):
+def combine_chart_table_plots(conn:sqlite3.Connection, week:int, year:int, cache:result_cache.ResultCache = None):
     """
     Combine weekly artist, release and song table plots into one figure.
     Parameters:
         conn (sqlite3.Connection): Databse connection.
         week (int): Week to get the charts
         year (int): Yearto get the charts
+        cache (result_cache.ResultCache): Cache of the chart queries
     """
     fig, axes = plt.subplots(3, 1, figsize=(10,10))
     [axe.axis('off') for axe in axes]
 
-    df= weekly_trend_artist(conn)
+    df= result_cache.call(cache, weekly_trend_artist, conn, year=year, week=week)
     plot_chart_table(ax=axes[0], subject="Artist", df=df, week=week, year=year)
     
-    df= weekly_trend_track(conn)
+    df= result_cache.call(cache, weekly_trend_track, conn, year=year, week=week)
     plot_chart_table(ax=axes[1], subject="Track", df=df, week=week, year=year)
     
-    df= weekly_trend_release(conn)
+    df= result_cache.call(cache, weekly_trend_release, conn, year=year, week=week)
     plot_chart_table(ax=axes[2], subject="Release", df=df, week=week, year=year)
 
 
 def get_table_statistics(conn:sqlite3.Connection, table_name:str, columns:set) -> pd.DataFrame:
     """
-    Combine (pandas) discribe with a null_value statistics based on a table and columns.
+    Combine (pandas) discribe with a null_value statistics based on a table and columns. The columns are profiled in one
+    chunked scan of the table, unique and the percentiles are estimated with sketches.
     Parameters:
         conn (sqlite3.Connection): Databse connection.
         table_name (str): Databse connection.
@@ -334,12 +243,7 @@ def get_table_statistics(conn:sqlite3.Connection, table_name:str, columns:set) -
     Returns:
         result (pd.DataFrame): Combination (pandas) discribe and null_value statistics.
     """
-    table_null_values= query_null_entry_statistic_on_columns( conn,table=table_name, columns=columns)
-    table_descr = query_entire_table(conn, table_name=table_name).describe(include='all')
-    table_descr = table_descr[columns].transpose()
-    table_descr = table_null_values.join(table_descr)
-    table_descr['table'] = table_name
-    return table_descr
+    return table_profile.profile_table(conn, table=table_name, columns=columns)
 
 
 def combine_table_statistics(conn:sqlite3.Connection) -> pd.DataFrame:
@@ -371,28 +275,29 @@ def combine_table_statistics(conn:sqlite3.Connection) -> pd.DataFrame:
 
 
 def main():
-        conn= sqlite3.connect(DB_PATH)
+        conn= queries.connect(DB_PATH)
+        cache = result_cache.ResultCache(CACHE_PATH, max_bytes=CACHE_MAX_BYTES)
 
         print("\n\n1. Overview total user, streams, artists, releases and tracks count")
-        print(query_total_entries_per_table(conn))
+        print(cache.call(query_total_entries_per_table, conn))
 
         print("\n\n2. Statistic over table columns based on pandas describe extended with a custom Null-value percentage column")
-        print(combine_table_statistics(conn))
+        print(cache.call(combine_table_statistics, conn))
         
         print("\n\n3. Displays active users, distributed over calendar weeks and weekdays for 2019 as barchart")
         print("See Figure1")
         year="2019"
-        df = query_active_users_over_weeks_and_weekdays_by_year(conn,year=year)
+        df = cache.call(query_active_users_over_weeks_and_weekdays_by_year, conn, year=year)
         plot_active_users_over_weeks_and_weekdays_by_year(df, year=year)
 
         print("\n\n4. Displays the average streams over weekdays by year as barchart.")
         print("See Figure2")
-        df = query_streams_over_weekdays(conn)
+        df = cache.call(query_streams_over_weekdays, conn)
         plot_streams_over_weekdays(df)
 
         print("\n\n5. Displays weekly Spotify Release, Artist and Track Charts as plotted tables")
         print("See Figure3")
-        combine_chart_table_plots(conn, week=12, year=2019)
+        combine_chart_table_plots(conn, week=12, year=2019, cache=cache)
 
         plt.show()        
         conn.close()
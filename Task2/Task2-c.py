@@ -1,9 +1,15 @@
-from pandasql import sqldf
 import pandas as pd
 import sqlite3
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Task1'))
+from libs.etl import queries, result_cache
 
 DB_PATH= r'database/spotify.db'
-pysqldf = lambda q: sqldf(q, locals())
+# Folder and size of the cached query results, they are reused until the next load changes the database.
+# The results are unpickled, so the folder must only be writable by trusted users
+CACHE_PATH= r'database/query_cache'
+CACHE_MAX_BYTES= 256 * 1024 * 1024
 
 #################################################################################################
 #                                                                                               #
@@ -11,40 +17,45 @@ pysqldf = lambda q: sqldf(q, locals())
 #                                                                                               #
 #################################################################################################
 
-def query_most_active_user(conn:sqlite3.Connection, top_n: str = 10) -> pd.DataFrame:
+def query_most_active_user(conn:sqlite3.Connection, top_n: str = 10, start_date:str = None, end_date:str = None) -> pd.DataFrame:
     """
     Reveals the most active users.
     Parameters:
         conn (sqlite3.Connection): Databse connection
         top_n (str): Specifies the number of top active users to be displayed in the output.
+        start_date (str): Only count streams from this date on. Format YYYY-MM-DD.
+        end_date (str): Only count streams up to this date. Format YYYY-MM-DD.
     Returns:
         (pd.DataFrame): Top n active users ordered by rank
     """
-    active_user_ranking = pd.read_sql_query("""
-            SELECT      user_name, DENSE_RANK() OVER(ORDER BY COUNT(1) DESC) as rank
-            FROM        stream
-            GROUP BY    user_name;""", conn)
-    
-    return sqldf(f"""
-            SELECT rank, user_name
-            FROM active_user_ranking
-            WHERE rank <= {top_n};""")
+    return queries.most_active_users(conn, top_n=top_n, start_date=start_date, end_date=end_date)
 
 
-def query_number_of_active_users_by_date(conn:sqlite3.Connection, date: str) -> pd.DataFrame:
+def query_number_of_active_users_by_date(conn:sqlite3.Connection, date: str, exact:bool = False) -> pd.DataFrame:
     """
     Reveals the number of users that where active at a given date.
     Parameters:
         conn (sqlite3.Connection): Databse connection
         date (str): Date you wish to get the number of active users from. Format YYYY-MM-DD.
+        exact (bool): Count the users exactly instead of reading the user sketch of the date
+    Returns:
+        (pd.DataFrame): Number of active users.
+    """
+    return query_number_of_active_users_between_dates(conn, start_date=date, end_date=date, exact=exact)
+
+
+def query_number_of_active_users_between_dates(conn:sqlite3.Connection, start_date: str, end_date: str, exact:bool = False) -> pd.DataFrame:
+    """
+    Reveals the number of users that where active in a period, e.g. a week or a month.
+    Parameters:
+        conn (sqlite3.Connection): Databse connection
+        start_date (str): First date of the period. Format YYYY-MM-DD.
+        end_date (str): Last date of the period. Format YYYY-MM-DD.
+        exact (bool): Count the users exactly instead of merging the user sketches of the dates
     Returns:
         (pd.DataFrame): Number of active users.
     """
-    return pd.read_sql_query(f"""
-            SELECT  COUNT( DISTINCT user_name) as active_users
-            FROM    stream lf 
-                        INNER JOIN time t ON lf.timestamp_unix_id == t.timestamp_unix_id
-            WHERE   date == '{date}';""", conn)
+    return queries.active_users(conn, start_date=start_date, end_date=end_date, exact=exact)
     
 
 def query_first_songs_users_listened_to(conn:sqlite3.Connection) -> pd.DataFrame:
@@ -56,13 +67,7 @@ def query_first_songs_users_listened_to(conn:sqlite3.Connection) -> pd.DataFrame
         (pd.DataFrame): First songs, users listened to, incl utc timestamp. 
                         Ordered by user_name and timestamp_utc 
     """
-    return pd.read_sql_query("""
-            SELECT DISTINCT user_name, track_name, MIN(timestamp_utc) AS listend_at
-            FROM   stream lf 
-                        INNER JOIN track tr ON lf.track_msid = tr.track_msid
-                        INNER JOIN time t ON lf.timestamp_unix_id = t.timestamp_unix_id
-            GROUP BY user_name
-            ORDER  BY user_name, timestamp_utc;""", conn)
+    return queries.first_songs(conn)
 
 #################################################################################################
 #                                                                                               #
@@ -71,13 +76,16 @@ def query_first_songs_users_listened_to(conn:sqlite3.Connection) -> pd.DataFrame
 #################################################################################################
 
 def main():
-        conn= sqlite3.connect(DB_PATH)
+        conn= queries.connect(DB_PATH)
+        cache = result_cache.ResultCache(CACHE_PATH, max_bytes=CACHE_MAX_BYTES)
         print("\n\n1. Who are the 10 most active users")
-        print(query_most_active_user(conn=conn, top_n=10))
+        print(cache.call(query_most_active_user, conn, top_n=10))
         print("\n\n2. How many users were active on the 1st of March 2019?")
-        print(query_number_of_active_users_by_date(conn=conn, date="2019-03-01"))
+        print(cache.call(query_number_of_active_users_by_date, conn, date="2019-03-01"))
+        print("\n\n   And in March 2019?")
+        print(cache.call(query_number_of_active_users_between_dates, conn, start_date="2019-03-01", end_date="2019-03-31"))
         print("\n\n3. For every User, what was the first Song they listened to?")
-        print(query_first_songs_users_listened_to(conn=conn))
+        print(cache.call(query_first_songs_users_listened_to, conn))
         conn.close()
        
 
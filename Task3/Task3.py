@@ -1,11 +1,17 @@
 from matplotlib import pyplot as plt
-from pandasql import sqldf
 import pandas as pd
 import sqlite3
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Task1'))
+from libs.etl import queries, result_cache
 
 
 DB_PATH= r'database/spotify.db'
-pysqldf = lambda q: sqldf(q, locals())
+# Folder and size of the cached query results, they are reused until the next load changes the database.
+# The results are unpickled, so the folder must only be writable by trusted users
+CACHE_PATH= r'database/query_cache'
+CACHE_MAX_BYTES= 256 * 1024 * 1024
 
 #################################################################################################
 #                                                                                               #
@@ -14,32 +20,16 @@ pysqldf = lambda q: sqldf(q, locals())
 #################################################################################################
 
 
-def query_weekly_trend_of_streams_and_user(conn:sqlite3.Connection) -> pd.DataFrame:
+def query_weekly_trend_of_streams_and_user(conn:sqlite3.Connection, exact:bool = False) -> pd.DataFrame:
     """
     Queries weekly active user, streams, and average streams per user as well as the percentage change from previous week.
     Parameters:
         conn (sqlite3.Connection): Databse connection
+        exact (bool): Count the weekly users exactly instead of merging the daily user sketches
     Returns:
         result (pd.DataFrame): A dataframe with the results.
     """
-    weekly_streams_and_user_table = pd.read_sql_query("""
-	        SELECT    year, week,
-                      COUNT(DISTINCT user_name) AS weekly_active_user,
-                      LAG(COUNT(DISTINCT user_name)) OVER ( ORDER BY year, week) AS active_user_previous_week,
-                      COUNT(1) AS weekly_streams,
-                      LAG(COUNT(1)) OVER ( ORDER BY year, week) AS streams_previous_week
-            FROM      stream lf INNER JOIN time t ON lf.timestamp_unix_id == t.timestamp_unix_id
-            GROUP BY  year, week""", conn)
-
-    return sqldf("""
-            SELECT    year, week, weekly_active_user, weekly_streams, (weekly_streams /  weekly_active_user)  AS weekly_avg_streams_user,
-                      printf("%.2f" , 100.0*(weekly_active_user - active_user_previous_week) / active_user_previous_week ) AS active_user_previous_week_trend,
-                      printf("%.2f" , 100.0*(weekly_streams - streams_previous_week)  / streams_previous_week ) AS streams_previous_week_trend,
-                      printf("%.2f" , 100.0*((weekly_streams /  weekly_active_user) - LAG((weekly_streams /  weekly_active_user) ) OVER ( ORDER BY year, week)) 
-                                 / LAG((weekly_streams /  weekly_active_user) ) OVER ( ORDER BY year, week) ) AS avg_streams_user_previous_week_trend
-            FROM      weekly_streams_and_user_table
-            GROUP BY  year, week
-            ORDER BY  year DESC, week DESC""")    
+    return queries.weekly_streams_and_users(conn, exact=exact)
 
 
 #################################################################################################
@@ -140,8 +130,9 @@ def plot_line_chart_weekly_streams(df:pd.DataFrame, ax:plt.axes ):
 #################################################################################################
 
 def main():
-        conn= sqlite3.connect(DB_PATH)
-        df = query_weekly_trend_of_streams_and_user(conn)
+        conn= queries.connect(DB_PATH)
+        cache = result_cache.ResultCache(CACHE_PATH, max_bytes=CACHE_MAX_BYTES)
+        df = cache.call(query_weekly_trend_of_streams_and_user, conn)
 
         print("\n\n1. Bar and table plot with the total number of weekly active user and the percent changes compared to prev. week")
         print("See Figure1")